@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.utils import timezone
 
 from child_health.models import Vaccine, VaccineDose, Child, Pregnancy, PastVaccination
 
@@ -17,11 +18,11 @@ class VaccineAdmin(admin.ModelAdmin):
 
     @admin.action(description='Activate selected vaccines')
     def activate(self, request, queryset):
-        queryset.update(is_active=True)
+        queryset.update(is_active=True, updated_at=timezone.now())
 
     @admin.action(description='Deactivate selected vaccines (back to draft)')
     def deactivate(self, request, queryset):
-        queryset.update(is_active=False)
+        queryset.update(is_active=False, updated_at=timezone.now())
 
 
 class PastVaccinationInline(admin.TabularInline):
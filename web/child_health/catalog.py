@@ -0,0 +1,96 @@
+import hashlib
+from collections.abc import Iterable
+from typing import Optional
+
+from django.db.models import Count, Max
+
+from child_health.models import Child, Vaccine, VaccineDose
+
+
+class VaccineCatalog:
+    """
+    Immutable snapshot of the active vaccine doses. Doses are sorted by (week_age, vaccine_id, id) and grouped,
+    per child gender, into the doses given in the same week, so building a child's vaccination events needs no
+    queries.
+    """
+    __slots__ = ['version', 'doses', 'week_ages', '_dose_groups_by_gender']
+
+    def __init__(self, version: str, doses: Iterable[VaccineDose]):
+        self.version = version
+        self.doses = tuple(sorted(doses, key=get_dose_sort_key))
+        self.week_ages = tuple(sorted({dose.week_age for dose in self.doses}))
+        self._dose_groups_by_gender = {
+            gender: group_doses_by_week_age(dose for dose in self.doses if is_vaccine_applicable(dose.vaccine, gender))
+            for gender in Child.ChildGender.values
+        }
+
+    def get_dose_groups(self, gender: str) -> tuple[tuple[VaccineDose, ...], ...]:
+        dose_groups = self._dose_groups_by_gender.get(gender)
+        assert dose_groups is not None, f"Unknown gender {gender}"
+        return dose_groups
+
+
+def get_dose_sort_key(dose: VaccineDose):
+    return (dose.week_age, dose.vaccine_id, dose.id,)
+
+
+def is_vaccine_applicable(vaccine: Vaccine, gender: str) -> bool:
+    if gender == Child.ChildGender.MALE:
+        return vaccine.applicable_for_male
+    if gender == Child.ChildGender.FEMALE:
+        return vaccine.applicable_for_female
+    return False
+
+
+def group_doses_by_week_age(doses: Iterable[VaccineDose]) -> tuple[tuple[VaccineDose, ...], ...]:
+    groups = []
+    for dose in doses:
+        if len(groups) > 0 and groups[-1][0].week_age == dose.week_age:
+            groups[-1].append(dose)
+        else:
+            groups.append([dose])
+    return tuple(tuple(group) for group in groups)
+
+
+def get_vaccine_catalog_version() -> str:
+    """
+    Token that changes whenever a Vaccine or VaccineDose is created, edited or deleted, computed with one
+    aggregate query. Every process derives the same token from the same data.
+    """
+    fingerprint = Vaccine.objects.aggregate(
+        vaccine_count=Count('id', distinct=True),
+        max_vaccine_id=Max('id'),
+        max_vaccine_updated_at=Max('updated_at'),
+        dose_count=Count('vaccinedose'),
+        max_dose_id=Max('vaccinedose__id'),
+        max_dose_updated_at=Max('vaccinedose__updated_at'),
+    )
+    return hashlib.sha1(repr(sorted(fingerprint.items())).encode()).hexdigest()[:16]
+
+
+def load_vaccine_catalog(version: str) -> VaccineCatalog:
+    doses = VaccineDose.objects.filter(vaccine__is_active=True).select_related('vaccine')
+    return VaccineCatalog(version, doses)
+
+
+_vaccine_catalog: Optional[VaccineCatalog] = None
+
+
+def get_vaccine_catalog(version: str = None) -> VaccineCatalog:
+    """
+    The process-wide vaccine catalog, reloaded when its version token no longer matches the database, which
+    covers edits made by other processes. Pass the version when the caller has computed it already.
+    """
+    global _vaccine_catalog
+    if version is None:
+        version = get_vaccine_catalog_version()
+    catalog = _vaccine_catalog
+    if catalog is None or catalog.version != version:
+        catalog = load_vaccine_catalog(version)
+        _vaccine_catalog = catalog
+    return catalog
+
+
+def invalidate_vaccine_catalog():
+    global _vaccine_catalog
+    _vaccine_catalog = None
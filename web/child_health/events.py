@@ -1,20 +1,35 @@
 import datetime
 import heapq
-from collections.abc import Iterator
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
 from math import ceil, floor
-from typing import Dict, List
+from typing import Dict, List, NamedTuple, Optional, Union
 
 from django.contrib.auth.models import User
+from django.db.models import Q, QuerySet
 from django.utils import timezone
 
+from child_health.catalog import VaccineCatalog, get_vaccine_catalog
 from child_health.models import Child, Pregnancy, Vaccine, VaccineDose
 from events.constants import CalendarEventType
 from events.protocols import CalendarEventProtocol
+from hera.sharding import Shard, filter_shard
+from hera.utils import merge_date_ranges
 
 
 PRENATAL_CHECKUP_WEEKS = [10, 24, 34, 38]
 MAX_PREGNANCY_WEEKS = 42
 
+# Bounds of every checkup date generate_prenatal_checkup_events can produce, relative to the pregnancy.
+# Checkups are moved back to Monday, hence the 6 days of slack. Late declarations get one checkup
+# 1 to 13 days after the pregnancy is created, which is within 6 days of its estimated delivery date.
+EARLIEST_PRENATAL_CHECKUP_AFTER_START = datetime.timedelta(weeks=PRENATAL_CHECKUP_WEEKS[0], days=-6)
+LATEST_PRENATAL_CHECKUP_AFTER_START = datetime.timedelta(weeks=MAX_PREGNANCY_WEEKS + 1)
+LATE_DECLARATION_CHECKUP_DAYS_FROM_DELIVERY = datetime.timedelta(days=6)
+
+# Every vaccination event key starts with this, see VaccinationEvent.get_event_key
+VACCINATION_EVENT_KEY_PREFIX = 'vaccination/'
+
 
 def generate_prenatal_checkup_weeks(pregnancy: Pregnancy) -> Iterator[int]:
     start_date = pregnancy.estimated_start_date
@@ -52,6 +67,7 @@ def generate_prenatal_checkup_weeks(pregnancy: Pregnancy) -> Iterator[int]:
 
 class PrenatalCheckupEvent(CalendarEventProtocol):
     __slots__ = ['pregnancy', 'date', 'weeks_pregnant']
+    event_type = CalendarEventType.PRENATAL_CHECKUP.value
 
     pregnancy: Pregnancy
     date: datetime.date
@@ -62,16 +78,24 @@ class PrenatalCheckupEvent(CalendarEventProtocol):
         self.date = date
         self.weeks_pregnant = weeks_pregnant
 
+    @property
+    def subject(self) -> Pregnancy:
+        return self.pregnancy
+
     def to_dictionary(self):
         return {
             'pregnancy_id': self.pregnancy.id,
             'date': self.date,
             'weeks_pregnant': self.weeks_pregnant,
-            'event_type': CalendarEventType.PRENATAL_CHECKUP.value,
+            'event_type': self.event_type,
         }
 
+    @staticmethod
+    def get_event_key_prefix(pregnancy: Pregnancy) -> str:
+        return f"prenatal-checkup/pregnancy-{pregnancy.id}/"
+
     def get_event_key(self):
-        return f"prenatal-checkup/pregnancy-{self.pregnancy.id}/week-{self.weeks_pregnant}"
+        return f"{self.get_event_key_prefix(self.pregnancy)}week-{self.weeks_pregnant}"
 
 
 def generate_prenatal_checkup_events(pregnancy: Pregnancy) -> Iterator[PrenatalCheckupEvent]:
@@ -90,6 +114,7 @@ def generate_prenatal_checkup_events(pregnancy: Pregnancy) -> Iterator[PrenatalC
 
 class VaccinationEvent(CalendarEventProtocol):
     __slots__ = ['date', 'doses', 'child']
+    event_type = CalendarEventType.VACCINATION.value
 
     date: datetime.date
     doses: [VaccineDose]
@@ -104,6 +129,10 @@ class VaccinationEvent(CalendarEventProtocol):
     def week_age(self) -> int:
         return self.doses[0].week_age
 
+    @property
+    def subject(self) -> Child:
+        return self.child
+
     def to_dictionary(self):
         return {
             'event_key': self.get_event_key(),
@@ -111,58 +140,223 @@ class VaccinationEvent(CalendarEventProtocol):
             'week_age': self.week_age,
             'person_name': self.child.name,
             'vaccine_names': [dose.vaccine.friendly_name() for dose in self.doses],
-            'event_type': CalendarEventType.VACCINATION.value,
+            'event_type': self.event_type,
             'child_id': self.child.id,
             'dose_ids': [dose.id for dose in self.doses]
         }
 
+    @staticmethod
+    def get_event_key_prefix(child: Child) -> str:
+        return f"{VACCINATION_EVENT_KEY_PREFIX}child-{child.id}/"
+
     def get_event_key(self):
         dose_ids = ','.join([str(dose.id) for dose in self.doses])
-        return f"vaccination/child-{self.child.id}/doses-{dose_ids}"
-
-
-def generate_vaccination_events_for_child(child: Child) -> Iterator[VaccinationEvent]:
-    doses_query = VaccineDose.objects.filter(vaccine__is_active=True)
-    if child.gender == Child.ChildGender.MALE:
-        doses_query = doses_query.filter(vaccine__applicable_for_male=True)
-    elif child.gender == Child.ChildGender.FEMALE:
-        doses_query = doses_query.filter(vaccine__applicable_for_female=True)
-    else:
-        assert False, f"Unknown gender {child.gender}"
-    doses_query = doses_query.prefetch_related('vaccine')
-    doses_query = doses_query.order_by('week_age', 'vaccine_id', 'id')
-    current_event_doses = []
-    current_event_date = None
-    for dose in doses_query:
-        vaccination_date = child.date_of_birth + datetime.timedelta(weeks=dose.week_age)
-        if current_event_date is not None and vaccination_date != current_event_date:
-            yield VaccinationEvent(
-                date=current_event_date,
-                doses=current_event_doses,
-                child=child,
-            )
-            current_event_doses = []
-        current_event_doses.append(dose)
-        current_event_date = vaccination_date
-    if len(current_event_doses) > 0:
+        return f"{self.get_event_key_prefix(self.child)}doses-{dose_ids}"
+
+
+def get_subject_event_key_prefix(subject: Union[Pregnancy, Child]) -> str:
+    """
+    The prefix of the event keys of every calendar event of a pregnancy or child.
+    """
+    if isinstance(subject, Pregnancy):
+        return PrenatalCheckupEvent.get_event_key_prefix(subject)
+    return VaccinationEvent.get_event_key_prefix(subject)
+
+
+def generate_vaccination_events_for_child(child: Child, catalog: VaccineCatalog = None) -> \
+        Iterator[VaccinationEvent]:
+    if catalog is None:
+        catalog = get_vaccine_catalog()
+    for doses in catalog.get_dose_groups(child.gender):
         yield VaccinationEvent(
-            date=current_event_date,
-            doses=current_event_doses,
+            date=child.date_of_birth + datetime.timedelta(weeks=doses[0].week_age),
+            doses=list(doses),
             child=child,
         )
 
 
-
-def generate_calendar_events_for_user(user: User) -> Iterator[CalendarEventProtocol]:
+def get_prenatal_checkup_condition(date_ranges: Iterable[tuple[datetime.date, datetime.date]]) -> Q:
+    """
+    Matches the pregnancies that may have a prenatal checkup within one of `date_ranges`, using range lookups on
+    the indexed estimated_start_date and estimated_delivery_date.
+    """
+    condition = Q(pk__in=[])
+    for start_date, end_date in merge_date_ranges(date_ranges):
+        condition |= Q(
+            estimated_start_date__gte=start_date - LATEST_PRENATAL_CHECKUP_AFTER_START,
+            estimated_start_date__lte=end_date - EARLIEST_PRENATAL_CHECKUP_AFTER_START,
+        )
+        condition |= Q(
+            estimated_delivery_date__gte=start_date - LATE_DECLARATION_CHECKUP_DAYS_FROM_DELIVERY,
+            estimated_delivery_date__lte=end_date + LATE_DECLARATION_CHECKUP_DAYS_FROM_DELIVERY,
+        )
+    return condition
+
+
+def get_vaccination_condition(date_ranges: Iterable[tuple[datetime.date, datetime.date]],
+                              catalog: VaccineCatalog) -> Q:
+    """
+    Matches the children that may have a vaccination within one of `date_ranges`, by turning every active dose's
+    week age into a range lookup on the indexed date_of_birth.
+    """
+    date_ranges = list(date_ranges)
+    date_of_birth_ranges = [
+        (start_date - datetime.timedelta(weeks=week_age), end_date - datetime.timedelta(weeks=week_age))
+        for week_age in catalog.week_ages
+        for start_date, end_date in date_ranges
+    ]
+    condition = Q(pk__in=[])
+    for start_date, end_date in merge_date_ranges(date_of_birth_ranges):
+        condition |= Q(date_of_birth__gte=start_date, date_of_birth__lte=end_date)
+    return condition
+
+
+def filter_pregnancies_with_checkups_between(pregnancies: QuerySet,
+                                            date_ranges: Iterable[tuple[datetime.date, datetime.date]]) -> QuerySet:
+    """
+    Narrows `pregnancies` down to those that may have a prenatal checkup within one of `date_ranges`.
+    The result is a superset: callers still have to check the generated event dates.
+    """
+    return pregnancies.filter(get_prenatal_checkup_condition(date_ranges))
+
+
+def filter_children_with_vaccinations_between(children: QuerySet,
+                                              date_ranges: Iterable[tuple[datetime.date, datetime.date]],
+                                              catalog: VaccineCatalog = None) -> QuerySet:
+    """
+    Narrows `children` down to those that may have a vaccination within one of `date_ranges`.
+    The result is a superset: callers still have to check the generated event dates.
+    """
+    if catalog is None:
+        catalog = get_vaccine_catalog()
+    return children.filter(get_vaccination_condition(date_ranges, catalog))
+
+
+def generate_calendar_events_for_subjects(pregnancies: Iterable[Pregnancy], children: Iterable[Child],
+                                          catalog: VaccineCatalog = None, date_from: datetime.date = None,
+                                          date_to: datetime.date = None) -> Iterator[CalendarEventProtocol]:
+    """
+    Merges the events of every subject by date. With `date_from` and `date_to`, events outside that (inclusive)
+    range are left out and the merge stops at the first event past `date_to`.
+    """
     def get_event_date(event):
         return event.date
 
-    pregnancies = user.pregnancy_set.all()
+    if catalog is None:
+        catalog = get_vaccine_catalog()
     event_generators = []
     for pregnancy in pregnancies:
         event_generators.append(generate_prenatal_checkup_events(pregnancy))
-    children = user.child_set.all()
     for child in children:
-        event_generators.append(generate_vaccination_events_for_child(child))
+        event_generators.append(generate_vaccination_events_for_child(child, catalog))
     for event in heapq.merge(*event_generators, key=get_event_date):
+        if date_to is not None and event.date > date_to:
+            break
+        if date_from is not None and event.date < date_from:
+            continue
         yield event
+
+
+def generate_calendar_events_for_user(user: User, date_from: datetime.date = None, date_to: datetime.date = None,
+                                      child_id: int = None, pregnancy_id: int = None) \
+        -> Iterator[CalendarEventProtocol]:
+    """
+    The user's calendar, optionally limited to an inclusive date range and to the given child and/or pregnancy.
+    Subjects that cannot have an event within a bounded range are not loaded at all.
+    """
+    catalog = get_vaccine_catalog()
+    pregnancies = user.pregnancy_set.all()
+    children = user.child_set.all()
+    if child_id is not None or pregnancy_id is not None:
+        pregnancies = pregnancies.filter(pk=pregnancy_id) if pregnancy_id is not None else pregnancies.none()
+        children = children.filter(pk=child_id) if child_id is not None else children.none()
+    if date_from is not None and date_to is not None:
+        pregnancies = filter_pregnancies_with_checkups_between(pregnancies, [(date_from, date_to)])
+        children = filter_children_with_vaccinations_between(children, [(date_from, date_to)], catalog)
+    return generate_calendar_events_for_subjects(pregnancies, children, catalog, date_from, date_to)
+
+
+def has_vaccine_catalog_changed_since(since: datetime.datetime) -> bool:
+    return Vaccine.objects.filter(updated_at__gt=since).exists() or \
+        VaccineDose.objects.filter(updated_at__gt=since).exists()
+
+
+class CalendarSelection(NamedTuple):
+    """
+    The pregnancies and children that may have an event of a given type within that type's date ranges.
+    With `changed_since`, only those created or edited after that instant. With `horizon`, only those of users whose
+    materialized calendar does not end before that date; users without one yet, or with one built from another
+    version of the vaccine catalog, whose last event date may have changed since, are kept.
+    """
+    date_ranges_by_event_type: Dict[str, List[tuple[datetime.date, datetime.date]]]
+    changed_since: Optional[datetime.datetime] = None
+    horizon: Optional[datetime.date] = None
+
+    def get_subject_filter(self, catalog: VaccineCatalog) -> Q:
+        subject_filter = Q(user__is_active=True)
+        if self.changed_since is not None:
+            subject_filter &= Q(updated_at__gt=self.changed_since)
+        if self.horizon is not None:
+            subject_filter &= Q(user__usercalendar__isnull=True) | \
+                ~Q(user__usercalendar__vaccine_catalog_version=catalog.version) | \
+                Q(user__usercalendar__last_event_date__gte=self.horizon)
+        return subject_filter
+
+
+def generate_calendar_events_between(date_ranges_by_event_type: Dict[str, List[tuple[datetime.date, datetime.date]]],
+                                     shard: Shard = None, changed_since: datetime.datetime = None,
+                                     horizon: datetime.date = None) \
+        -> Iterator[tuple[User, Iterator[CalendarEventProtocol]]]:
+    """
+    Set-based counterpart of generate_calendar_events_for_user: only the pregnancies and children that may have
+    an event of a given type within that type's date ranges are loaded, grouped by their (active) user.
+    Yields (user, calendar events of the selected subjects) pairs. Events outside the date ranges are still
+    included, so callers must keep checking their own windows. With `shard`, only that shard's users are loaded.
+    See CalendarSelection for `changed_since` and `horizon`.
+    """
+    return generate_calendar_events_for_selections(
+        [CalendarSelection(date_ranges_by_event_type, changed_since, horizon)],
+        shard=shard,
+    )
+
+
+def generate_calendar_events_for_selections(selections: Iterable[CalendarSelection], shard: Shard = None) \
+        -> Iterator[tuple[User, Iterator[CalendarEventProtocol]]]:
+    """
+    Like generate_calendar_events_between, for the pregnancies and children of any of `selections`. Subjects are
+    loaded with one query per subject type however many selections there are, and each user is yielded once.
+    """
+    catalog = get_vaccine_catalog()
+    pregnancy_condition = None
+    child_condition = None
+    for selection in selections:
+        subject_filter = selection.get_subject_filter(catalog)
+        prenatal_checkup_ranges = selection.date_ranges_by_event_type.get(CalendarEventType.PRENATAL_CHECKUP.value, [])
+        if len(prenatal_checkup_ranges) > 0:
+            condition = subject_filter & get_prenatal_checkup_condition(prenatal_checkup_ranges)
+            pregnancy_condition = condition if pregnancy_condition is None else pregnancy_condition | condition
+        vaccination_ranges = selection.date_ranges_by_event_type.get(CalendarEventType.VACCINATION.value, [])
+        if len(vaccination_ranges) > 0:
+            condition = subject_filter & get_vaccination_condition(vaccination_ranges, catalog)
+            child_condition = condition if child_condition is None else child_condition | condition
+    pregnancies_by_user = defaultdict(list)
+    children_by_user = defaultdict(list)
+    users = {}
+    if pregnancy_condition is not None:
+        pregnancies = filter_shard(Pregnancy.objects.filter(pregnancy_condition), 'user_id', shard) \
+            .select_related('user__userprofile')
+        for pregnancy in pregnancies:
+            users[pregnancy.user_id] = pregnancy.user
+            pregnancies_by_user[pregnancy.user_id].append(pregnancy)
+    if child_condition is not None:
+        children = filter_shard(Child.objects.filter(child_condition), 'user_id', shard) \
+            .select_related('user__userprofile')
+        for child in children:
+            users[child.user_id] = child.user
+            children_by_user[child.user_id].append(child)
+    for user_id in sorted(users):
+        yield users[user_id], generate_calendar_events_for_subjects(
+            pregnancies_by_user[user_id],
+            children_by_user[user_id],
+            catalog,
+        )
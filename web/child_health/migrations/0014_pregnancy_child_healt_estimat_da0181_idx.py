@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-17 01:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('child_health', '0013_alter_pastvaccination_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pregnancy',
+            index=models.Index(fields=['estimated_start_date'], name='child_healt_estimat_da0181_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.4 on 2026-10-17 02:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('child_health', '0014_pregnancy_child_healt_estimat_da0181_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='child',
+            name='child_healt_user_id_dbedfb_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='pregnancy',
+            name='child_healt_user_id_2424d4_idx',
+        ),
+        migrations.AddIndex(
+            model_name='child',
+            index=models.Index(fields=['user', '-id'], name='child_healt_user_id_c9b9c1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pregnancy',
+            index=models.Index(fields=['user', '-id'], name='child_healt_user_id_7e0aa2_idx'),
+        ),
+    ]
@@ -41,7 +41,8 @@ class Pregnancy(models.Model):
     class Meta:
         verbose_name_plural = 'Pregnancies'
         indexes = [
-            models.Index(fields=['user']),
+            models.Index(fields=['user', '-id']),
+            models.Index(fields=['estimated_start_date']),
             models.Index(fields=['estimated_delivery_date']),
         ]
 
@@ -71,7 +72,7 @@ class Child(models.Model):
     class Meta:
         verbose_name_plural = 'Children'
         indexes = [
-            models.Index(fields=['user']),
+            models.Index(fields=['user', '-id']),
             models.Index(fields=['date_of_birth']),
         ]
 
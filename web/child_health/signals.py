@@ -1,9 +1,10 @@
-from django.db.models.signals import pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
-from child_health.models import Pregnancy
+from child_health.catalog import invalidate_vaccine_catalog
+from child_health.models import Pregnancy, Vaccine, VaccineDose
 from child_health.utils import *
 
 
@@ -21,3 +22,11 @@ def fill_pregnancy_delivery_date(sender, instance: Pregnancy, **kwargs):
     else:
         instance.estimated_start_date = calculate_start_date_by_date_of_last_menstrual_period(instance.declared_date_of_last_menstrual_period)
         instance.estimated_delivery_date = calculate_delivery_date_by_date_of_last_menstrual_period(instance.declared_date_of_last_menstrual_period)
+
+
+@receiver(post_save, sender=Vaccine)
+@receiver(post_delete, sender=Vaccine)
+@receiver(post_save, sender=VaccineDose)
+@receiver(post_delete, sender=VaccineDose)
+def invalidate_vaccine_catalog_on_change(sender, **kwargs):
+    invalidate_vaccine_catalog()
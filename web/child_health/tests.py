@@ -30,6 +30,17 @@ class PregnancyViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data), 0)
 
+    def test_list_pregnancy_should_page_by_cursor_when_page_size_given(self):
+        pregnancies = [
+            Pregnancy.objects.create(user=self.user, declared_pregnancy_week=week, declared_number_of_prenatal_visits=0)
+            for week in range(1, 4)
+        ]
+        response = self.client.get('/pregnancies/', {'page_size': 2})
+        self.assertEqual([pregnancies[2].id, pregnancies[1].id], [p['id'] for p in response.data['results']])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([pregnancies[0].id], [p['id'] for p in response.data['results']])
+        self.assertIsNone(response.data['next'])
+
     def test_create_pregnancy_with_pregnancy_week_should_succeed(self):
         response = self.client.post('/pregnancies/', {
             'declared_pregnancy_week': 2
@@ -205,6 +216,21 @@ class ChildrenViewTests(TestCase):
         self.assertEqual(response.data['gender'], 'FEMALE')
         self.assertEqual(response.data['past_vaccinations'], [2])
 
+    def test_list_children_should_return_not_modified_until_past_vaccinations_change(self):
+        child = Child.objects.create(
+            name='Child Name',
+            date_of_birth='2020-01-01',
+            gender=Child.ChildGender.FEMALE,
+            user=self.user,
+        )
+        etag = self.client.get('/children/')['ETag']
+        response = self.client.get('/children/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        child.past_vaccinations.add(1)
+        response = self.client.get('/children/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['past_vaccinations'], [1])
+
 
 class VaccinesViewTests(TestCase):
     def setUp(self) -> None:
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import date, datetime
 from unittest.mock import patch
 
 import django.utils.timezone
@@ -6,9 +6,12 @@ import pytz
 from django.contrib.auth.models import User
 from django.test import TestCase
 
+from child_health.catalog import get_vaccine_catalog
 from child_health.models import Pregnancy, Child, Vaccine
-from child_health.events import VaccinationEvent, generate_calendar_events_for_user, generate_prenatal_checkup_weeks, \
-    generate_vaccination_events_for_child
+from events.constants import CalendarEventType
+from child_health.events import VaccinationEvent, filter_children_with_vaccinations_between, \
+    filter_pregnancies_with_checkups_between, generate_calendar_events_for_user, generate_prenatal_checkup_events, \
+    generate_prenatal_checkup_weeks, generate_vaccination_events_for_child
 
 
 class PregnancyEventGeneratorTests(TestCase):
@@ -221,6 +224,43 @@ class ChildVaccinationEventGeneratorTests(TestCase):
         self.female_vaccine.save()
         self.assertEqual([], list(generate_vaccination_events_for_child(self.male_child)))
 
+    def test_vaccine_catalog_groups_same_week_doses_in_order(self):
+        self.universal_vaccine.is_active = True
+        self.universal_vaccine.save()
+        self.male_vaccine.is_active = True
+        self.male_vaccine.save()
+
+        dose_groups = get_vaccine_catalog().get_dose_groups(Child.ChildGender.MALE)
+
+        self.assertEqual([1, 3, 100], [doses[0].week_age for doses in dose_groups])
+        self.assertEqual([self.universal_vaccine.id, self.male_vaccine.id], [dose.vaccine_id for dose in dose_groups[0]])
+
+    def test_vaccination_events_from_catalog_need_no_queries(self):
+        self.male_vaccine.is_active = True
+        self.male_vaccine.save()
+        catalog = get_vaccine_catalog()
+
+        with self.assertNumQueries(0):
+            result = list(generate_vaccination_events_for_child(self.male_child, catalog))
+            event_dicts = [event.to_dictionary() for event in result]
+
+        self.assertEqual(2, len(event_dicts))
+
+    def test_vaccine_catalog_is_reloaded_after_dose_is_saved(self):
+        self.male_vaccine.is_active = True
+        self.male_vaccine.save()
+        catalog = get_vaccine_catalog()
+        self.assertIs(catalog, get_vaccine_catalog())
+
+        self.male_vaccine.vaccinedose_set.create(
+            name="third dose",
+            week_age=5,
+        )
+
+        reloaded_catalog = get_vaccine_catalog()
+        self.assertNotEqual(catalog.version, reloaded_catalog.version)
+        self.assertEqual(3, len(list(generate_vaccination_events_for_child(self.male_child, reloaded_catalog))))
+
 
 class ChildHealthGenerateCalendarEventTests(TestCase):
     def setUp(self) -> None:
@@ -263,3 +303,100 @@ class ChildHealthGenerateCalendarEventTests(TestCase):
         events = list(generate_calendar_events_for_user(self.user))
         self.assertEqual(len(events), 3)
         self.assertTrue(all(events[i].date < events[i+1].date for i in range(len(events) - 1)))
+
+    def test_calendar_event_generator_date_range(self):
+        all_events = list(generate_calendar_events_for_user(self.user))
+        date_from, date_to = all_events[1].date, all_events[1].date
+        events = list(generate_calendar_events_for_user(self.user, date_from=date_from, date_to=date_to))
+        self.assertEqual([all_events[1].get_event_key()], [e.get_event_key() for e in events])
+
+    def test_calendar_event_generator_stops_past_date_to(self):
+        consumed = []
+
+        def generate_vaccination_events(child, catalog):
+            for event in generate_vaccination_events_for_child(child, catalog):
+                consumed.append(event)
+                yield event
+
+        first_dose_date = self.male_child.date_of_birth
+        with patch('child_health.events.generate_vaccination_events_for_child', generate_vaccination_events):
+            events = list(generate_calendar_events_for_user(self.user, date_to=first_dose_date,
+                                                            child_id=self.male_child.id))
+        self.assertEqual([first_dose_date], [e.date for e in events])
+        # The second dose is read to find out the merge is past date_to, but nothing after it
+        self.assertEqual(2, len(consumed))
+
+    def test_calendar_event_generator_subject_filter(self):
+        events = list(generate_calendar_events_for_user(self.user, pregnancy_id=self.pregnancy.id))
+        self.assertEqual([CalendarEventType.PRENATAL_CHECKUP.value], [e.to_dictionary()['event_type'] for e in events])
+        events = list(generate_calendar_events_for_user(self.user, child_id=self.male_child.id))
+        self.assertEqual(2, len(events))
+        self.assertTrue(all(e.child == self.male_child for e in events))
+
+
+class CalendarSubjectRangeFilterTests(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(
+            username='username',
+        )
+        self.mock_now = datetime(2021, 6, 1, 0, 0, 0, tzinfo=pytz.UTC)
+        timezone_now_patcher = patch.object(django.utils.timezone, 'now', return_value=self.mock_now)
+        timezone_now_patcher.start()
+        self.addCleanup(timezone_now_patcher.stop)
+        self.vaccine = Vaccine.objects.create(
+            name='vaccine',
+            is_active=True,
+        )
+        self.vaccine.vaccinedose_set.create(name="first dose", week_age=0)
+        self.vaccine.vaccinedose_set.create(name="second dose", week_age=52)
+
+    def test_every_prenatal_checkup_date_selects_its_pregnancy(self):
+        pregnancies = [
+            Pregnancy.objects.create(
+                user=self.user,
+                declared_pregnancy_week=week,
+                declared_number_of_prenatal_visits=0,
+            )
+            for week in [1, 12, 24, 38, 42]
+        ]
+        pregnancies.append(Pregnancy.objects.create(
+            user=self.user,
+            declared_date_of_last_menstrual_period=date(2019, 1, 1),
+            declared_number_of_prenatal_visits=0,
+        ))
+        for pregnancy in pregnancies:
+            pregnancy.refresh_from_db()
+            for event in generate_prenatal_checkup_events(pregnancy):
+                selected = filter_pregnancies_with_checkups_between(Pregnancy.objects.all(), [(event.date, event.date)])
+                self.assertIn(pregnancy, selected)
+
+    def test_pregnancy_without_checkup_in_range_is_not_selected(self):
+        Pregnancy.objects.create(
+            user=self.user,
+            declared_pregnancy_week=1,
+            declared_number_of_prenatal_visits=0,
+        )
+        date_range = (date(2023, 1, 1), date(2023, 1, 31))
+        self.assertFalse(filter_pregnancies_with_checkups_between(Pregnancy.objects.all(), [date_range]).exists())
+
+    def test_every_vaccination_date_selects_its_child(self):
+        child = Child.objects.create(
+            user=self.user,
+            name='child',
+            date_of_birth='2021-01-01',
+            gender=Child.ChildGender.MALE,
+        )
+        child.refresh_from_db()
+        for event in generate_vaccination_events_for_child(child):
+            selected = filter_children_with_vaccinations_between(Child.objects.all(), [(event.date, event.date)])
+            self.assertEqual([child], list(selected))
+
+    def test_child_without_vaccination_in_range_is_not_selected(self):
+        Child.objects.create(
+            user=self.user,
+            name='child',
+            date_of_birth='2021-01-01',
+            gender=Child.ChildGender.MALE,
+        )
+        date_range = (date(2021, 6, 1), date(2021, 6, 30))
+        self.assertFalse(filter_children_with_vaccinations_between(Child.objects.all(), [date_range]).exists())
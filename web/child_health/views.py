@@ -1,3 +1,4 @@
+from django.db.models import Count, Max
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
@@ -9,18 +10,30 @@ from rest_framework.viewsets import GenericViewSet, ModelViewSet
 from child_health.filters import PregnancyFilter
 from child_health.models import Child, Pregnancy, Vaccine
 from child_health.serializers import ChildSerializer, PregnancySerializer, VaccineSerializer
+from hera.conditional import ConditionalGetMixin
+from hera.pagination import UserKeysetPagination
 
 
-class PregnancyViewSet(ModelViewSet):
+class PregnancyViewSet(ConditionalGetMixin, ModelViewSet):
     queryset = Pregnancy.objects.all()
     serializer_class = PregnancySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = UserKeysetPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = PregnancyFilter
 
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user)
 
+    def get_version_parts(self, request):
+        version = Pregnancy.objects.filter(user=request.user).aggregate(
+            count=Count('id'),
+            max_id=Max('id'),
+            max_updated_at=Max('updated_at'),
+        )
+        # The active pregnancy depends on the date
+        return [*version.values(), timezone.now().date()]
+
     @action(detail=False, methods=['get'])
     def active(self, request):
         active_pregnancy = Pregnancy.objects.get_active_pregnancy_for_user(request.user)
@@ -30,14 +43,25 @@ class PregnancyViewSet(ModelViewSet):
         return Response(status=404)
 
 
-class ChildrenViewSet(ModelViewSet):
+class ChildrenViewSet(ConditionalGetMixin, ModelViewSet):
     queryset = Child.objects.all()
     serializer_class = ChildSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = UserKeysetPagination
 
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user)
 
+    def get_version_parts(self, request):
+        version = Child.objects.filter(user=request.user).aggregate(
+            count=Count('id', distinct=True),
+            max_id=Max('id'),
+            max_updated_at=Max('updated_at'),
+            past_vaccination_count=Count('pastvaccination'),
+            max_past_vaccination_id=Max('pastvaccination__id'),
+        )
+        return version.values()
+
 
 class VaccinesViewSet(ListModelMixin, GenericViewSet):
     queryset = Vaccine.objects.all()
@@ -2,8 +2,9 @@ import csv
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from django.db.models import Count
+from django.db.models import Count, F, Q
 from django.contrib.admin.views.decorators import staff_member_required
+from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.http import HttpResponse
 from django.urls import path
@@ -174,10 +175,24 @@ class NotificationFilter(admin.SimpleListFilter):
 
     def queryset(self, request, queryset):
         value = self.value()
+        # An event is read when marked one by one or when its user's read watermark is past it, which only covers
+        # the events that were available when the watermark moved
+        last_read_id = F('notificationreadstate__last_read_notification_event_id')
+        last_read_at = F('notificationreadstate__last_read_at')
         if value == 'yes':
-            return queryset.filter(notificationevent__read_at__isnull=False).distinct()
+            return queryset.filter(
+                Q(notificationevent__read_at__isnull=False) | Q(
+                    notificationevent__id__lte=last_read_id,
+                    notificationevent__notification_available_at__lte=last_read_at,
+                )
+            ).distinct()
         elif value == 'no':
-            return queryset.filter(notificationevent__read_at__isnull=True).distinct()
+            return queryset.filter(
+                Q(notificationreadstate__isnull=True) | Q(notificationevent__id__gt=last_read_id) |
+                Q(notificationevent__notification_available_at__gt=last_read_at),
+                notificationevent__read_at__isnull=True,
+                notificationevent__notification_available_at__lte=timezone.now(),
+            ).distinct()
 
 
 class NameFilter(admin.SimpleListFilter):
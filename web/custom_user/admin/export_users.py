@@ -110,7 +110,7 @@ def users_to_survey_responses_array(users, max_survey):
 
 def notifications_to_array(notifications):
     def _notification_to_row(notification):
-        if notification and notification.template:
+        if notification and notification.push_title is not None:
             return [notification.push_title, notification.push_body]
         return [None for i in range(len(NOTIFICATION_EVENT_ATTRIBUTES))]
     return list(map(_notification_to_row, notifications))
@@ -1,8 +1,10 @@
 from django.contrib import admin
+from django.db.models import Count, OuterRef, Q, Subquery
 from django_better_admin_arrayfield.admin.mixins import DynamicArrayMixin
 
 from events.forms import NotificationTemplateForm, NotificationTemplateVariableForm
-from events.models import NotificationEvent, NotificationTemplate, NotificationTemplateVariable, NotificationType, NotificationSchedule, InstantNotification
+from events.models import NotificationEvent, NotificationTemplate, NotificationTemplateVariable, NotificationType, NotificationSchedule, InstantNotification, \
+    InstantNotificationRecipient
 
 
 class NotificationTemplateVariableInline(admin.TabularInline):
@@ -38,9 +40,70 @@ class NotificationEventAdmin(admin.ModelAdmin):
     pass
 
 
+class InstantNotificationRecipientInline(admin.TabularInline):
+    model = InstantNotificationRecipient
+    fields = ('phone_number', 'user', 'result', 'push_status',)
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def get_queryset(self, request):
+        notification_events = NotificationEvent.objects.filter(
+            instant_notification=OuterRef('instant_notification'),
+            user=OuterRef('user'),
+        )
+        return super().get_queryset(request).select_related('user').annotate(
+            push_sent_at=Subquery(notification_events.values('push_notification_sent_at')[:1]),
+            push_failed_at=Subquery(notification_events.values('push_failed_at')[:1]),
+            push_last_error=Subquery(notification_events.values('push_last_error')[:1]),
+        )
+
+    def push_status(self, obj):
+        if obj.result != InstantNotificationRecipient.Result.QUEUED:
+            return '-'
+        if obj.push_sent_at is not None:
+            return f"Sent at {obj.push_sent_at}"
+        if obj.push_failed_at is not None:
+            return f"Failed: {obj.push_last_error}"
+        return 'Waiting'
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(InstantNotification)
 class InstantNotificationAdmin(admin.ModelAdmin):
     search_fields = ('notification_type',)
+    list_display = ('id', 'notification_type', 'created_at',)
+    inlines = [
+        InstantNotificationRecipientInline,
+    ]
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None:
+            return ()
+        return ('recipient_summary', 'push_progress',)
+
+    def recipient_summary(self, obj):
+        results = dict(obj.instantnotificationrecipient_set.values_list('result').annotate(count=Count('id')))
+        return ', '.join(
+            f"{label}: {results[value]}"
+            for value, label in InstantNotificationRecipient.Result.choices
+            if value in results
+        )
+
+    def push_progress(self, obj):
+        counts = NotificationEvent.objects.filter(instant_notification=obj).aggregate(
+            total=Count('id'),
+            sent=Count('id', filter=Q(push_notification_sent_at__isnull=False)),
+            failed=Count('id', filter=Q(push_failed_at__isnull=False)),
+        )
+        waiting = counts['total'] - counts['sent'] - counts['failed']
+        return f"{counts['sent']} sent, {counts['failed']} failed, {waiting} waiting"
+
+    def response_add(self, request, obj, post_url_continue=None):
+        self.message_user(request, f"Recipients of the notification: {self.recipient_summary(obj)}")
+        return super().response_add(request, obj, post_url_continue)
 
     def get_form(self, request, obj=None, **kwargs):
         form = super(InstantNotificationAdmin, self).get_form(request, obj, **kwargs)
@@ -0,0 +1,209 @@
+import logging
+from collections import Counter, defaultdict
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import django.utils.timezone
+import httpx
+from django.db import transaction
+from django.db.models import F, Q, QuerySet
+from onesignal_sdk.error import OneSignalHTTPError
+
+from events.models import NotificationEvent
+from events.utils import send_notification
+
+
+logger = logging.getLogger(__name__)
+
+PUSH_MAX_ATTEMPTS = 5
+# OneSignal accepts at most this many include_external_user_ids per notification
+ONESIGNAL_MAX_RECIPIENTS = 2000
+PUSH_RETRY_BASE_DELAY = timedelta(seconds=30)
+PUSH_RETRY_MAX_DELAY = timedelta(hours=1)
+# A claimed event is handed to another dispatcher if the one that claimed it has not finished by then
+PUSH_CLAIM_TIMEOUT = timedelta(minutes=5)
+
+
+class PushDeliveryError(Exception):
+    def __init__(self, message: str, retryable: bool):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class DispatchResult(NamedTuple):
+    sent: int
+    retried: int
+    dead_lettered: int
+
+
+class PushGroup(NamedTuple):
+    """
+    Notification events whose rendered push is identical, sent to all their users with one OneSignal request.
+    """
+    title: str
+    body: str
+    language_code: str
+    notification_events: list
+
+
+def get_due_push_notification_events(now: datetime) -> QuerySet:
+    """
+    Outbox entries that should be pushed at `now`: not sent, not dead-lettered, inside their window and not waiting
+    for a retry or for another dispatcher.
+    """
+    return NotificationEvent.objects.filter(
+        Q(push_next_attempt_at__isnull=True) | Q(push_next_attempt_at__lte=now),
+        push_notification_sent_at__isnull=True,
+        push_failed_at__isnull=True,
+        notification_available_at__lte=now,
+        notification_expires_at__gt=now,
+    )
+
+
+def get_push_retry_delay(attempts: int) -> timedelta:
+    return min(PUSH_RETRY_BASE_DELAY * 2 ** (attempts - 1), PUSH_RETRY_MAX_DELAY)
+
+
+def group_push_notification_events(notification_events: Iterable[NotificationEvent],
+                                   max_recipients: int = ONESIGNAL_MAX_RECIPIENTS) -> list[PushGroup]:
+    """
+    Groups notification events by their rendered (push_title, push_body, language). A group is split when it
+    reaches `max_recipients`, or when it would address the same user twice, since OneSignal would only push once.
+    """
+    groups_by_content = defaultdict(list)
+    # The users of the last (open) group of every content
+    user_ids_by_content = {}
+    for notification_event in notification_events:
+        content = (notification_event.push_title, notification_event.push_body, notification_event.language_code,)
+        groups = groups_by_content[content]
+        if len(groups) == 0 or len(groups[-1]) >= max_recipients \
+                or notification_event.user_id in user_ids_by_content[content]:
+            groups.append([])
+            user_ids_by_content[content] = set()
+        groups[-1].append(notification_event)
+        user_ids_by_content[content].add(notification_event.user_id)
+    return [
+        PushGroup(title, body, language_code, group)
+        for (title, body, language_code), groups in groups_by_content.items()
+        for group in groups
+    ]
+
+
+def deliver_push(title: str, body: str, external_user_ids: list[str]) -> set[str]:
+    """
+    Sends one push to every user in `external_user_ids` and returns the users OneSignal could not reach.
+    Raises PushDeliveryError when the whole request failed, telling whether trying again later may succeed.
+    """
+    try:
+        response = send_notification(title, body, external_user_ids)
+    except OneSignalHTTPError as e:
+        retryable = e.status_code == 429 or e.status_code >= 500
+        raise PushDeliveryError(f"HTTP {e.status_code}: {e.message}", retryable)
+    except httpx.HTTPError as e:
+        raise PushDeliveryError(f"{type(e).__name__}: {e}", True)
+    if not 200 <= response.status_code <= 299:
+        raise PushDeliveryError(f"HTTP {response.status_code}: {response.body}", False)
+    errors = response.body.get('errors')
+    if errors is None:
+        return set()
+    # OneSignal answers 200 with the recipients it could not reach, or with a list of errors when there were none
+    if isinstance(errors, dict) and 'invalid_external_user_ids' in errors:
+        return set(errors['invalid_external_user_ids'])
+    raise PushDeliveryError(f"HTTP {response.status_code}: {response.body}", False)
+
+
+class PushDispatcher:
+    """
+    Drains the push outbox: claims due notification events in batches, sends each group of identical pushes to
+    OneSignal as one request from up to `concurrency` threads and records the outcome of every recipient.
+    Failed pushes are retried with exponential backoff until `max_attempts` is reached or the event expires,
+    after which they are dead-lettered with push_failed_at.
+    """
+
+    def __init__(self, concurrency: int = 8, batch_size: int = 1000, max_attempts: int = PUSH_MAX_ATTEMPTS,
+                 max_recipients: int = ONESIGNAL_MAX_RECIPIENTS):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.max_recipients = max_recipients
+
+    def dispatch_due(self) -> DispatchResult:
+        outcomes = Counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                now = django.utils.timezone.now()
+                notification_events = self.claim(now)
+                if len(notification_events) == 0:
+                    break
+                unrendered_events = [e for e in notification_events if e.push_title is None]
+                if len(unrendered_events) > 0:
+                    error = PushDeliveryError("Notification type has no template to render", False)
+                    outcomes.update(self.record(unrendered_events, {e.id: error for e in unrendered_events}))
+                notification_events = [e for e in notification_events if e.push_title is not None]
+                groups = group_push_notification_events(notification_events, self.max_recipients)
+                for group, errors in zip(groups, executor.map(self.try_deliver, groups)):
+                    outcomes.update(self.record(group.notification_events, errors))
+        return DispatchResult(outcomes['sent'], outcomes['retried'], outcomes['dead_lettered'])
+
+    def claim(self, now: datetime) -> list[NotificationEvent]:
+        with transaction.atomic():
+            notification_events = list(
+                get_due_push_notification_events(now)
+                .select_for_update(skip_locked=True, of=('self',))
+                .select_related('user__userprofile')
+                .order_by('notification_available_at', 'id')[:self.batch_size]
+            )
+            NotificationEvent.objects.filter(pk__in=[e.pk for e in notification_events]) \
+                .update(push_next_attempt_at=now + PUSH_CLAIM_TIMEOUT)
+        return notification_events
+
+    def try_deliver(self, group: PushGroup) -> dict[int, PushDeliveryError]:
+        """
+        Sends the group's push and returns the error of every notification event that was not delivered.
+        """
+        external_user_ids = [e.user.username for e in group.notification_events]
+        try:
+            unreachable_user_ids = deliver_push(group.title, group.body, external_user_ids)
+        except PushDeliveryError as e:
+            return {notification_event.id: e for notification_event in group.notification_events}
+        return {
+            notification_event.id: PushDeliveryError(f"User {notification_event.user.username} is not subscribed",
+                                                     False)
+            for notification_event in group.notification_events
+            if notification_event.user.username in unreachable_user_ids
+        }
+
+    def record(self, notification_events: list[NotificationEvent], errors: dict[int, PushDeliveryError]) -> Counter:
+        # update() rather than save(), so neither signals nor auto_now fields fire for delivery bookkeeping
+        now = django.utils.timezone.now()
+        outcomes = Counter()
+        sent_ids = [e.id for e in notification_events if e.id not in errors]
+        if len(sent_ids) > 0:
+            NotificationEvent.objects.filter(pk__in=sent_ids).update(
+                push_notification_sent_at=now, push_attempts=F('push_attempts') + 1, push_next_attempt_at=None,
+                push_last_error='',
+            )
+            outcomes['sent'] = len(sent_ids)
+        for notification_event in notification_events:
+            error = errors.get(notification_event.id)
+            if error is not None:
+                outcomes[self.record_failure(notification_event, error, now)] += 1
+        return outcomes
+
+    def record_failure(self, notification_event: NotificationEvent, error: PushDeliveryError, now: datetime) -> str:
+        events = NotificationEvent.objects.filter(pk=notification_event.pk)
+        attempts = notification_event.push_attempts + 1
+        next_attempt_at = now + get_push_retry_delay(attempts)
+        if not error.retryable or attempts >= self.max_attempts \
+                or next_attempt_at >= notification_event.notification_expires_at:
+            logger.error(f"Giving up sending notification event {notification_event.id} to OneSignal: {error}")
+            events.update(push_failed_at=now, push_attempts=F('push_attempts') + 1, push_next_attempt_at=None,
+                          push_last_error=str(error))
+            return 'dead_lettered'
+        logger.warning(f"Error when sending notification event {notification_event.id} to OneSignal, "
+                       f"retrying at {next_attempt_at}: {error}")
+        events.update(push_attempts=F('push_attempts') + 1, push_next_attempt_at=next_attempt_at,
+                      push_last_error=str(error))
+        return 'retried'
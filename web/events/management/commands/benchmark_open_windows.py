@@ -0,0 +1,76 @@
+import time as timer
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+import pytz
+from django.core.management.base import BaseCommand
+
+from events.constants import CalendarEventType
+from events.models import NotificationSchedule
+from hera.windows import EPOCH_ORDINAL, EVENT_TYPE_CODES, UTC_OFFSET_SLACK, find_open_windows, get_schedule_arrays
+
+
+class Command(BaseCommand):
+    help = 'Compare evaluating (calendar event, schedule) windows one pair at a time with hera.windows. ' \
+           'Uses synthetic data and does not touch the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', dest='events', type=int, default=20000)
+        parser.add_argument('--schedules', dest='schedules', type=int, default=50)
+
+    def handle(self, *args, **options):
+        event_types = CalendarEventType.values
+        schedules = [
+            NotificationSchedule(
+                calendar_event_type=event_types[i % len(event_types)],
+                offset_days=i % 15 - 7,
+                time_of_day=time(i % 24, 0),
+                push_time_to_live=timedelta(hours=1 + i % 48),
+            )
+            for i in range(options['schedules'])
+        ]
+        timezones = [pytz.timezone(name) for name in ['UTC', 'Asia/Jakarta', 'America/New_York', 'Europe/Berlin']]
+        first_date = date(2021, 1, 1)
+        events = [
+            (first_date + timedelta(days=i % 365), event_types[i % len(event_types)], timezones[i % len(timezones)])
+            for i in range(options['events'])
+        ]
+        now = datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC)
+        pairs = len(events) * len(schedules)
+
+        start = timer.perf_counter()
+        matches = 0
+        for event_date, event_type, timezone in events:
+            for schedule in schedules:
+                if schedule.calendar_event_type != event_type:
+                    continue
+                available_at, expires_at = schedule.get_notification_window(event_date, timezone)
+                if available_at <= now <= expires_at:
+                    matches += 1
+        python_seconds = timer.perf_counter() - start
+
+        start = timer.perf_counter()
+        event_indexes, schedule_indexes = find_open_windows(
+            np.array([event_date.toordinal() - EPOCH_ORDINAL for event_date, _, _ in events], dtype=np.int64),
+            np.array([EVENT_TYPE_CODES[event_type] for _, event_type, _ in events], dtype=np.int64),
+            np.array([now.astimezone(timezone).utcoffset().total_seconds() for _, _, timezone in events],
+                     dtype=np.int64),
+            get_schedule_arrays(schedules, 'push_time_to_live'),
+            int(now.timestamp()),
+            slack=int(UTC_OFFSET_SLACK.total_seconds()),
+        )
+        confirmed = 0
+        for event_index, schedule_index in zip(event_indexes.tolist(), schedule_indexes.tolist()):
+            event_date, _, timezone = events[event_index]
+            available_at, expires_at = schedules[schedule_index].get_notification_window(event_date, timezone)
+            if available_at <= now <= expires_at:
+                confirmed += 1
+        numpy_seconds = timer.perf_counter() - start
+
+        if confirmed != matches:
+            self.stderr.write(self.style.ERROR(f"Mismatch: {matches} open windows one by one, {confirmed} vectorized"))
+        self.stdout.write(self.style.SUCCESS(
+            f"{pairs} pairs, {matches} open windows ({len(event_indexes)} candidates): "
+            f"one by one {python_seconds:.3f}s, vectorized {numpy_seconds:.3f}s "
+            f"({python_seconds / numpy_seconds:.1f}x)"
+        ))
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from events.dispatcher import ONESIGNAL_MAX_RECIPIENTS, PUSH_MAX_ATTEMPTS, PushDispatcher
+
+
+class Command(BaseCommand):
+    help = 'Send the push notifications of due notification events to OneSignal'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', dest='concurrency', type=int, default=8,
+                            help='Maximum number of pushes in flight at once')
+        parser.add_argument('--batch-size', dest='batch_size', type=int, default=1000,
+                            help='Number of due notification events claimed at once, which are then grouped by content')
+        parser.add_argument('--max-recipients', dest='max_recipients', type=int, default=ONESIGNAL_MAX_RECIPIENTS,
+                            help='Maximum number of users addressed by one OneSignal request')
+        parser.add_argument('--max-attempts', dest='max_attempts', type=int, default=PUSH_MAX_ATTEMPTS,
+                            help='Dead-letter a push after this many failed attempts')
+        parser.add_argument('--forever', dest='forever', action='store_true',
+                            help='Keep polling for due pushes instead of exiting once none are left')
+        parser.add_argument('--poll-interval', dest='poll_interval', type=float, default=5.0,
+                            help='Seconds to wait between polls with --forever')
+        parser.set_defaults(forever=False)
+
+    def handle(self, *args, **options):
+        dispatcher = PushDispatcher(
+            concurrency=options['concurrency'],
+            batch_size=options['batch_size'],
+            max_attempts=options['max_attempts'],
+            max_recipients=options['max_recipients'],
+        )
+        while True:
+            started_at = time.monotonic()
+            result = dispatcher.dispatch_due()
+            if result != (0, 0, 0) or not options['forever']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Dispatched pushes in {time.monotonic() - started_at:.2f}s: {result.sent} sent, "
+                    f"{result.retried} to retry, {result.dead_lettered} dead-lettered"
+                ))
+            if not options['forever']:
+                return
+            time.sleep(options['poll_interval'])
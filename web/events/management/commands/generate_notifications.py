@@ -1,9 +1,7 @@
-from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand
-from django.db import IntegrityError
 
-from events.models import NotificationSchedule
-from events.utils import generate_notification_events_for_user
+from events.utils import generate_notification_events_for_all_users
+from hera.sharding import add_generation_arguments, format_shard_result, run_shards
 
 
 class Command(BaseCommand):
@@ -11,29 +9,11 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('--force-create-events', dest='force_create_events', action='store_true')
+        add_generation_arguments(parser)
         parser.set_defaults(force_create_events=False)
 
     def handle(self, *args, **options):
-        force_create_events = options['force_create_events']
-        schedules = NotificationSchedule.objects.order_by('calendar_event_type', 'offset_days', 'time_of_day').all()
-        self.stdout.write(self.style.SUCCESS(
-            f"Loaded {len(schedules)} NotificationSchedules"
-        ))
-        users = User.objects.filter(is_active=True).all()
-        for user in users:
-            self.stdout.write(self.style.SUCCESS(
-                f"Generating notifications for user {user.id}"
-            ))
-            notification_events = generate_notification_events_for_user(user, schedules,
-                                                                        force_create_events=force_create_events)
-            for event in notification_events:
-                try:
-                    event.save()
-                    self.stdout.write(self.style.SUCCESS(
-                        f"Created NotificationEvent {event.id} for user {user.id}"
-                    ))
-                except IntegrityError:
-                    pass
-        self.stdout.write(self.style.SUCCESS(
-            'Finished generating notifications for all users'
-        ))
+        results = run_shards(generate_notification_events_for_all_users, options['workers'], options['shard'],
+                             options['force_create_events'], options['batch_size'], options['incremental'])
+        for result in results:
+            self.stdout.write(self.style.SUCCESS(format_shard_result(result, 'notifications')))
@@ -0,0 +1,17 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from child_health.catalog import get_vaccine_catalog
+from events.utils import rebuild_calendar_events_for_user
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized calendar events of every user'
+
+    def handle(self, *args, **options):
+        catalog = get_vaccine_catalog()
+        count = 0
+        for user in User.objects.order_by('id').iterator():
+            rebuild_calendar_events_for_user(user, catalog)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt calendar events of {count} users"))
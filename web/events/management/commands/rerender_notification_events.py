@@ -0,0 +1,39 @@
+import django.utils.timezone
+from django.core.management.base import BaseCommand
+
+from events.models import NotificationEvent
+from events.resolvers import NotificationTemplateResolver
+
+
+class Command(BaseCommand):
+    help = 'Render the stored push and in-app text of notification events again, e.g. after fixing a template'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--notification-type', dest='notification_types', action='append', default=[],
+                            help='Code of the notification type to re-render, can be repeated. Defaults to all')
+        parser.add_argument('--batch-size', dest='batch_size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        template_resolver = NotificationTemplateResolver.load()
+        notification_events = NotificationEvent.objects.select_related('user__userprofile').order_by('id')
+        if len(options['notification_types']) > 0:
+            notification_events = notification_events.filter(notification_type__code__in=options['notification_types'])
+        count = 0
+        batch = []
+        for notification_event in notification_events.iterator(chunk_size=options['batch_size']):
+            batch.append(notification_event)
+            if len(batch) >= options['batch_size']:
+                count += self.rerender(template_resolver, batch)
+                batch = []
+        count += self.rerender(template_resolver, batch)
+        self.stdout.write(self.style.SUCCESS(f"Re-rendered {count} notification events"))
+
+    def rerender(self, template_resolver: NotificationTemplateResolver, notification_events: list) -> int:
+        template_resolver.render(notification_events)
+        rendered_events = [e for e in notification_events if e.template is not None]
+        now = django.utils.timezone.now()
+        for notification_event in rendered_events:
+            notification_event.updated_at = now
+        NotificationEvent.objects.bulk_update(rendered_events,
+                                              ['push_title', 'push_body', 'in_app_content', 'updated_at'])
+        return len(rendered_events)
@@ -0,0 +1,46 @@
+from django.contrib.auth.models import User
+from django.db import models
+from django.db.models import OuterRef, Q, QuerySet, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+class NotificationReadStateManager(models.Manager):
+    def mark_all_as_read(self, user: User, now):
+        """
+        Moves the user's watermark past their latest available notification event, which is a single-row write
+        however many events the user has.
+        """
+        last_id = user.notificationevent_set.filter(
+            notification_available_at__lte=now,
+        ).order_by('-id').values_list('id', flat=True).first()
+        self.update_or_create(user=user, defaults={
+            'last_read_notification_event_id': last_id or 0,
+            'last_read_at': now,
+        })
+
+    def annotate_read_at(self, notification_events: QuerySet) -> QuerySet:
+        """
+        Annotates `effective_read_at`: the event's own read_at, or the time its user's watermark passed it.
+        Events generated ahead of time get lower ids than the ones created meanwhile, so the watermark only covers
+        the events that were already available when it moved.
+        """
+        watermark_read_at = self.filter(
+            user=OuterRef('user'),
+            last_read_notification_event_id__gte=OuterRef('id'),
+            last_read_at__gte=OuterRef('notification_available_at'),
+        ).values('last_read_at')
+        return notification_events.annotate(effective_read_at=Coalesce('read_at', Subquery(watermark_read_at)))
+
+    def count_unread(self, user: User, now) -> int:
+        """
+        Counts the user's available events past the watermark that were not read one by one, which only scans
+        the partial index of unread events.
+        """
+        watermark = self.filter(user=user)
+        last_read_id = Coalesce(Subquery(watermark.values('last_read_notification_event_id')), Value(0))
+        last_read_at = Subquery(watermark.values('last_read_at'))
+        return user.notificationevent_set.filter(
+            Q(id__gt=last_read_id) | Q(notification_available_at__gt=last_read_at),
+            read_at__isnull=True,
+            notification_available_at__lte=now,
+        ).count()
@@ -0,0 +1,45 @@
+# Generated by Django 4.0.4 on 2026-10-17 01:55
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('events', '0019_alter_notificationtemplatevariable_name_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCalendar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vaccine_catalog_version', models.CharField(max_length=16)),
+                ('built_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CalendarEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('prenatal_checkup', 'Prenatal Checkup'), ('vaccination', 'Vaccination')], max_length=50)),
+                ('date', models.DateField()),
+                ('event_key', models.CharField(max_length=255, unique=True)),
+                ('context', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='calendarevent',
+            index=models.Index(fields=['date', 'event_type'], name='events_cale_date_b8a1ae_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='calendarevent',
+            index=models.Index(fields=['user', 'date'], name='events_cale_user_id_1d899b_idx'),
+        ),
+    ]
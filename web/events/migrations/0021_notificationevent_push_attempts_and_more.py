@@ -0,0 +1,37 @@
+# Generated by Django 4.0.4 on 2026-10-17 01:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0020_usercalendar_calendarevent_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationevent',
+            name='push_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='notificationevent',
+            name='push_failed_at',
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationevent',
+            name='push_last_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='notificationevent',
+            name='push_next_attempt_at',
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='notificationevent',
+            index=models.Index(condition=models.Q(('push_failed_at__isnull', True), ('push_notification_sent_at__isnull', True)), fields=['notification_available_at'], name='events_notif_push_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.4 on 2026-10-17 02:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0021_notificationevent_push_attempts_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationevent',
+            name='in_app_content',
+            field=models.TextField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationevent',
+            name='push_body',
+            field=models.TextField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationevent',
+            name='push_title',
+            field=models.TextField(blank=True, default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.0.4 on 2026-10-17 02:04
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import migrations
+from liquid import Template
+
+
+def render_notification_event_text(apps, schema_editor):
+    """
+    Stores the rendered text of existing notification events, resolving templates the way
+    NotificationEvent.template does.
+    """
+    NotificationEvent = apps.get_model('events', 'NotificationEvent')
+    NotificationTemplate = apps.get_model('events', 'NotificationTemplate')
+    templates_by_type = {}
+    for template in NotificationTemplate.objects.order_by('pk'):
+        templates_by_type.setdefault(template.notification_type_id, []).append(template)
+    compiled = {}
+
+    def render(template, field_name, context):
+        key = (template.pk, field_name,)
+        if key not in compiled:
+            compiled[key] = Template(getattr(template, field_name))
+        return compiled[key].render(context)
+
+    notification_events = NotificationEvent.objects.filter(push_title__isnull=True).select_related('user__userprofile')
+    batch = []
+    for notification_event in notification_events.iterator(chunk_size=1000):
+        try:
+            language_code = notification_event.user.userprofile.language_code
+        except ObjectDoesNotExist:
+            language_code = settings.LANGUAGE_CODE
+        type_templates = templates_by_type.get(notification_event.notification_type_id, [])
+        template = next((t for t in type_templates if t.language_code.startswith(language_code)), None)
+        if template is None:
+            template = next((t for t in type_templates if t.language_code.startswith('en')), None)
+        if template is None:
+            continue
+        notification_event.push_title = render(template, 'push_title', notification_event.context)
+        notification_event.push_body = render(template, 'push_body', notification_event.context)
+        notification_event.in_app_content = render(template, 'in_app_content', notification_event.context)
+        batch.append(notification_event)
+        if len(batch) >= 1000:
+            NotificationEvent.objects.bulk_update(batch, ['push_title', 'push_body', 'in_app_content'])
+            batch = []
+    NotificationEvent.objects.bulk_update(batch, ['push_title', 'push_body', 'in_app_content'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_profile', '0007_alter_userprofile_language_code'),
+        ('events', '0022_notificationevent_in_app_content_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(render_notification_event_text, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.0.4 on 2026-10-17 02:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0023_render_notification_event_text'),
+    ]
+
+    operations = [
+        # index_together [['user']] duplicated the foreign key's own index on user_id, which AlterIndexTogether
+        # cannot tell apart, so the index is dropped by name
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterIndexTogether(
+                    name='notificationevent',
+                    index_together=set(),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    sql='DROP INDEX IF EXISTS "events_notificationevent_user_id_52efe004_idx"',
+                    reverse_sql='CREATE INDEX "events_notificationevent_user_id_52efe004_idx" '
+                                'ON "events_notificationevent" ("user_id")',
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='notificationevent',
+            index=models.Index(fields=['user', '-id'], name='events_noti_user_id_b2640d_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+from hera.partitioning import partition_table_by_month
+
+
+def partition_notification_events(apps, schema_editor):
+    partition_table_by_month(schema_editor, 'events_notificationevent', 'created_at', [('event_key', 'schedule_id')])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0025_notificationreadstate_and_more'),
+    ]
+
+    operations = [
+        # The partitioned table serves the previous schema as well, so there is nothing to undo
+        migrations.RunPython(partition_notification_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.0.4 on 2026-10-17 02:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('events', '0026_partition_notificationevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationevent',
+            name='instant_notification',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='events.instantnotification'),
+        ),
+        migrations.CreateModel(
+            name='InstantNotificationRecipient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone_number', models.CharField(max_length=15)),
+                ('result', models.CharField(choices=[('queued', 'Queued for push'), ('unknown_user', 'No user with this phone number'), ('no_profile', 'User has no profile')], max_length=20)),
+                ('instant_notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='events.instantnotification')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
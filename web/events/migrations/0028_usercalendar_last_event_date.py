@@ -0,0 +1,29 @@
+# Generated by Django 4.0.4 on 2026-10-17 02:28
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def fill_last_event_dates(apps, schema_editor):
+    CalendarEvent = apps.get_model('events', 'CalendarEvent')
+    UserCalendar = apps.get_model('events', 'UserCalendar')
+    last_event_dates = CalendarEvent.objects.filter(user=OuterRef('user')).values('user').annotate(
+        last_event_date=Max('date'),
+    ).values('last_event_date')
+    UserCalendar.objects.update(last_event_date=Subquery(last_event_dates))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0027_notificationevent_instant_notification_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercalendar',
+            name='last_event_date',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(fill_last_event_dates, migrations.RunPython.noop),
+    ]
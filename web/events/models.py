@@ -5,14 +5,16 @@ from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.postgres.fields import ArrayField, HStoreField
 from django.contrib.postgres.indexes import HashIndex
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinLengthValidator, MinValueValidator, RegexValidator
 from django.conf import settings
 from django.db import models
 from django.utils.translation import gettext_lazy as _
-from functools import lru_cache
-from liquid import Template
+from functools import cached_property
 
 from events.constants import CalendarEventType
+from events.managers import NotificationReadStateManager
+from hera.liquid import get_compiled_template
 
 
 class LanguageCode(models.TextChoices):
@@ -124,19 +126,16 @@ class NotificationTemplate(models.Model):
         return f"NotificationTemplate for {self.notification_type_id} ({self.language_code.upper()})"
 
     @property
-    @lru_cache(maxsize=1)
     def push_title_template(self):
-        return Template(self.push_title)
+        return get_compiled_template(self, 'push_title')
 
     @property
-    @lru_cache(maxsize=1)
     def push_body_template(self):
-        return Template(self.push_body)
+        return get_compiled_template(self, 'push_body')
 
     @property
-    @lru_cache(maxsize=1)
     def in_app_content_template(self):
-        return Template(self.in_app_content)
+        return get_compiled_template(self, 'in_app_content')
 
     def rendered_push_title(self, context: dict):
         return self.push_title_template.render(context)
@@ -190,6 +189,51 @@ class NotificationSchedule(models.Model):
         notification_expires_at = notification_available_at + self.push_time_to_live
         return (notification_available_at, notification_expires_at,)
 
+class CalendarEvent(models.Model):
+    """
+    Materialized calendar of a user. The rows are rebuilt by events.signals whenever the user's pregnancies,
+    children or the vaccine catalog change, so reading a calendar does not have to recompute it.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+    )
+    event_type = models.CharField(
+        max_length=50,
+        choices=CalendarEventType.choices,
+    )
+    date = models.DateField()
+    event_key = models.CharField(
+        max_length=255,
+        unique=True,
+    )
+    context = models.JSONField(encoder=DjangoJSONEncoder)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'event_type']),
+            models.Index(fields=['user', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.event_key} on {self.date}"
+
+
+class UserCalendar(models.Model):
+    """
+    Marks that a user's CalendarEvent rows have been built, and from which version of the vaccine catalog.
+    last_event_date is the date of their last CalendarEvent (None without any), so the generation jobs can leave out
+    users whose calendar ended before any schedule window could still be open, see get_calendar_horizon().
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+    )
+    vaccine_catalog_version = models.CharField(max_length=16)
+    built_at = models.DateTimeField(auto_now=True)
+    last_event_date = models.DateField(null=True, blank=True, db_index=True)
+
+
 class InstantNotification(models.Model):
     phone_numbers = ArrayField(
         models.CharField(max_length=15, blank=False),
@@ -201,6 +245,36 @@ class InstantNotification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+
+class InstantNotificationRecipient(models.Model):
+    """
+    Outcome of fanning an InstantNotification out to one of its phone numbers, see fan_out_instant_notification().
+    """
+    class Result(models.TextChoices):
+        QUEUED = 'queued', _('Queued for push')
+        UNKNOWN_USER = 'unknown_user', _('No user with this phone number')
+        NO_PROFILE = 'no_profile', _('User has no profile')
+
+    instant_notification = models.ForeignKey(
+        InstantNotification,
+        on_delete=models.CASCADE,
+    )
+    phone_number = models.CharField(max_length=15)
+    user = models.ForeignKey(
+        User,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    result = models.CharField(
+        max_length=20,
+        choices=Result.choices,
+    )
+
+    def __str__(self):
+        return f"{self.phone_number}: {self.get_result_display()}"
+
+
 class NotificationEvent(models.Model):
     user = models.ForeignKey(
         User,
@@ -219,51 +293,77 @@ class NotificationEvent(models.Model):
     )
     context = HStoreField(default=dict)
     notification_type = models.ForeignKey(NotificationType, on_delete=models.CASCADE)
+    instant_notification = models.ForeignKey(
+        InstantNotification,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    # Rendered on creation, see render()
+    push_title = models.TextField(blank=True, null=True, default=None)
+    push_body = models.TextField(blank=True, null=True, default=None)
+    in_app_content = models.TextField(blank=True, null=True, default=None)
     notification_available_at = models.DateTimeField()
     notification_expires_at = models.DateTimeField()
     push_notification_sent_at = models.DateTimeField(blank=True, null=True, default=None)
+    # Push outbox: events without push_notification_sent_at are delivered by events.dispatcher
+    push_attempts = models.PositiveSmallIntegerField(default=0)
+    push_next_attempt_at = models.DateTimeField(blank=True, null=True, default=None)
+    push_failed_at = models.DateTimeField(blank=True, null=True, default=None)
+    push_last_error = models.TextField(blank=True, default='')
+    # Marks this one event read, on top of the user's NotificationReadState watermark
     read_at = models.DateTimeField(blank=True, null=True, default=None)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
+        # The table is partitioned by month of created_at (see hera.partitioning), so this is enforced by a trigger
         unique_together = [
             ['event_key', 'schedule'],
         ]
-        index_together = [
-            ['user']
+        indexes = [
+            models.Index(fields=['user', '-id']),
+            models.Index(
+                fields=['notification_available_at'],
+                name='events_notif_push_pending_idx',
+                condition=models.Q(push_notification_sent_at__isnull=True, push_failed_at__isnull=True),
+            ),
+            models.Index(
+                fields=['user', 'id'],
+                name='events_notif_unread_idx',
+                condition=models.Q(read_at__isnull=True),
+            ),
         ]
 
-    @property
-    @lru_cache(maxsize=1)
+    @cached_property
     def language_code(self):
         try:
             return self.user.userprofile.language_code
         except User.userprofile.RelatedObjectDoesNotExist:
             return settings.LANGUAGE_CODE
 
-    @property
-    @lru_cache(maxsize=1)
+    @cached_property
     def template(self):
+        # NotificationTemplateResolver.attach() sets this for many events at once
         template = self.notification_type.notificationtemplate_set.filter(language_code__startswith=self.language_code).first()
         if template is None:  # fallback to English
             template = self.notification_type.notificationtemplate_set.filter(language_code__startswith='en').first()
         return template
 
-    @property
-    @lru_cache(maxsize=1)
-    def push_title(self):
-        return self.template.rendered_push_title(self.context)
-
-    @property
-    @lru_cache(maxsize=1)
-    def push_body(self):
-        return self.template.rendered_push_body(self.context)
+    def render(self):
+        """
+        Stores the push and in-app text rendered from the template in the user's language, which is what the
+        notification list and the push dispatcher read.
+        """
+        context = self._meta.get_field('context').get_prep_value(self.context)
+        self.push_title = self.template.rendered_push_title(context)
+        self.push_body = self.template.rendered_push_body(context)
+        self.in_app_content = self.template.rendered_in_app_content(context)
 
-    @property
-    @lru_cache(maxsize=1)
-    def in_app_content(self):
-        return self.template.rendered_in_app_content(self.context)
+    def save(self, *args, **kwargs):
+        if self.push_title is None and self.template is not None:
+            self.render()
+        super().save(*args, **kwargs)
 
     @property
     def destination(self):
@@ -278,3 +378,22 @@ class NotificationEvent(models.Model):
             return self.context['date']
         else:
             return None
+
+
+class NotificationReadState(models.Model):
+    """
+    Read watermark of a user: every notification event of the user with an id up to
+    last_read_notification_event_id has been read at last_read_at.
+    """
+    objects = NotificationReadStateManager()
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+    )
+    last_read_notification_event_id = models.BigIntegerField(default=0)
+    last_read_at = models.DateTimeField(blank=True, null=True, default=None)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user} read up to {self.last_read_notification_event_id}"
@@ -1,4 +1,10 @@
+import datetime
+
+
 class CalendarEventProtocol:
+	date: datetime.date
+	event_type: str
+
 	def get_event_key(self):
 		pass
 
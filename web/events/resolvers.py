@@ -0,0 +1,53 @@
+from collections import defaultdict
+from collections.abc import Iterable
+from typing import Optional
+
+from events.models import LanguageCode, NotificationEvent, NotificationTemplate
+
+
+class NotificationTemplateResolver:
+    """
+    Maps (notification_type_id, language_code) to the NotificationTemplate a notification event renders, with the
+    English fallback of NotificationEvent.template already applied, so a whole page or batch of notification events
+    resolves its templates from one query.
+    """
+
+    def __init__(self, templates: Iterable[NotificationTemplate]):
+        self._templates_by_type = defaultdict(list)
+        for template in sorted(templates, key=lambda t: t.pk):
+            self._templates_by_type[template.notification_type_id].append(template)
+        self._resolved = {}
+        for notification_type_id in self._templates_by_type:
+            for language_code in LanguageCode.values:
+                self.resolve(notification_type_id, language_code)
+
+    @classmethod
+    def load(cls) -> 'NotificationTemplateResolver':
+        return cls(NotificationTemplate.objects.all())
+
+    def resolve(self, notification_type_id: int, language_code: str) -> Optional[NotificationTemplate]:
+        key = (notification_type_id, language_code,)
+        if key not in self._resolved:
+            type_templates = self._templates_by_type.get(notification_type_id, [])
+            template = next((t for t in type_templates if t.language_code.startswith(language_code)), None)
+            if template is None:  # fallback to English
+                template = next((t for t in type_templates if t.language_code.startswith('en')), None)
+            self._resolved[key] = template
+        return self._resolved[key]
+
+    def render(self, notification_events: Iterable[NotificationEvent]):
+        """
+        Stores the rendered text of every notification event that has a template, see NotificationEvent.render().
+        """
+        self.attach(notification_events)
+        for notification_event in notification_events:
+            if notification_event.template is not None:
+                notification_event.render()
+
+    def attach(self, notification_events: Iterable[NotificationEvent]):
+        """
+        Sets the template of every notification event, so rendering them does not query templates one by one.
+        """
+        for notification_event in notification_events:
+            notification_event.template = self.resolve(notification_event.notification_type_id,
+                                                       notification_event.language_code)
@@ -1,6 +1,7 @@
 from abc import ABC
 
-from rest_framework.fields import CharField, DateField
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import CharField, DateField, DateTimeField, IntegerField
 from rest_framework.serializers import Serializer, ModelSerializer
 from events.models import NotificationEvent
 
@@ -10,10 +11,31 @@ class CalendarEventSerializer(Serializer):
     event_type = CharField()
 
 
+class CalendarEventFilterSerializer(Serializer):
+    """
+    Query parameters of the calendar endpoint. `from` is a Python keyword, hence get_fields().
+    """
+
+    def get_fields(self):
+        return {
+            'from': DateField(required=False, source='date_from'),
+            'to': DateField(required=False, source='date_to'),
+            'child_id': IntegerField(required=False, min_value=1),
+            'pregnancy_id': IntegerField(required=False, min_value=1),
+        }
+
+    def validate(self, attrs):
+        if 'date_from' in attrs and 'date_to' in attrs and attrs['date_from'] > attrs['date_to']:
+            raise ValidationError({'to': 'Must not be before `from`.'})
+        return attrs
+
+
 class NotificationEventSerializer(ModelSerializer):
     date = DateField()
     destination = CharField()
-    
+    # Annotated by NotificationReadState.objects.annotate_read_at()
+    read_at = DateTimeField(source='effective_read_at', read_only=True)
+
     class Meta:
         model = NotificationEvent
         fields = [
@@ -1,44 +1,65 @@
-import logging
-from datetime import timedelta
-
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
-import django
-from django.core.exceptions import ObjectDoesNotExist
 
-from events.models import NotificationEvent, InstantNotification
-from events.utils import send_notification
-from django.contrib.auth.models import User
+from child_health.events import get_subject_event_key_prefix
+from child_health.models import Child, PastVaccination, Pregnancy
+from events.models import InstantNotification, NotificationSchedule, NotificationTemplate
+from events.utils import fan_out_instant_notification, get_pending_notification_events, \
+    rebuild_calendar_events_for_user_id
+from hera.liquid import compiled_templates
+
 
+@receiver(post_save, sender=InstantNotification)
+def fan_out_instant_notification_on_create(sender, instance: InstantNotification, created: bool, **kwargs):
+    if created:
+        fan_out_instant_notification(instance)
 
-logger = logging.getLogger(__name__)
 
+# Calendars are rebuilt once the change is committed, so that a user being deleted
+# together with their pregnancies and children does not get new rows in the meantime.
+@receiver(post_save, sender=Pregnancy)
+@receiver(post_delete, sender=Pregnancy)
+@receiver(post_save, sender=Child)
+@receiver(post_delete, sender=Child)
+def rebuild_calendar_on_subject_change(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: rebuild_calendar_events_for_user_id(user_id))
 
-@receiver(post_save, sender=NotificationEvent)
-def send_notification_to_onesignal(sender, instance: NotificationEvent, **kwargs):
-    if instance.push_notification_sent_at is not None:
-        return
 
-    response = send_notification(instance.push_title, instance.push_body, [instance.user.username])
+# Notification events created ahead of time from the former data are withdrawn along with the change, and the next
+# generation run creates them again from the current data: changed subjects, schedules and timezones are evaluated
+# against every window again. Timezone changes are handled together with surveys, see surveys.signals.
+@receiver(post_save, sender=Pregnancy)
+@receiver(post_delete, sender=Pregnancy)
+@receiver(post_save, sender=Child)
+@receiver(post_delete, sender=Child)
+def withdraw_pending_notification_events_on_subject_change(sender, instance, created=False, **kwargs):
+    if not created:
+        get_pending_notification_events().filter(
+            user_id=instance.user_id,
+            event_key__startswith=get_subject_event_key_prefix(instance),
+        ).delete()
 
-    if 200 <= response.status_code <= 299 and 'errors' not in response.body:
-        instance.push_notification_sent_at = django.utils.timezone.now()
-        instance.save()
-    else:
-        logger.error(f"Error when sending notification event {instance.id} to OneSignal: {response.body}")
 
+@receiver(post_save, sender=NotificationSchedule)
+@receiver(pre_delete, sender=NotificationSchedule)
+def withdraw_pending_notification_events_on_schedule_change(sender, instance: NotificationSchedule, created=False,
+                                                            **kwargs):
+    # Before a delete, as it sets the schedule of its notification events to NULL
+    if not created:
+        get_pending_notification_events().filter(schedule=instance).delete()
 
-@receiver(post_save, sender=InstantNotification)
-def send_instant_notification_to_onesignal(sender, instance: InstantNotification, **kwargs):
-    now = django.utils.timezone.now()
-    expires = now + timedelta(days=1)
-    for num in instance.phone_numbers:
-        user = User.objects.get(username=num)
-        try:
-            user.userprofile
-        except ObjectDoesNotExist:
-            logger.error("User doesn't have profile")
-            continue
-
-        notification_event = NotificationEvent(user=user, notification_type=instance.notification_type, notification_available_at=now, notification_expires_at=expires)
-        notification_event.save()
+
+@receiver(post_save, sender=PastVaccination)
+@receiver(post_delete, sender=PastVaccination)
+def rebuild_calendar_on_past_vaccination_change(sender, instance: PastVaccination, **kwargs):
+    user_id = Child.objects.filter(pk=instance.child_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        transaction.on_commit(lambda: rebuild_calendar_events_for_user_id(user_id))
+
+
+@receiver(post_save, sender=NotificationTemplate)
+@receiver(post_delete, sender=NotificationTemplate)
+def invalidate_compiled_notification_template(sender, instance: NotificationTemplate, **kwargs):
+    compiled_templates.invalidate(instance)
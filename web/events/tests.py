@@ -1,22 +1,36 @@
 import httpx
+import json
+import numpy as np
 import pytz
 import django.utils.timezone
 import pytz
 
 from datetime import date, datetime, time, timedelta
+from io import StringIO
 from unittest.mock import patch
 
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase, TransactionTestCase
 from django.db.transaction import atomic
+from onesignal_sdk.error import OneSignalHTTPError
 from onesignal_sdk.response import OneSignalResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
 
 from child_health.models import Pregnancy, Child, Vaccine, VaccineDose
-from child_health.events import PrenatalCheckupEvent, VaccinationEvent
+from child_health.events import PrenatalCheckupEvent, VaccinationEvent, generate_calendar_events_between, \
+    generate_calendar_events_for_user
 from events.constants import CalendarEventType
-from events.models import NotificationEvent, NotificationSchedule, NotificationType, NotificationTemplate, LanguageCode
-from events.utils import generate_notification_events_for_calendar_event, generate_notification_events_for_all_users, generate_notification_events_for_user
+from events.dispatcher import PushDispatcher
+from events.models import CalendarEvent, InstantNotification, InstantNotificationRecipient, NotificationEvent, NotificationSchedule, NotificationType, NotificationTemplate, LanguageCode, UserCalendar
+from events.utils import get_calendar_horizon, generate_notification_events_for_calendar_event, generate_notification_events_for_all_users, generate_notification_events_for_user, make_notification_artifact, rebuild_stale_vaccination_calendar_events, run_generation
+import hera.liquid
 import hera.thirdparties
+from hera.liquid import compiled_templates
+from hera.sharding import Shard
+from hera.windows import EVENT_TYPE_CODES, find_open_windows, generate_open_windows, get_schedule_arrays
+from infra.models import JobWatermark
 from user_profile.models import UserProfile
 
 
@@ -384,4 +398,871 @@ class GenerateNotificationEventsForAllUsersTests(TransactionTestCase):
         generate_notification_events_for_all_users()
         self.set_mock_time(datetime(2021, 6, 7, 10, 1, 0, tzinfo=pytz.UTC))
         generate_notification_events_for_all_users()
-        self.assertEqual(2, NotificationEvent.objects.count())
\ No newline at end of file
+        self.assertEqual(2, NotificationEvent.objects.count())
+
+    def test_generate_notification_events_for_all_users_twice_reports_skipped_events(self):
+        self.set_mock_time(datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC))
+        first_run = generate_notification_events_for_all_users(incremental=False)
+        self.set_mock_time(datetime(2021, 6, 7, 10, 1, 0, tzinfo=pytz.UTC))
+        second_run = generate_notification_events_for_all_users(incremental=False)
+        self.assertEqual((2, 0), (first_run.inserted, first_run.skipped))
+        self.assertEqual((0, 2), (second_run.inserted, second_run.skipped))
+
+    def test_generate_notification_events_for_all_users_stores_rendered_text(self):
+        self.set_mock_time(datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC))
+        generate_notification_events_for_all_users()
+        self.assertEqual({('title', 'body', 'content')},
+                         set(NotificationEvent.objects.values_list('push_title', 'push_body', 'in_app_content')))
+
+    def test_generate_notification_events_for_all_users_leaves_pushes_to_dispatcher(self):
+        self.set_mock_time(datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC))
+        generate_notification_events_for_all_users()
+        self.assertEqual(0, hera.thirdparties.onesignal_client.send_notification.call_count)
+        result = PushDispatcher().dispatch_due()
+        self.assertEqual(2, result.sent)
+        self.assertEqual(2, hera.thirdparties.onesignal_client.send_notification.call_count)
+        self.assertFalse(NotificationEvent.objects.filter(push_notification_sent_at__isnull=True).exists())
+
+    def test_due_notification_events_match_per_user_generation(self):
+        self.set_mock_time(datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC))
+        schedules = NotificationSchedule.objects.all()
+        expected = [(e.event_key, e.schedule_id) for e in generate_notification_events_for_user(self.user, schedules)]
+        run_generation([make_notification_artifact()], incremental=False)
+        result = list(NotificationEvent.objects.order_by('notification_available_at', 'notification_expires_at')
+                      .values_list('event_key', 'schedule_id'))
+        self.assertEqual(expected, result)
+
+    def test_due_notification_events_skip_children_without_events_in_window(self):
+        self.set_mock_time(datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC))
+        other_user = User.objects.create(
+            username='other_username',
+        )
+        Child.objects.create(
+            user=other_user,
+            name='older_child',
+            date_of_birth='2020-01-01',
+            gender=Child.ChildGender.MALE,
+        )
+        run_generation([make_notification_artifact()], incremental=False)
+        self.assertEqual({self.user.id}, set(NotificationEvent.objects.values_list('user_id', flat=True)))
+
+    def test_calendar_records_last_event_date(self):
+        calendar = UserCalendar.objects.get(user=self.user)
+        self.assertEqual(CalendarEvent.objects.filter(user=self.user).latest('date').date, calendar.last_event_date)
+        self.universal_vaccine.vaccinedose_set.create(name="second dose", week_age=52)
+        rebuild_stale_vaccination_calendar_events()
+        calendar.refresh_from_db()
+        self.assertEqual(date(2022, 6, 5), calendar.last_event_date)
+
+    def test_calendar_horizon_covers_latest_window(self):
+        schedules = NotificationSchedule.objects.all()
+        horizon = get_calendar_horizon(schedules, 'push_time_to_live', datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC))
+        # The vaccination window closes 2 days after 10:00 on the day of the event
+        self.assertEqual(date(2021, 6, 4), horizon)
+
+    def test_users_whose_calendar_ended_before_horizon_are_not_loaded(self):
+        other_user = User.objects.create(
+            username='other_username',
+        )
+        Child.objects.create(
+            user=other_user,
+            name='older_child',
+            date_of_birth='2020-01-01',
+            gender=Child.ChildGender.MALE,
+        )
+        date_ranges = {CalendarEventType.VACCINATION.value: [(date(2019, 1, 1), date(2022, 1, 1))]}
+        self.assertEqual({self.user, other_user}, {user for user, _ in generate_calendar_events_between(date_ranges)})
+        users = {user for user, _ in generate_calendar_events_between(date_ranges, horizon=date(2021, 6, 1))}
+        self.assertEqual({self.user}, users)
+        # Not rebuilt since the vaccine catalog changed, so its last event date cannot be trusted
+        UserCalendar.objects.filter(user=other_user).update(vaccine_catalog_version='older')
+        users = {user for user, _ in generate_calendar_events_between(date_ranges, horizon=date(2021, 6, 1))}
+        self.assertEqual({self.user, other_user}, users)
+        UserCalendar.objects.filter(user=other_user).delete()
+        users = {user for user, _ in generate_calendar_events_between(date_ranges, horizon=date(2021, 6, 1))}
+        self.assertEqual({self.user, other_user}, users)
+
+    def test_notification_event_shards_partition_users(self):
+        self.set_mock_time(datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC))
+        other_user = User.objects.create(
+            username='other_username',
+        )
+        Child.objects.create(
+            user=other_user,
+            name='other_child',
+            date_of_birth='2021-06-06',
+            gender=Child.ChildGender.FEMALE,
+        )
+        users_by_shard = []
+        for shard in [Shard(index, 2) for index in range(2)]:
+            run_generation([make_notification_artifact()], shard=shard, incremental=False)
+            users_by_shard.append(set(NotificationEvent.objects.values_list('user_id', flat=True)))
+            NotificationEvent.objects.all().delete()
+        self.assertEqual(set(), users_by_shard[0] & users_by_shard[1])
+        self.assertEqual({self.user.id, other_user.id}, users_by_shard[0] | users_by_shard[1])
+
+    def test_generate_notifications_command_with_workers_creates_events_once(self):
+        self.set_mock_time(datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC))
+        output = StringIO()
+        call_command('generate_notifications', workers=2, stdout=output)
+        self.assertEqual(2, NotificationEvent.objects.count())
+        self.assertIn('shard 0/2', output.getvalue())
+        self.assertIn('shard 1/2', output.getvalue())
+
+    def test_generate_notification_events_for_all_users_records_watermark(self):
+        now = datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC)
+        self.set_mock_time(now)
+        generate_notification_events_for_all_users()
+        self.assertEqual(now, JobWatermark.objects.get_evaluated_until('generate_notifications'))
+
+    def test_incremental_run_does_not_reevaluate_windows(self):
+        self.set_mock_time(datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC))
+        generate_notification_events_for_all_users()
+        self.set_mock_time(datetime(2021, 6, 7, 10, 1, 0, tzinfo=pytz.UTC))
+        second_run = generate_notification_events_for_all_users()
+        self.assertEqual((0, 0), (second_run.inserted, second_run.skipped))
+        self.assertEqual(2, NotificationEvent.objects.count())
+
+    def test_incremental_run_catches_up_missed_windows_once(self):
+        self.set_mock_time(datetime(2021, 6, 5, 10, 0, 0, tzinfo=pytz.UTC))
+        first_run = generate_notification_events_for_all_users()
+        self.set_mock_time(datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC))
+        catch_up_run = generate_notification_events_for_all_users()
+        self.set_mock_time(datetime(2021, 6, 7, 10, 30, 0, tzinfo=pytz.UTC))
+        next_run = generate_notification_events_for_all_users()
+        self.assertEqual(0, first_run.inserted)
+        self.assertEqual(2, catch_up_run.inserted)
+        self.assertEqual((0, 0), (next_run.inserted, next_run.skipped))
+
+    def test_incremental_run_evaluates_children_created_since_last_run(self):
+        self.set_mock_time(datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC))
+        generate_notification_events_for_all_users()
+        self.set_mock_time(datetime(2021, 6, 7, 10, 30, 0, tzinfo=pytz.UTC))
+        new_child = Child.objects.create(
+            user=self.user,
+            name='new_child',
+            date_of_birth='2021-06-06',
+            gender=Child.ChildGender.FEMALE,
+        )
+        second_run = generate_notification_events_for_all_users()
+        self.assertEqual(1, second_run.inserted)
+        self.assertTrue(NotificationEvent.objects.filter(event_key__startswith=f"vaccination/child-{new_child.id}/").exists())
+
+    def test_incremental_run_evaluates_schedules_changed_since_last_run(self):
+        self.set_mock_time(datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC))
+        generate_notification_events_for_all_users()
+        NotificationEvent.objects.filter(schedule__calendar_event_type=CalendarEventType.VACCINATION).delete()
+        self.set_mock_time(datetime(2021, 6, 7, 10, 30, 0, tzinfo=pytz.UTC))
+        NotificationSchedule.objects.get(calendar_event_type=CalendarEventType.VACCINATION).save()
+        second_run = generate_notification_events_for_all_users()
+        self.assertEqual(1, second_run.inserted)
+
+    def test_lookahead_creates_events_before_their_window(self):
+        now = datetime(2021, 6, 5, 10, 0, 0, tzinfo=pytz.UTC)
+        self.set_mock_time(now)
+        run_generation([make_notification_artifact(lookahead=timedelta(hours=48))])
+        self.assertEqual(
+            [datetime(2021, 6, 6, 10, 0, 0, tzinfo=pytz.UTC), datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC)],
+            list(NotificationEvent.objects.order_by('notification_available_at')
+                 .values_list('notification_available_at', flat=True)),
+        )
+        self.assertEqual(now + timedelta(hours=48),
+                         JobWatermark.objects.get_generated_until('generate_notifications'))
+
+    def test_incremental_lookahead_run_only_evaluates_windows_beyond_previous_run(self):
+        self.set_mock_time(datetime(2021, 6, 5, 10, 0, 0, tzinfo=pytz.UTC))
+        run_generation([make_notification_artifact(lookahead=timedelta(hours=24))])
+        self.assertEqual(1, NotificationEvent.objects.count())
+        self.set_mock_time(datetime(2021, 6, 6, 10, 0, 0, tzinfo=pytz.UTC))
+        second_run = run_generation([make_notification_artifact(lookahead=timedelta(hours=24))])
+        self.assertEqual((1, 0), second_run.counts['generate_notifications'])
+        self.set_mock_time(datetime(2021, 6, 6, 11, 0, 0, tzinfo=pytz.UTC))
+        third_run = run_generation([make_notification_artifact()])
+        self.assertEqual((0, 0), third_run.counts['generate_notifications'])
+
+    def get_notification_windows(self):
+        return list(NotificationEvent.objects.order_by('notification_available_at')
+                    .values_list('event_key', 'notification_available_at'))
+
+    def test_deleted_pregnancy_gets_no_push_generated_ahead(self):
+        self.set_mock_time(datetime(2021, 6, 5, 10, 0, 0, tzinfo=pytz.UTC))
+        run_generation([make_notification_artifact(lookahead=timedelta(hours=48))])
+        self.assertEqual(2, NotificationEvent.objects.count())
+        self.pregnancy.delete()
+        self.set_mock_time(datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC))
+        run_generation([make_notification_artifact(lookahead=timedelta(hours=48))])
+        PushDispatcher().dispatch_due()
+        self.assertEqual([], list(NotificationEvent.objects.filter(event_key__startswith='prenatal-checkup/')))
+        self.assertEqual(1, hera.thirdparties.onesignal_client.send_notification.call_count)
+        self.assertEqual(1, NotificationEvent.objects.filter(push_notification_sent_at__isnull=False).count())
+
+    def test_edited_schedule_replaces_events_generated_ahead(self):
+        self.set_mock_time(datetime(2021, 6, 5, 10, 0, 0, tzinfo=pytz.UTC))
+        run_generation([make_notification_artifact(lookahead=timedelta(hours=48))])
+        self.set_mock_time(datetime(2021, 6, 5, 10, 30, 0, tzinfo=pytz.UTC))
+        schedule = NotificationSchedule.objects.get(calendar_event_type=CalendarEventType.VACCINATION)
+        schedule.time_of_day = time(12, 0)
+        schedule.save()
+        self.assertEqual(1, NotificationEvent.objects.count())
+        self.set_mock_time(datetime(2021, 6, 5, 11, 0, 0, tzinfo=pytz.UTC))
+        run_generation([make_notification_artifact(lookahead=timedelta(hours=48))])
+        self.assertEqual(datetime(2021, 6, 6, 12, 0, 0, tzinfo=pytz.UTC), self.get_notification_windows()[0][1])
+        self.assertEqual(2, NotificationEvent.objects.count())
+
+    def test_vaccine_catalog_change_withdraws_vaccinations_generated_ahead(self):
+        self.set_mock_time(datetime(2021, 6, 5, 10, 0, 0, tzinfo=pytz.UTC))
+        run_generation([make_notification_artifact(lookahead=timedelta(hours=48))])
+        self.set_mock_time(datetime(2021, 6, 5, 11, 0, 0, tzinfo=pytz.UTC))
+        Vaccine.objects.filter(pk=self.universal_vaccine.pk).update(is_active=False,
+                                                                    updated_at=django.utils.timezone.now())
+        rebuild_stale_vaccination_calendar_events()
+        run_generation([make_notification_artifact(lookahead=timedelta(hours=48))])
+        self.assertEqual(['prenatal-checkup'], [key.split('/')[0] for key, _ in self.get_notification_windows()])
+
+    def test_timezone_change_replaces_events_generated_ahead(self):
+        self.set_mock_time(datetime(2021, 6, 5, 10, 0, 0, tzinfo=pytz.UTC))
+        run_generation([make_notification_artifact(lookahead=timedelta(hours=48))])
+        before = self.get_notification_windows()
+        self.set_mock_time(datetime(2021, 6, 5, 10, 30, 0, tzinfo=pytz.UTC))
+        self.user_profile.timezone = 'Asia/Kathmandu'
+        self.user_profile.save()
+        self.assertFalse(NotificationEvent.objects.exists())
+        self.set_mock_time(datetime(2021, 6, 5, 11, 0, 0, tzinfo=pytz.UTC))
+        run_generation([make_notification_artifact(lookahead=timedelta(hours=48))])
+        kathmandu_offset = timedelta(hours=5, minutes=45)
+        self.assertEqual([(event_key, available_at - kathmandu_offset) for event_key, available_at in before],
+                         self.get_notification_windows())
+
+
+class OpenWindowEvaluationTests(TestCase):
+    def setUp(self) -> None:
+        self.users = []
+        for timezone_name in ['UTC', 'America/New_York', 'Asia/Kathmandu', 'Australia/Lord_Howe']:
+            user = User.objects.create(username=timezone_name)
+            UserProfile.objects.create(
+                user=user,
+                name='name',
+                gender=UserProfile.Gender.FEMALE,
+                date_of_birth=date(1990, 1, 1),
+                agree_to_terms_at=datetime(2020, 1, 1, tzinfo=pytz.UTC),
+                language_code=UserProfile.LanguageCode.EN,
+                timezone=timezone_name,
+            )
+            self.users.append(user)
+        notification_type = NotificationType(code='code', description='description')
+        # Around the daylight saving changes of New York (March 14th) and Lord Howe Island (April 4th)
+        self.schedules = [
+            NotificationSchedule(notification_type=notification_type, offset_days=offset_days,
+                                 calendar_event_type=CalendarEventType.PRENATAL_CHECKUP, time_of_day=time_of_day,
+                                 push_time_to_live=push_time_to_live)
+            for offset_days, time_of_day, push_time_to_live in [
+                (-7, time(10, 0), timedelta(hours=1)),
+                (0, time(2, 30), timedelta(hours=2)),
+                (0, time(23, 0), timedelta(days=1)),
+                (1, time(0, 0), timedelta(minutes=30)),
+            ]
+        ]
+        self.events = [
+            PrenatalCheckupEvent(Pregnancy(id=day), date(2021, 3, 1) + timedelta(days=day), 10)
+            for day in range(0, 40)
+        ]
+
+    def get_expected_pairs(self, now: datetime) -> set:
+        return {
+            (user.username, notification_event.event_key, self.schedules.index(notification_event.schedule))
+            for user in self.users
+            for event in self.events
+            for notification_event in generate_notification_events_for_calendar_event(user, self.schedules, event,
+                                                                                      now=now)
+        }
+
+    def get_open_window_pairs(self, now: datetime) -> set:
+        evaluations = [(user, self.events, self.schedules, None) for user in self.users]
+        return {
+            (user.username, notification_event.event_key, self.schedules.index(notification_event.schedule))
+            for user, schedules_by_event, _ in generate_open_windows(evaluations, 'push_time_to_live', now,
+                                                                     batch_size=50)
+            for event, event_schedules in schedules_by_event
+            for notification_event in generate_notification_events_for_calendar_event(user, event_schedules, event,
+                                                                                      now=now)
+        }
+
+    def test_open_windows_match_evaluating_every_pair(self):
+        start = datetime(2021, 3, 12, 0, 15, 0, tzinfo=pytz.UTC)
+        matched = 0
+        for hours in range(0, 24 * 28, 5):
+            now = start + timedelta(hours=hours)
+            with self.subTest(now=now):
+                expected = self.get_expected_pairs(now)
+                self.assertEqual(expected, self.get_open_window_pairs(now))
+                matched += len(expected)
+        self.assertGreater(matched, 50)
+
+    def test_find_open_windows_honours_available_after(self):
+        schedule_arrays = get_schedule_arrays(self.schedules[:1], 'push_time_to_live')
+        event_days = np.array([0, 1], dtype=np.int64)
+        event_type_codes = np.full(2, EVENT_TYPE_CODES[CalendarEventType.PRENATAL_CHECKUP.value], dtype=np.int64)
+        utc_offsets = np.zeros(2, dtype=np.int64)
+        # Windows of 10:00 to 11:00, 7 days before January 1st and 2nd 1970
+        now = -6 * 24 * 3600 + 10 * 3600 + 1800
+        event_indexes, _ = find_open_windows(event_days, event_type_codes, utc_offsets, schedule_arrays, now)
+        self.assertEqual([1], event_indexes.tolist())
+        event_indexes, _ = find_open_windows(event_days, event_type_codes, utc_offsets, schedule_arrays, now,
+                                             available_after=now)
+        self.assertEqual([], event_indexes.tolist())
+
+    def test_benchmark_command_agrees_with_one_by_one_evaluation(self):
+        output, errors = StringIO(), StringIO()
+        call_command('benchmark_open_windows', events=2000, schedules=20, stdout=output, stderr=errors)
+        self.assertIn('40000 pairs', output.getvalue())
+        self.assertEqual('', errors.getvalue())
+
+
+class CalendarEventViewTests(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(
+            username='username',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        mock_now = datetime(2021, 6, 1, 0, 0, 0, tzinfo=pytz.UTC)
+        timezone_now_patcher = patch.object(django.utils.timezone, 'now', return_value=mock_now)
+        timezone_now_patcher.start()
+        self.addCleanup(timezone_now_patcher.stop)
+        self.vaccine = Vaccine.objects.create(
+            name='universal_vaccine',
+            nickname='UniVax',
+            applicable_for_male=True,
+            applicable_for_female=True,
+            is_active=True,
+        )
+        self.vaccine.vaccinedose_set.create(
+            name="first dose",
+            week_age=0,
+        )
+        self.vaccine.vaccinedose_set.create(
+            name="second dose",
+            week_age=4,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pregnancy = Pregnancy.objects.create(
+                user=self.user,
+                declared_pregnancy_week=10,
+                declared_number_of_prenatal_visits=0,
+            )
+            self.child = Child.objects.create(
+                user=self.user,
+                name='child',
+                date_of_birth=date(2021, 6, 6),
+                gender=Child.ChildGender.MALE,
+            )
+
+    def get_calendar_keys(self):
+        return list(CalendarEvent.objects.filter(user=self.user).order_by('date', 'id').values_list('event_key', flat=True))
+
+    def test_calendar_events_are_materialized_on_write(self):
+        expected = [e.get_event_key() for e in generate_calendar_events_for_user(self.user)]
+        self.assertEqual(6, len(expected))
+        self.assertEqual(expected, self.get_calendar_keys())
+
+    def test_calendar_endpoint_matches_generated_calendar(self):
+        expected = [e.to_dictionary() for e in generate_calendar_events_for_user(self.user)]
+        response = self.client.get('/calendar_events/')
+        self.assertEqual(200, response.status_code)
+        self.assertJSONEqual(response.content, json.loads(JSONRenderer().render(expected)))
+
+    def test_calendar_endpoint_filters_match_generated_calendar(self):
+        filters = [
+            {'date_from': date(2021, 6, 6), 'date_to': date(2021, 9, 1)},
+            {'date_from': date(2021, 7, 1)},
+            {'date_to': date(2021, 7, 4)},
+            {'child_id': self.child.id},
+            {'pregnancy_id': self.pregnancy.id, 'date_to': date(2021, 12, 31)},
+            {'child_id': self.child.id, 'pregnancy_id': self.pregnancy.id},
+        ]
+        for kwargs in filters:
+            with self.subTest(**kwargs):
+                params = {
+                    {'date_from': 'from', 'date_to': 'to'}.get(key, key): value for key, value in kwargs.items()
+                }
+                expected = [e.to_dictionary() for e in generate_calendar_events_for_user(self.user, **kwargs)]
+                self.assertNotEqual(0, len(expected))
+                self.assertLess(len(expected), 7)
+                response = self.client.get('/calendar_events/', params)
+                self.assertEqual(200, response.status_code)
+                self.assertJSONEqual(response.content, json.loads(JSONRenderer().render(expected)))
+
+    def test_calendar_endpoint_filter_by_child_leaves_out_prenatal_checkups(self):
+        response = self.client.get('/calendar_events/', {'child_id': self.child.id})
+        self.assertEqual(['vaccination', 'vaccination'], [e['event_type'] for e in response.data])
+
+    def test_calendar_endpoint_rejects_invalid_filters(self):
+        for params in [{'from': 'yesterday'}, {'child_id': 'x'}, {'from': '2021-07-01', 'to': '2021-06-01'}]:
+            with self.subTest(**params):
+                response = self.client.get('/calendar_events/', params)
+                self.assertEqual(400, response.status_code)
+
+    def test_calendar_endpoint_reads_materialized_rows(self):
+        # user profile, version, catalog version, calendar version, calendar rows
+        with self.assertNumQueries(5):
+            response = self.client.get('/calendar_events/')
+        self.assertEqual(6, len(response.data))
+
+    def test_calendar_endpoint_answers_not_modified_until_calendar_changes(self):
+        etag = self.client.get('/calendar_events/')['ETag']
+        # version, catalog version
+        with self.assertNumQueries(2):
+            response = self.client.get('/calendar_events/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b'', response.content)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.child.delete()
+        response = self.client.get('/calendar_events/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+
+    def test_calendar_endpoint_builds_missing_calendar(self):
+        CalendarEvent.objects.all().delete()
+        self.user.usercalendar.delete()
+        response = self.client.get('/calendar_events/')
+        self.assertEqual(6, len(response.data))
+
+    def test_deleted_child_is_removed_from_calendar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.child.delete()
+        self.assertFalse(CalendarEvent.objects.filter(event_type=CalendarEventType.VACCINATION).exists())
+
+    def test_vaccine_catalog_change_rebuilds_vaccination_events(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.vaccine.vaccinedose_set.create(
+                name="third dose",
+                week_age=8,
+            )
+        self.assertEqual([], callbacks)
+        output = StringIO()
+        call_command('generate_notifications_and_surveys', stdout=output)
+        self.assertIn('Rebuilt 1 calendars for the changed vaccine catalog', output.getvalue())
+        self.assertEqual(3, CalendarEvent.objects.filter(event_type=CalendarEventType.VACCINATION).count())
+        self.assertEqual([e.get_event_key() for e in generate_calendar_events_for_user(self.user)], self.get_calendar_keys())
+
+    def test_calendar_endpoint_rebuilds_calendar_of_older_vaccine_catalog(self):
+        etag = self.client.get('/calendar_events/')['ETag']
+        # As the admin actions do, with update() rather than save()
+        Vaccine.objects.filter(pk=self.vaccine.pk).update(is_active=False, updated_at=datetime(2021, 6, 2, tzinfo=pytz.UTC))
+        response = self.client.get('/calendar_events/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['prenatal_checkup'], list({e['event_type'] for e in response.data}))
+        self.assertFalse(CalendarEvent.objects.filter(event_type=CalendarEventType.VACCINATION).exists())
+
+    def test_deleting_user_does_not_rebuild_calendar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertFalse(CalendarEvent.objects.exists())
+
+
+class FakeOneSignalClient:
+    """
+    Stands in for hera.thirdparties.onesignal_client. Answers 200 unless told otherwise with `fail_next`.
+    """
+    def __init__(self):
+        self.sent_notifications = []
+        self.queued_responses = []
+
+    def fail_next(self, status_code: int, body: dict = None):
+        self.queued_responses.append((status_code, body if body is not None else {'errors': ['failure']}))
+
+    def send_notification(self, notification_body: dict) -> OneSignalResponse:
+        status_code, body = self.queued_responses.pop(0) if len(self.queued_responses) > 0 else (200, {'id': 'id'})
+        response = httpx.Response(status_code, json=body)
+        if status_code >= 400:
+            raise OneSignalHTTPError(response)
+        self.sent_notifications.append(notification_body)
+        return OneSignalResponse(response)
+
+
+class PushDispatcherTests(TestCase):
+    def setUp(self) -> None:
+        self.onesignal = FakeOneSignalClient()
+        onesignal_patcher = patch.object(hera.thirdparties, 'onesignal_client', self.onesignal)
+        onesignal_patcher.start()
+        self.addCleanup(onesignal_patcher.stop)
+        self.now = datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC)
+        self.set_mock_time(self.now)
+        self.user = self.create_user('username')
+        self.notification_type = NotificationType.objects.create(
+            code='instant.announcement',
+            description='description',
+        )
+        NotificationTemplate.objects.create(
+            notification_type=self.notification_type,
+            language_code=LanguageCode.ENGLISH,
+            push_title='title',
+            push_body='body',
+            in_app_content='content',
+        )
+
+    def set_mock_time(self, mock_time: datetime) -> None:
+        timezone_now_patcher = patch.object(django.utils.timezone, 'now', return_value=mock_time)
+        timezone_now_patcher.start()
+        self.addCleanup(timezone_now_patcher.stop)
+
+    def create_user(self, username: str) -> User:
+        user = User.objects.create(
+            username=username,
+        )
+        UserProfile.objects.create(
+            user=user,
+            name='name',
+            gender=UserProfile.Gender.MALE,
+            date_of_birth=date(1990, 1, 1),
+            agree_to_terms_at=datetime(2020, 1, 1, tzinfo=pytz.UTC),
+            language_code=UserProfile.LanguageCode.EN,
+            timezone='UTC',
+        )
+        return user
+
+    def create_notification_event(self, available_at: datetime, expires_at: datetime, user: User = None) -> \
+            NotificationEvent:
+        return NotificationEvent.objects.create(
+            user=user if user is not None else self.user,
+            notification_type=self.notification_type,
+            notification_available_at=available_at,
+            notification_expires_at=expires_at,
+        )
+
+    def test_saving_notification_event_does_not_call_onesignal(self):
+        self.create_notification_event(self.now, self.now + timedelta(days=1))
+        self.assertEqual([], self.onesignal.sent_notifications)
+
+    def test_due_notification_event_is_sent_once(self):
+        notification_event = self.create_notification_event(self.now, self.now + timedelta(days=1))
+        first_result = PushDispatcher().dispatch_due()
+        second_result = PushDispatcher().dispatch_due()
+        notification_event.refresh_from_db()
+        self.assertEqual((1, 0, 0), first_result)
+        self.assertEqual((0, 0, 0), second_result)
+        self.assertEqual(self.now, notification_event.push_notification_sent_at)
+        self.assertEqual(['username'], self.onesignal.sent_notifications[0]['include_external_user_ids'])
+
+    def test_notification_events_outside_their_window_are_not_sent(self):
+        self.create_notification_event(self.now + timedelta(hours=1), self.now + timedelta(days=1))
+        self.create_notification_event(self.now - timedelta(days=1), self.now - timedelta(hours=1))
+        self.assertEqual((0, 0, 0), PushDispatcher().dispatch_due())
+
+    def test_server_error_is_retried_with_backoff(self):
+        notification_event = self.create_notification_event(self.now, self.now + timedelta(days=1))
+        self.onesignal.fail_next(503)
+        self.assertEqual((0, 1, 0), PushDispatcher().dispatch_due())
+        notification_event.refresh_from_db()
+        self.assertEqual(self.now + timedelta(seconds=30), notification_event.push_next_attempt_at)
+        self.assertEqual((0, 0, 0), PushDispatcher().dispatch_due())
+        self.set_mock_time(self.now + timedelta(seconds=30))
+        self.assertEqual((1, 0, 0), PushDispatcher().dispatch_due())
+        notification_event.refresh_from_db()
+        self.assertEqual(2, notification_event.push_attempts)
+
+    def test_push_is_dead_lettered_after_max_attempts(self):
+        notification_event = self.create_notification_event(self.now, self.now + timedelta(days=1))
+        self.onesignal.fail_next(503)
+        self.onesignal.fail_next(503)
+        PushDispatcher(max_attempts=2).dispatch_due()
+        self.set_mock_time(self.now + timedelta(minutes=1))
+        self.assertEqual((0, 0, 1), PushDispatcher(max_attempts=2).dispatch_due())
+        notification_event.refresh_from_db()
+        self.assertIsNotNone(notification_event.push_failed_at)
+        self.assertIsNone(notification_event.push_notification_sent_at)
+
+    def test_unsubscribed_user_is_dead_lettered_without_retry(self):
+        notification_event = self.create_notification_event(self.now, self.now + timedelta(days=1))
+        self.onesignal.fail_next(400, {'errors': ['All included players are not subscribed']})
+        self.assertEqual((0, 0, 1), PushDispatcher().dispatch_due())
+        notification_event.refresh_from_db()
+        self.assertEqual('HTTP 400: All included players are not subscribed', notification_event.push_last_error)
+
+    def test_dispatch_command_reports_result(self):
+        self.create_notification_event(self.now, self.now + timedelta(days=1))
+        self.create_notification_event(self.now, self.now + timedelta(days=1))
+        output = StringIO()
+        call_command('dispatch_push_notifications', concurrency=2, stdout=output)
+        self.assertIn('2 sent', output.getvalue())
+        self.assertEqual(2, len(self.onesignal.sent_notifications))
+
+    def test_identical_pushes_are_sent_in_one_request(self):
+        other_user = self.create_user('other_username')
+        self.create_notification_event(self.now, self.now + timedelta(days=1))
+        self.create_notification_event(self.now, self.now + timedelta(days=1), user=other_user)
+        self.assertEqual((2, 0, 0), PushDispatcher().dispatch_due())
+        self.assertEqual(1, len(self.onesignal.sent_notifications))
+        self.assertEqual(['username', 'other_username'],
+                         self.onesignal.sent_notifications[0]['include_external_user_ids'])
+
+    def test_push_groups_are_split_at_recipient_limit(self):
+        other_user = self.create_user('other_username')
+        self.create_notification_event(self.now, self.now + timedelta(days=1))
+        self.create_notification_event(self.now, self.now + timedelta(days=1), user=other_user)
+        self.assertEqual((2, 0, 0), PushDispatcher(max_recipients=1).dispatch_due())
+        self.assertEqual(2, len(self.onesignal.sent_notifications))
+
+    def test_unreachable_recipient_does_not_fail_the_group(self):
+        other_user = self.create_user('other_username')
+        sent_event = self.create_notification_event(self.now, self.now + timedelta(days=1))
+        failed_event = self.create_notification_event(self.now, self.now + timedelta(days=1), user=other_user)
+        self.onesignal.queued_responses.append((200, {
+            'id': 'id',
+            'errors': {'invalid_external_user_ids': ['other_username']},
+        }))
+        self.assertEqual((1, 0, 1), PushDispatcher().dispatch_due())
+        sent_event.refresh_from_db()
+        failed_event.refresh_from_db()
+        self.assertIsNotNone(sent_event.push_notification_sent_at)
+        self.assertIsNotNone(failed_event.push_failed_at)
+
+
+class NotificationTemplateCacheTests(TestCase):
+    def setUp(self) -> None:
+        compiled_templates.clear()
+        notification_type = NotificationType.objects.create(
+            code='vaccination.on_the_day',
+            description='description',
+        )
+        self.template = NotificationTemplate.objects.create(
+            notification_type=notification_type,
+            language_code=LanguageCode.ENGLISH,
+            push_title='Hello {{ person_name }}',
+            push_body='body',
+            in_app_content='content',
+        )
+
+    def test_template_is_parsed_once_for_many_instances(self):
+        with patch('hera.liquid.Template', wraps=hera.liquid.Template) as template_class:
+            for _ in range(3):
+                NotificationTemplate.objects.get(pk=self.template.pk).rendered_push_title({'person_name': 'Ali'})
+        self.assertEqual(1, template_class.call_count)
+
+    def test_saved_template_is_parsed_again(self):
+        self.assertEqual('Hello Ali', self.template.rendered_push_title({'person_name': 'Ali'}))
+        self.template.push_title = 'Hi {{ person_name }}'
+        self.template.save()
+        self.assertEqual(0, len(compiled_templates))
+        self.assertEqual('Hi Ali', self.template.rendered_push_title({'person_name': 'Ali'}))
+
+
+class NotificationEventViewTests(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(
+            username='username',
+        )
+        UserProfile.objects.create(
+            user=self.user,
+            name='name',
+            gender=UserProfile.Gender.MALE,
+            date_of_birth=date(1990, 1, 1),
+            agree_to_terms_at=datetime(2020, 1, 1, tzinfo=pytz.UTC),
+            language_code=UserProfile.LanguageCode.EN,
+            timezone='UTC',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.notification_types = [
+            NotificationType.objects.create(code=f"notification.type_{i}", description='description')
+            for i in range(3)
+        ]
+        for notification_type in self.notification_types:
+            NotificationTemplate.objects.create(
+                notification_type=notification_type,
+                language_code=LanguageCode.ENGLISH,
+                push_title=f"{notification_type.code} {{{{ person_name }}}}",
+                push_body='body',
+                in_app_content='content',
+            )
+        NotificationTemplate.objects.create(
+            notification_type=self.notification_types[0],
+            language_code=LanguageCode.TURKISH,
+            push_title='Turkish title',
+            push_body='body',
+            in_app_content='content',
+        )
+
+    def create_notification_events(self, count: int):
+        now = datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC)
+        for i in range(count):
+            NotificationEvent.objects.create(
+                user=self.user,
+                notification_type=self.notification_types[i % len(self.notification_types)],
+                context={'person_name': f"child {i}"},
+                notification_available_at=now,
+                notification_expires_at=now + timedelta(days=1),
+            )
+
+    def test_list_reads_stored_text_in_one_query(self):
+        self.create_notification_events(30)
+        # version, notification events
+        with self.assertNumQueries(2):
+            response = self.client.get('/notification_events/')
+        self.assertEqual(30, len(response.data))
+        self.assertIn('notification.type_1 child 1', [e['push_title'] for e in response.data])
+
+    def test_list_falls_back_to_english(self):
+        self.user.userprofile.language_code = UserProfile.LanguageCode.TR
+        self.user.userprofile.save()
+        self.create_notification_events(2)
+        response = self.client.get('/notification_events/')
+        self.assertEqual({'Turkish title', 'notification.type_1 child 1'}, {e['push_title'] for e in response.data})
+
+    def test_list_pages_by_cursor_when_page_size_given(self):
+        self.create_notification_events(5)
+        other_user = User.objects.create(username='other')
+        NotificationEvent.objects.create(
+            user=other_user,
+            notification_type=self.notification_types[0],
+            context={'person_name': 'other'},
+            notification_available_at=datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC),
+            notification_expires_at=datetime(2021, 6, 8, 10, 0, 0, tzinfo=pytz.UTC),
+        )
+        expected_ids = list(NotificationEvent.objects.filter(user=self.user).order_by('-id').values_list('id', flat=True))
+        response = self.client.get('/notification_events/', {'page_size': 2})
+        ids = [e['id'] for e in response.data['results']]
+        while response.data['next'] is not None:
+            response = self.client.get(response.data['next'])
+            ids += [e['id'] for e in response.data['results']]
+        self.assertEqual(expected_ids, ids)
+
+    def test_list_cursor_is_stable_when_events_are_added(self):
+        self.create_notification_events(3)
+        first_page = self.client.get('/notification_events/', {'page_size': 2})
+        self.create_notification_events(2)
+        second_page = self.client.get(first_page.data['next'])
+        first_id = NotificationEvent.objects.order_by('id').first().id
+        self.assertEqual([first_id], [e['id'] for e in second_page.data['results']])
+        self.assertIsNone(second_page.data['next'])
+
+    def test_mark_all_as_read_moves_watermark_without_touching_events(self):
+        self.create_notification_events(3)
+        self.assertEqual(3, self.client.get('/notification_events/unread_count/').data['unread_count'])
+        with patch.object(django.utils.timezone, 'now', return_value=datetime(2021, 6, 8, tzinfo=pytz.UTC)):
+            self.client.post('/notification_events/mark_all_as_read/')
+        self.assertFalse(NotificationEvent.objects.filter(read_at__isnull=False).exists())
+        response = self.client.get('/notification_events/')
+        self.assertEqual({'2021-06-08T00:00:00Z'}, {e['read_at'] for e in response.data})
+        # version, count
+        with self.assertNumQueries(2):
+            response = self.client.get('/notification_events/unread_count/')
+        self.assertEqual(0, response.data['unread_count'])
+        self.create_notification_events(1)
+        self.assertEqual(1, self.client.get('/notification_events/unread_count/').data['unread_count'])
+
+    def test_list_answers_not_modified_until_read(self):
+        self.create_notification_events(3)
+        etag = self.client.get('/notification_events/')['ETag']
+        self.assertEqual(304, self.client.get('/notification_events/', HTTP_IF_NONE_MATCH=etag).status_code)
+        self.client.post('/notification_events/mark_all_as_read/')
+        self.assertEqual(200, self.client.get('/notification_events/', HTTP_IF_NONE_MATCH=etag).status_code)
+
+    def test_mark_as_read_overrides_watermark_for_one_event(self):
+        self.create_notification_events(3)
+        self.client.post('/notification_events/mark_all_as_read/')
+        self.create_notification_events(2)
+        notification_event = NotificationEvent.objects.order_by('id').last()
+        response = self.client.post(f"/notification_events/{notification_event.id}/mark_as_read/")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, self.client.get('/notification_events/unread_count/').data['unread_count'])
+        read_at = {e['id']: e['read_at'] for e in self.client.get('/notification_events/').data}
+        self.assertIsNotNone(read_at[notification_event.id])
+        self.assertIsNone(read_at[notification_event.id - 1])
+
+    def test_list_hides_events_until_available(self):
+        self.create_notification_events(2)
+        with patch.object(django.utils.timezone, 'now', return_value=datetime(2021, 6, 7, 9, 0, 0, tzinfo=pytz.UTC)):
+            response = self.client.get('/notification_events/')
+            self.assertEqual([], response.data)
+            self.assertEqual(0, self.client.get('/notification_events/unread_count/').data['unread_count'])
+        etag = response['ETag']
+        with patch.object(django.utils.timezone, 'now', return_value=datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC)):
+            response = self.client.get('/notification_events/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, len(response.data))
+
+    def test_mark_all_as_read_leaves_events_available_later_unread(self):
+        now = datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC)
+        later_event = NotificationEvent.objects.create(
+            user=self.user,
+            notification_type=self.notification_types[0],
+            notification_available_at=now + timedelta(days=1),
+            notification_expires_at=now + timedelta(days=2),
+        )
+        self.create_notification_events(1)
+        with patch.object(django.utils.timezone, 'now', return_value=now):
+            self.client.post('/notification_events/mark_all_as_read/')
+        with patch.object(django.utils.timezone, 'now', return_value=now + timedelta(days=1)):
+            self.assertEqual(1, self.client.get('/notification_events/unread_count/').data['unread_count'])
+            read_at = {e['id']: e['read_at'] for e in self.client.get('/notification_events/').data}
+        self.assertIsNone(read_at[later_event.id])
+        self.assertEqual(2, len(read_at))
+
+    def test_rerender_command_applies_fixed_template(self):
+        self.create_notification_events(3)
+        NotificationTemplate.objects.filter(notification_type=self.notification_types[0]).update(push_body='fixed body')
+        output = StringIO()
+        call_command('rerender_notification_events', notification_types=['notification.type_0'], stdout=output)
+        self.assertIn('Re-rendered 1 notification events', output.getvalue())
+        self.assertEqual(
+            ['fixed body', 'body', 'body'],
+            list(NotificationEvent.objects.order_by('id').values_list('push_body', flat=True)),
+        )
+
+
+class InstantNotificationTests(TestCase):
+    def setUp(self) -> None:
+        self.now = datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC)
+        timezone_now_patcher = patch.object(django.utils.timezone, 'now', return_value=self.now)
+        timezone_now_patcher.start()
+        self.addCleanup(timezone_now_patcher.stop)
+        self.notification_type = NotificationType.objects.create(code='instant.announcement', description='description')
+        NotificationTemplate.objects.create(
+            notification_type=self.notification_type,
+            language_code=LanguageCode.ENGLISH,
+            push_title='title',
+            push_body='body',
+            in_app_content='content',
+        )
+        self.phone_numbers = [f"+659000000{i}" for i in range(3)]
+        for phone_number in self.phone_numbers:
+            user = User.objects.create(username=phone_number)
+            UserProfile.objects.create(
+                user=user,
+                name='name',
+                gender=UserProfile.Gender.MALE,
+                date_of_birth=date(1990, 1, 1),
+                agree_to_terms_at=datetime(2020, 1, 1, tzinfo=pytz.UTC),
+                language_code=UserProfile.LanguageCode.EN,
+                timezone='UTC',
+            )
+        User.objects.create(username='+6591111111')
+
+    def test_fan_out_creates_rendered_events_with_constant_queries(self):
+        # savepoint, insert, select users, select templates, 2 bulk inserts, release savepoint
+        with self.assertNumQueries(7):
+            instant_notification = InstantNotification.objects.create(
+                phone_numbers=self.phone_numbers + self.phone_numbers[:1],
+                notification_type=self.notification_type,
+            )
+        notification_events = NotificationEvent.objects.filter(instant_notification=instant_notification)
+        self.assertEqual(set(self.phone_numbers), {e.user.username for e in notification_events})
+        self.assertEqual({'title'}, {e.push_title for e in notification_events})
+        self.assertEqual({self.now + timedelta(days=1)}, {e.notification_expires_at for e in notification_events})
+
+    def test_fan_out_records_result_of_every_phone_number(self):
+        instant_notification = InstantNotification.objects.create(
+            phone_numbers=[self.phone_numbers[0], '+6591111111', '+6592222222'],
+            notification_type=self.notification_type,
+        )
+        self.assertEqual(
+            [
+                (self.phone_numbers[0], InstantNotificationRecipient.Result.QUEUED),
+                ('+6591111111', InstantNotificationRecipient.Result.NO_PROFILE),
+                ('+6592222222', InstantNotificationRecipient.Result.UNKNOWN_USER),
+            ],
+            list(instant_notification.instantnotificationrecipient_set.order_by('id')
+                 .values_list('phone_number', 'result')),
+        )
+        self.assertEqual(1, NotificationEvent.objects.count())
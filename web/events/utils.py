@@ -1,40 +1,164 @@
 import heapq
-from collections.abc import Iterator
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterable, Iterator
+from datetime import date, datetime, timedelta
+from typing import NamedTuple, Optional
 
 import django.utils.timezone
 import pytz
 from django.contrib.auth.models import User
-from django.db import IntegrityError
+from django.db import models, transaction
+from django.db.models import Max, OuterRef, Q, QuerySet, Subquery
 
-from child_health.events import generate_calendar_events_for_user
-from events.models import NotificationEvent, NotificationSchedule
+from child_health.catalog import VaccineCatalog, get_vaccine_catalog
+from child_health.events import VACCINATION_EVENT_KEY_PREFIX, CalendarSelection, \
+    generate_calendar_events_for_selections, generate_calendar_events_for_subjects, generate_calendar_events_for_user, \
+    generate_vaccination_events_for_child, has_vaccine_catalog_changed_since
+from child_health.models import Child, Pregnancy
+from events.constants import CalendarEventType
+from events.models import CalendarEvent, InstantNotification, InstantNotificationRecipient, NotificationEvent, \
+    NotificationSchedule, NotificationTemplate, UserCalendar
 from events.protocols import CalendarEventProtocol
+from events.resolvers import NotificationTemplateResolver
+from hera.bulk import BulkWriterGroup, ConflictIgnoringBulkWriter
+from hera.sharding import Shard, filter_shard
+from hera.windows import generate_open_windows
 import hera.thirdparties
+from infra.models import JobWatermark
+
+
+NOTIFICATION_GENERATION_JOB_NAME = 'generate_notifications'
+INSTANT_NOTIFICATION_TIME_TO_LIVE = timedelta(days=1)
+
+
+class FanOutResult(NamedTuple):
+    queued: int
+    unknown_user: int
+    no_profile: int
 
 
 def generate_all_calendar_events_for_user(user: User) -> Iterator[CalendarEventProtocol]:
     return generate_calendar_events_for_user(user)
 
 
+def make_calendar_event_row(user_id: int, event: CalendarEventProtocol) -> CalendarEvent:
+    event_dict = event.to_dictionary()
+    return CalendarEvent(
+        user_id=user_id,
+        event_type=event_dict['event_type'],
+        date=event_dict['date'],
+        event_key=event.get_event_key(),
+        context=event_dict,
+    )
+
+
+def rebuild_calendar_events_for_user(user: User, catalog: VaccineCatalog = None):
+    """
+    Replaces the user's materialized CalendarEvent rows with freshly generated ones.
+    """
+    if catalog is None:
+        catalog = get_vaccine_catalog()
+    calendar_events = generate_calendar_events_for_subjects(user.pregnancy_set.all(), user.child_set.all(), catalog)
+    rows = [make_calendar_event_row(user.id, e) for e in calendar_events]
+    with transaction.atomic():
+        CalendarEvent.objects.filter(user=user).delete()
+        CalendarEvent.objects.bulk_create(rows)
+        UserCalendar.objects.update_or_create(user=user, defaults={
+            'vaccine_catalog_version': catalog.version,
+            'last_event_date': max((row.date for row in rows), default=None),
+        })
+
+
+def rebuild_calendar_events_for_user_id(user_id: int):
+    user = User.objects.filter(pk=user_id).first()
+    # The user may have been deleted along with the pregnancy or child that triggered the rebuild
+    if user is not None:
+        rebuild_calendar_events_for_user(user)
+
+
+def rebuild_stale_vaccination_calendar_events(batch_size=500) -> int:
+    """
+    Regenerates every child's vaccination CalendarEvent rows when some calendar was built from an older version of
+    the vaccine catalog, and returns the number of calendars brought up to date. Users without a calendar yet are
+    built in full on their first read. Run by the generation job rather than on the admin edit that changed the
+    catalog; in the meantime, reads rebuild stale calendars one by one.
+    """
+    catalog = get_vaccine_catalog()
+    if not UserCalendar.objects.exclude(vaccine_catalog_version=catalog.version).exists():
+        return 0
+    with transaction.atomic():
+        CalendarEvent.objects.filter(event_type=CalendarEventType.VACCINATION).delete()
+        rows = []
+        for child in Child.objects.order_by('id').iterator(chunk_size=batch_size):
+            calendar_events = generate_vaccination_events_for_child(child, catalog)
+            rows += [make_calendar_event_row(child.user_id, e) for e in calendar_events]
+            if len(rows) >= batch_size:
+                CalendarEvent.objects.bulk_create(rows)
+                rows = []
+        CalendarEvent.objects.bulk_create(rows)
+        last_event_dates = CalendarEvent.objects.filter(user=OuterRef('user')).values('user').annotate(
+            last_event_date=Max('date'),
+        ).values('last_event_date')
+        return UserCalendar.objects.update(vaccine_catalog_version=catalog.version,
+                                           last_event_date=Subquery(last_event_dates))
+
+
+def get_calendar_event_dictionaries_for_user(user: User, date_from: date = None, date_to: date = None,
+                                             child_id: int = None, pregnancy_id: int = None,
+                                             catalog: VaccineCatalog = None) -> list[dict]:
+    """
+    The user's calendar read from the materialized CalendarEvent rows, building them first if they do not exist yet
+    or were built from an older version of the vaccine catalog. Takes the same filters as
+    generate_calendar_events_for_user; the date range is served by the (user, date) index.
+    """
+    if catalog is None:
+        catalog = get_vaccine_catalog()
+    built_version = UserCalendar.objects.filter(user=user).values_list('vaccine_catalog_version', flat=True).first()
+    if built_version != catalog.version:
+        rebuild_calendar_events_for_user(user, catalog)
+    calendar_events = CalendarEvent.objects.filter(user=user)
+    if date_from is not None:
+        calendar_events = calendar_events.filter(date__gte=date_from)
+    if date_to is not None:
+        calendar_events = calendar_events.filter(date__lte=date_to)
+    if child_id is not None or pregnancy_id is not None:
+        subject_filter = Q(pk__in=[])
+        if child_id is not None:
+            subject_filter |= Q(context__child_id=child_id)
+        if pregnancy_id is not None:
+            subject_filter |= Q(context__pregnancy_id=pregnancy_id)
+        calendar_events = calendar_events.filter(subject_filter)
+    return list(calendar_events.order_by('date', 'id').values_list('context', flat=True))
+
+
 # Given one calendar event, generate a list of
-# notification events based on admin-defined Notification Schedules
+# notification events based on admin-defined Notification Schedules.
+# With available_after, windows that became available at or before that instant are skipped.
+# With available_until, windows becoming available up to that instant are generated ahead of time.
 def generate_notification_events_for_calendar_event(user: User, schedules: [NotificationSchedule],
-                                                    event: CalendarEventProtocol, force_create_events=False) -> \
+                                                    event: CalendarEventProtocol, force_create_events=False,
+                                                    now: datetime = None, available_after: datetime = None,
+                                                    available_until: datetime = None) -> \
 Iterator[NotificationEvent]:
     try:
         timezone_name = user.userprofile.timezone
         timezone = pytz.timezone(timezone_name)
     except User.userprofile.RelatedObjectDoesNotExist:
         timezone = pytz.UTC
-    now = django.utils.timezone.now()
+    if now is None:
+        now = django.utils.timezone.now()
+    if available_until is None:
+        available_until = now
+    event_dict = None
     for schedule in schedules:
-        event_dict = event.to_dictionary()
-        if schedule.calendar_event_type != event_dict['event_type']:
+        if schedule.calendar_event_type != event.event_type:
             continue
-        calendar_event_date = event_dict['date']
-        notification_available_at, notification_expires_at = schedule.get_notification_window(calendar_event_date,
-                                                                                              timezone)
-        if force_create_events or notification_available_at <= now <= notification_expires_at:
+        notification_available_at, notification_expires_at = schedule.get_notification_window(event.date, timezone)
+        if available_after is not None and notification_available_at <= available_after:
+            continue
+        if force_create_events or notification_available_at <= available_until and now <= notification_expires_at:
+            if event_dict is None:
+                event_dict = event.to_dictionary()
             yield NotificationEvent(
                 user=user,
                 event_key=event.get_event_key(),
@@ -47,29 +171,360 @@ Iterator[NotificationEvent]:
             )
 
 
-def generate_notification_events_for_user(user: User, schedules: [NotificationSchedule], force_create_events=False) -> \
-Iterator[NotificationEvent]:
+def generate_notification_events_for_calendar_events(user: User, schedules: [NotificationSchedule],
+                                                     calendar_events: Iterable[CalendarEventProtocol],
+                                                     force_create_events=False, now: datetime = None,
+                                                     available_after: datetime = None) -> Iterator[NotificationEvent]:
     def get_notification_sort_key(notification_event: NotificationEvent):
         return (notification_event.notification_available_at, notification_event.notification_expires_at,)
 
-    calendar_events = generate_all_calendar_events_for_user(user)
     notification_event_generators = \
-        [generate_notification_events_for_calendar_event(user, schedules, e, force_create_events=force_create_events)
+        [generate_notification_events_for_calendar_event(user, schedules, e, force_create_events=force_create_events,
+                                                         now=now, available_after=available_after)
          for e in calendar_events]
     for event in heapq.merge(*notification_event_generators, key=get_notification_sort_key):
         yield event
 
 
-def generate_notification_events_for_all_users():
-    schedules = NotificationSchedule.objects.order_by('calendar_event_type', 'offset_days', 'time_of_day').all()
-    users = User.objects.filter(is_active=True).all()
-    for user in users:
-        notification_events = generate_notification_events_for_user(user, schedules)
-        for event in notification_events:
-            try:
-                event.save()
-            except IntegrityError:
-                pass
+def generate_notification_events_for_user(user: User, schedules: [NotificationSchedule], force_create_events=False) -> \
+Iterator[NotificationEvent]:
+    calendar_events = generate_all_calendar_events_for_user(user)
+    return generate_notification_events_for_calendar_events(user, schedules, calendar_events,
+                                                            force_create_events=force_create_events)
+
+
+def get_calendar_event_date_range(offset_days: int, available_from: datetime, available_until: datetime) -> \
+        (date, date):
+    """
+    The calendar event dates whose schedule window, `offset_days` after the event, may become available between
+    `available_from` and `available_until`. Timezones are less than a day away from UTC, so one day of slack on
+    each side covers every user's timezone and any time of day.
+    """
+    offset = timedelta(days=offset_days)
+    first_date = available_from.astimezone(pytz.UTC).date() - timedelta(days=1) - offset
+    last_date = available_until.astimezone(pytz.UTC).date() + timedelta(days=1) - offset
+    return (first_date, last_date,)
+
+
+def get_open_window_date_ranges(schedules, time_to_live_attname: str, now: datetime,
+                                available_until: datetime = None) -> dict[str, list]:
+    """
+    Calendar event date ranges, by event type, of the schedule windows that may contain `now`, or with
+    `available_until`, that may be open at some point from `now` to `available_until`.
+    """
+    if available_until is None:
+        available_until = now
+    date_ranges_by_event_type = defaultdict(list)
+    for schedule in schedules:
+        time_to_live = getattr(schedule, time_to_live_attname)
+        date_ranges_by_event_type[schedule.calendar_event_type].append(
+            get_calendar_event_date_range(schedule.offset_days, now - time_to_live, available_until)
+        )
+    return date_ranges_by_event_type
+
+
+def get_calendar_horizon(schedules, time_to_live_attname: str, now: datetime) -> Optional[date]:
+    """
+    The earliest last calendar event date a user needs for some window of `schedules` to still contain `now`.
+    A window closes `offset_days`, its time of day and its time to live after the event; one day of slack covers
+    every user's timezone. None without schedules.
+    """
+    window_ends = [
+        timedelta(days=schedule.offset_days, hours=schedule.time_of_day.hour, minutes=schedule.time_of_day.minute,
+                  seconds=schedule.time_of_day.second) + getattr(schedule, time_to_live_attname)
+        for schedule in schedules
+    ]
+    if len(window_ends) == 0:
+        return None
+    return (now.astimezone(pytz.UTC) - max(window_ends)).date() - timedelta(days=1)
+
+
+class EvaluationPhase(NamedTuple):
+    """
+    Schedules to check against the calendar events of the subjects in `selection`. Windows that became available
+    at or before `available_after` can be skipped. With selection.changed_since, only the events of subjects
+    changed since then need checking.
+    """
+    selection: CalendarSelection
+    schedules: list
+    available_after: Optional[datetime]
+
+
+def get_evaluation_phases(schedules, time_to_live_attname: str, now: datetime, since: datetime = None,
+                          generated_until: datetime = None, available_until: datetime = None) \
+        -> list[EvaluationPhase]:
+    """
+    The phases covering every schedule window that has to be checked at `now`.
+
+    Without `since` this is every window containing `now`, or with `available_until`, every window that has not
+    expired and becomes available by then. With `since`, the instant a previous run evaluated up to, only the
+    windows that became available after `generated_until` (by default `since`), the instant the previous run
+    generated up to, are needed, except where the inputs changed since then: edited schedules, an edited vaccine
+    catalog, and created or edited pregnancies and children are evaluated against every window again.
+    """
+    schedules = list(schedules)
+    horizon = get_calendar_horizon(schedules, time_to_live_attname, now)
+    if available_until is None:
+        available_until = now
+    all_window_date_ranges = get_open_window_date_ranges(schedules, time_to_live_attname, now, available_until)
+    if since is None:
+        return [EvaluationPhase(CalendarSelection(all_window_date_ranges, horizon=horizon), schedules, None)]
+    if generated_until is None:
+        generated_until = since
+
+    is_vaccine_catalog_changed = has_vaccine_catalog_changed_since(since)
+
+    def is_schedule_changed(schedule):
+        return schedule.updated_at > since or \
+            (is_vaccine_catalog_changed and schedule.calendar_event_type == CalendarEventType.VACCINATION)
+
+    phases = []
+    changed_schedules = [schedule for schedule in schedules if is_schedule_changed(schedule)]
+    unchanged_schedules = [schedule for schedule in schedules if not is_schedule_changed(schedule)]
+    if len(changed_schedules) > 0:
+        phases.append(EvaluationPhase(
+            CalendarSelection(
+                get_open_window_date_ranges(changed_schedules, time_to_live_attname, now, available_until),
+                horizon=horizon,
+            ),
+            changed_schedules,
+            None,
+        ))
+    if len(unchanged_schedules) > 0:
+        date_ranges_by_event_type = defaultdict(list)
+        for schedule in unchanged_schedules:
+            date_ranges_by_event_type[schedule.calendar_event_type].append(
+                get_calendar_event_date_range(schedule.offset_days, generated_until, available_until)
+            )
+        phases.append(EvaluationPhase(CalendarSelection(date_ranges_by_event_type, horizon=horizon),
+                                      unchanged_schedules, generated_until))
+    # Not limited to the horizon, as the calendars of subjects changed just now may not have been rebuilt yet
+    phases.append(EvaluationPhase(CalendarSelection(all_window_date_ranges, changed_since=since), schedules, None))
+    return phases
+
+
+def get_pending_notification_events() -> QuerySet:
+    """
+    Notification events generated ahead of time that are neither available nor pushed yet. When their calendar event,
+    schedule or the user's timezone changes, they are withdrawn by events.signals and the next generation run creates
+    them again from the current data.
+    """
+    return NotificationEvent.objects.filter(
+        schedule__isnull=False,
+        push_notification_sent_at__isnull=True,
+        push_failed_at__isnull=True,
+        notification_available_at__gt=django.utils.timezone.now(),
+    )
+
+
+def mark_calendar_subjects_changed(user_id: int):
+    """
+    Makes the next generation run evaluate every window of the user's pregnancies and children again, as after an
+    edit of theirs. update() rather than save(), so the calendar is not rebuilt.
+    """
+    now = django.utils.timezone.now()
+    Pregnancy.objects.filter(user_id=user_id).update(updated_at=now)
+    Child.objects.filter(user_id=user_id).update(updated_at=now)
+
+
+def get_job_name(name: str, shard: Shard = None) -> str:
+    if shard is None:
+        return name
+    return f"{name}[{shard}]"
+
+
+def make_notification_event_writer(batch_size=500) -> ConflictIgnoringBulkWriter:
+    """
+    Bulk writer for generated NotificationEvents, deduplicated on (event_key, schedule).
+    The text of inserted rows is rendered on the way in, and they are pushed later by the push dispatcher,
+    see events.dispatcher.
+    """
+    return ConflictIgnoringBulkWriter(
+        NotificationEvent,
+        unique_fields=('event_key', 'schedule_id'),
+        batch_size=batch_size,
+        before_insert=NotificationTemplateResolver.load().render,
+    )
+
+
+class GenerationArtifact(NamedTuple):
+    """
+    One kind of row generated from schedule windows by run_generation(), e.g. notification events or surveys.
+    """
+    job_name: str
+    schedules: list
+    time_to_live_attname: str
+    # Called like generate_notification_events_for_calendar_event(user, schedules, event, now=, available_after=,
+    # available_until=)
+    generate_for_calendar_event: Callable[..., Iterator[models.Model]]
+    make_writer: Callable[..., ConflictIgnoringBulkWriter]
+    # Incremental runs leave the artifact out until its previous run is at least this old
+    cadence: timedelta = timedelta(0)
+    # Rows are created this long before their window opens, which lets the cadence grow up to the lookahead
+    lookahead: timedelta = timedelta(0)
+    # The rows created ahead of time that are not available yet, withdrawn when the vaccine catalog changes
+    get_pending_rows: Optional[Callable[[], QuerySet]] = None
+
+
+def make_notification_artifact(cadence: timedelta = timedelta(0),
+                               lookahead: timedelta = timedelta(0)) -> GenerationArtifact:
+    """
+    Notification events created ahead of time stay hidden from the user until they become available, and are
+    pushed then by the push dispatcher.
+    """
+    return GenerationArtifact(
+        NOTIFICATION_GENERATION_JOB_NAME,
+        list(NotificationSchedule.objects.order_by('calendar_event_type', 'offset_days', 'time_of_day')),
+        'push_time_to_live',
+        generate_notification_events_for_calendar_event,
+        make_notification_event_writer,
+        cadence,
+        lookahead,
+        get_pending_notification_events,
+    )
+
+
+def run_generation(artifacts: Iterable[GenerationArtifact], shard: Shard = None, batch_size=500, incremental=True,
+                   evaluation_batch_size=10000) -> BulkWriterGroup:
+    """
+    Creates the due rows of every artifact in one pass: the pregnancies and children that any artifact needs are
+    loaded with one query per subject type, each user's calendar is generated once, and the schedules of every
+    artifact are checked against it. Each artifact resumes from its own JobWatermark, whichever command ran it
+    last; incremental runs leave out the artifacts whose cadence has not elapsed since then. Rows of artifacts with
+    a lookahead are created up to that long before they become available; those of vaccinations are withdrawn and
+    created again when the vaccine catalog changed since the previous run.
+    Returns the writers of the artifacts that ran, named by their job_name.
+    """
+    now = django.utils.timezone.now()
+    plans = []
+    for artifact in artifacts:
+        job_name = get_job_name(artifact.job_name, shard)
+        since = JobWatermark.objects.get_evaluated_until(job_name) if incremental else None
+        if since is not None and now - since < artifact.cadence:
+            continue
+        generated_until = JobWatermark.objects.get_generated_until(job_name) if since is not None else None
+        if since is not None and artifact.get_pending_rows is not None and has_vaccine_catalog_changed_since(since):
+            # Rows of the doses of the former catalog; every vaccination window is evaluated again below
+            filter_shard(artifact.get_pending_rows().filter(event_key__startswith=VACCINATION_EVENT_KEY_PREFIX),
+                         'user_id', shard).delete()
+        available_until = now + artifact.lookahead
+        if generated_until is not None and generated_until > available_until:
+            # The lookahead was shortened: the rows up to generated_until exist already
+            available_until = generated_until
+        phases = get_evaluation_phases(artifact.schedules, artifact.time_to_live_attname, now, since=since,
+                                       generated_until=generated_until, available_until=available_until)
+        plans.append((artifact, job_name, phases, available_until))
+    writers = {artifact.job_name: artifact.make_writer(batch_size=batch_size) for artifact, _, _, _ in plans}
+    # (user, calendar events) to evaluate, by index of plan and phase
+    pending = defaultdict(list)
+
+    def evaluate_pending():
+        for (plan_index, phase_index), user_calendar_events in pending.items():
+            artifact, _, phases, available_until = plans[plan_index]
+            phase = phases[phase_index]
+            evaluations = [(user, events, phase.schedules, phase.available_after)
+                           for user, events in user_calendar_events]
+            for user, schedules_by_event, available_after in generate_open_windows(
+                    evaluations, artifact.time_to_live_attname, now, batch_size=evaluation_batch_size,
+                    available_until=available_until):
+                for event, event_schedules in schedules_by_event:
+                    writer_group.add_all(artifact.job_name, artifact.generate_for_calendar_event(
+                        user, event_schedules, event, now=now, available_after=available_after,
+                        available_until=available_until,
+                    ))
+        pending.clear()
+
+    with BulkWriterGroup(writers) as writer_group:
+        selections = [phase.selection for _, _, phases, _ in plans for phase in phases]
+        pending_event_count = 0
+        for user, calendar_events in generate_calendar_events_for_selections(selections, shard=shard):
+            calendar_events = list(calendar_events)
+            for plan_index, (_, _, phases, _) in enumerate(plans):
+                for phase_index, phase in enumerate(phases):
+                    changed_since = phase.selection.changed_since
+                    if changed_since is not None:
+                        events = [e for e in calendar_events if e.subject.updated_at > changed_since]
+                    else:
+                        events = calendar_events
+                    if len(events) > 0:
+                        pending[(plan_index, phase_index)].append((user, events))
+            pending_event_count += len(calendar_events)
+            if pending_event_count >= evaluation_batch_size:
+                evaluate_pending()
+                pending_event_count = 0
+        evaluate_pending()
+    for _, job_name, _, available_until in plans:
+        JobWatermark.objects.set_evaluated_until(job_name, now, generated_until=available_until)
+    return writer_group
+
+
+def generate_notification_events_for_all_users(shard: Shard = None, force_create_events=False, batch_size=500,
+                                               incremental=True) -> ConflictIgnoringBulkWriter:
+    """
+    Creates the due notification events. Incremental runs start from the instant the previous successful run of
+    the same shard evaluated up to, recorded as a JobWatermark, so an interrupted run or an outage is caught up
+    by the next run. See run_generation() to generate surveys in the same pass.
+    """
+    if force_create_events:
+        schedules = NotificationSchedule.objects.order_by('calendar_event_type', 'offset_days', 'time_of_day').all()
+        with make_notification_event_writer(batch_size=batch_size) as writer:
+            users = filter_shard(User.objects.filter(is_active=True), 'id', shard).order_by('id')
+            for user in users:
+                writer.add_all(generate_notification_events_for_user(user, schedules, force_create_events=True))
+        return writer
+
+    writer_group = run_generation([make_notification_artifact()], shard=shard, batch_size=batch_size,
+                                  incremental=incremental)
+    return writer_group.writers[NOTIFICATION_GENERATION_JOB_NAME]
+
+
+def fan_out_instant_notification(instant_notification: InstantNotification, batch_size=1000) -> FanOutResult:
+    """
+    Creates a rendered notification event for every phone number of `instant_notification` that belongs to a user
+    with a profile, and records the outcome of every number as an InstantNotificationRecipient. Users are resolved
+    with one query and rows are bulk inserted; the pushes are sent by the push dispatcher, see events.dispatcher.
+    """
+    now = django.utils.timezone.now()
+    phone_numbers = list(dict.fromkeys(instant_notification.phone_numbers))
+    users_by_phone_number = {
+        user.username: user
+        for user in User.objects.filter(username__in=phone_numbers).select_related('userprofile')
+    }
+    recipients = []
+    notification_events = []
+    for phone_number in phone_numbers:
+        user = users_by_phone_number.get(phone_number)
+        if user is None:
+            result = InstantNotificationRecipient.Result.UNKNOWN_USER
+        elif not hasattr(user, 'userprofile'):
+            result = InstantNotificationRecipient.Result.NO_PROFILE
+        else:
+            result = InstantNotificationRecipient.Result.QUEUED
+            notification_events.append(NotificationEvent(
+                user=user,
+                notification_type_id=instant_notification.notification_type_id,
+                instant_notification=instant_notification,
+                notification_available_at=now,
+                notification_expires_at=now + INSTANT_NOTIFICATION_TIME_TO_LIVE,
+            ))
+        recipients.append(InstantNotificationRecipient(
+            instant_notification=instant_notification,
+            phone_number=phone_number,
+            user=user,
+            result=result,
+        ))
+    templates = NotificationTemplate.objects.filter(notification_type_id=instant_notification.notification_type_id)
+    NotificationTemplateResolver(templates).render(notification_events)
+    with transaction.atomic():
+        NotificationEvent.objects.bulk_create(notification_events, batch_size=batch_size)
+        InstantNotificationRecipient.objects.bulk_create(recipients, batch_size=batch_size)
+    results = Counter(recipient.result for recipient in recipients)
+    return FanOutResult(
+        results[InstantNotificationRecipient.Result.QUEUED],
+        results[InstantNotificationRecipient.Result.UNKNOWN_USER],
+        results[InstantNotificationRecipient.Result.NO_PROFILE],
+    )
+
 
 def send_notification(title: str, body: str, users: list):
     notification_body = {
@@ -1,5 +1,8 @@
+from django.contrib.auth.models import User
+from django.db.models import Count, Max, Min, Q
 from django.utils import timezone
-from drf_spectacular.utils import extend_schema, inline_serializer
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema, inline_serializer
 from rest_framework.decorators import action
 from rest_framework.fields import DateField, CharField, IntegerField, ListField
 from rest_framework.mixins import ListModelMixin
@@ -9,16 +12,45 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
 
-from events.utils import generate_all_calendar_events_for_user
-from events.models import NotificationEvent
-from events.serializers import NotificationEventSerializer
+from child_health.catalog import get_vaccine_catalog, get_vaccine_catalog_version
+from events.utils import get_calendar_event_dictionaries_for_user
+from events.models import NotificationEvent, NotificationReadState
+from events.serializers import CalendarEventFilterSerializer, NotificationEventSerializer
+from hera.conditional import ConditionalGetMixin
+from hera.pagination import UserKeysetPagination
 
 
-class CalendarEventView(APIView):
+class CalendarEventView(ConditionalGetMixin, APIView):
     permission_classes = [IsAuthenticated]
 
+    def get_version_parts(self, request):
+        # Rebuilding a calendar replaces its rows and stamps the vaccine catalog version it was built from. A calendar
+        # built from an older catalog is rebuilt on read, so the current catalog version is part of the ETag too.
+        self.vaccine_catalog_version = get_vaccine_catalog_version()
+        return (
+            *User.objects.filter(pk=request.user.pk).values_list(
+                'usercalendar__vaccine_catalog_version',
+                'usercalendar__built_at',
+            ).annotate(
+                count=Count('calendarevent'),
+                max_id=Max('calendarevent__id'),
+            ).first(),
+            self.vaccine_catalog_version,
+        )
+
     @extend_schema(
-        parameters=[],
+        parameters=[
+            OpenApiParameter('from', OpenApiTypes.DATE, OpenApiParameter.QUERY,
+                             description='Only events on or after this date'),
+            OpenApiParameter('to', OpenApiTypes.DATE, OpenApiParameter.QUERY,
+                             description='Only events on or before this date'),
+            OpenApiParameter('child_id', OpenApiTypes.INT, OpenApiParameter.QUERY,
+                             description='Only vaccinations of this child. Combined with `pregnancy_id`, the '
+                                         'events of both are returned.'),
+            OpenApiParameter('pregnancy_id', OpenApiTypes.INT, OpenApiParameter.QUERY,
+                             description='Only prenatal checkups of this pregnancy. Combined with `child_id`, the '
+                                         'events of both are returned.'),
+        ],
         request=None,
         responses=inline_serializer(
             name='Calendar Event',
@@ -40,23 +72,45 @@ class CalendarEventView(APIView):
 
     def get(self, request: Request):
         user = request.user
-        calendar_events = generate_all_calendar_events_for_user(user)
-        data = list([e.to_dictionary() for e in calendar_events])
+        filters = CalendarEventFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        catalog = get_vaccine_catalog(self.vaccine_catalog_version)
+        data = get_calendar_event_dictionaries_for_user(user, **filters.validated_data, catalog=catalog)
         return Response(
             status=200,
             data=data,
         )
 
 
-class NotificationEventViewSet(ListModelMixin, GenericViewSet):
+class NotificationEventViewSet(ConditionalGetMixin, ListModelMixin, GenericViewSet):
     queryset = NotificationEvent.objects.all()
     serializer_class = NotificationEventSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = UserKeysetPagination
     ordering = ('-id',)
 
     def get_queryset(self):
-        return self.queryset.filter(user=self.request.user)
-    
+        # Events generated ahead of time stay hidden until they become available
+        return NotificationReadState.objects.annotate_read_at(self.queryset.filter(
+            user=self.request.user,
+            notification_available_at__lte=timezone.now(),
+        ))
+
+    def get_version_parts(self, request):
+        now = timezone.now()
+        return User.objects.filter(pk=request.user.pk).values_list(
+            'notificationreadstate__last_read_notification_event_id',
+            'notificationreadstate__last_read_at',
+        ).annotate(
+            count=Count('notificationevent'),
+            max_id=Max('notificationevent__id'),
+            max_updated_at=Max('notificationevent__updated_at'),
+            max_read_at=Max('notificationevent__read_at'),
+            # Changes when the next event generated ahead of time becomes available
+            next_available_at=Min('notificationevent__notification_available_at',
+                                  filter=Q(notificationevent__notification_available_at__gt=now)),
+        ).first()
+
     @extend_schema(
         parameters=[],
         request=None,
@@ -64,6 +118,34 @@ class NotificationEventViewSet(ListModelMixin, GenericViewSet):
     )
     @action(detail=False, methods=['post'])
     def mark_all_as_read(self, request):
-        user = request.user
-        user.notificationevent_set.update(read_at=timezone.now())
+        NotificationReadState.objects.mark_all_as_read(request.user, timezone.now())
+        return Response(status=200)
+
+    @extend_schema(
+        parameters=[],
+        request=None,
+        responses=None,
+    )
+    @action(detail=True, methods=['post'])
+    def mark_as_read(self, request, pk=None):
+        notification_event = self.get_object()
+        if notification_event.effective_read_at is None:
+            NotificationEvent.objects.filter(pk=notification_event.pk).update(read_at=timezone.now())
         return Response(status=200)
+
+    @extend_schema(
+        parameters=[],
+        request=None,
+        responses=inline_serializer(
+            name='Unread Count',
+            fields={
+                'unread_count': IntegerField(help_text='The number of notification events the user has not read'),
+            },
+        ),
+    )
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        return Response(
+            status=200,
+            data={'unread_count': NotificationReadState.objects.count_unread(request.user, timezone.now())},
+        )
@@ -0,0 +1,149 @@
+from collections.abc import Callable, Iterable
+from typing import Optional
+
+from django.db import IntegrityError, models, transaction
+from psycopg2.errorcodes import UNIQUE_VIOLATION
+
+
+class ConflictIgnoringBulkWriter:
+    """
+    Collects model instances and writes them in batches with ON CONFLICT DO NOTHING semantics.
+
+    Rows whose ``unique_fields`` already exist in the database are counted as skipped instead of
+    raising IntegrityError, so a generation run costs one SELECT and one INSERT per batch no matter
+    how many of its rows were generated by earlier runs.
+
+    ``bulk_create`` does not call ``save()``, so callers can pass ``before_insert``, which receives the rows
+    about to be inserted (without those found to exist already) and may fill in derived fields.
+
+    ON CONFLICT DO NOTHING only covers unique indexes. The unique triggers of partitioned tables, see
+    hera.partitioning, raise unique_violation instead, e.g. when a concurrent run inserted one of the rows after
+    they were looked up; such a batch is inserted again row by row, skipping the duplicates.
+    """
+
+    def __init__(self, model: type[models.Model], unique_fields: Iterable[str], batch_size: int = 500,
+                 before_insert: Optional[Callable[[list[models.Model]], None]] = None):
+        self.model = model
+        self.unique_fields = tuple(unique_fields)
+        self.batch_size = batch_size
+        self.before_insert = before_insert
+        self.inserted = 0
+        self.skipped = 0
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, instance: models.Model):
+        self._pending.append(instance)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def add_all(self, instances: Iterable[models.Model]):
+        for instance in instances:
+            self.add(instance)
+
+    def get_key(self, instance: models.Model) -> Optional[tuple]:
+        key = tuple(getattr(instance, field) for field in self.unique_fields)
+        # NULLs never conflict in a unique constraint, so such rows are always inserted
+        if any(value is None for value in key):
+            return None
+        return key
+
+    def flush(self):
+        batch, self._pending = self._pending, []
+        if len(batch) == 0:
+            return
+        candidates = {}
+        unkeyed = []
+        for instance in batch:
+            key = self.get_key(instance)
+            if key is None:
+                unkeyed.append(instance)
+            elif key not in candidates:
+                candidates[key] = instance
+        existing_keys = self._get_existing_keys(candidates.keys())
+        new_instances = [instance for key, instance in candidates.items() if key not in existing_keys]
+        new_instances += unkeyed
+        if self.before_insert is not None and len(new_instances) > 0:
+            self.before_insert(new_instances)
+        new_instances = self._insert(new_instances)
+        self.inserted += len(new_instances)
+        self.skipped += len(batch) - len(new_instances)
+
+    def _insert(self, instances: list[models.Model]) -> list[models.Model]:
+        """
+        Inserts `instances` and returns those that were inserted, see the class docstring.
+        """
+        try:
+            with transaction.atomic():
+                self.model.objects.bulk_create(instances, batch_size=self.batch_size, ignore_conflicts=True)
+            return instances
+        except IntegrityError as e:
+            if not is_unique_violation(e):
+                raise
+        inserted = []
+        for instance in instances:
+            try:
+                with transaction.atomic():
+                    self.model.objects.bulk_create([instance], ignore_conflicts=True)
+            except IntegrityError as e:
+                if not is_unique_violation(e):
+                    raise
+                continue
+            inserted.append(instance)
+        return inserted
+
+    def _filter_by_keys(self, keys):
+        lookups = {
+            f"{field}__in": {key[i] for key in keys}
+            for i, field in enumerate(self.unique_fields)
+        }
+        return self.model.objects.filter(**lookups)
+
+    def _get_existing_keys(self, keys) -> set[tuple]:
+        if len(keys) == 0:
+            return set()
+        rows = self._filter_by_keys(keys).values_list(*self.unique_fields)
+        return set(rows) & set(keys)
+
+
+def is_unique_violation(error: IntegrityError) -> bool:
+    return getattr(error.__cause__, 'pgcode', None) == UNIQUE_VIOLATION
+
+
+class BulkWriterGroup:
+    """
+    ConflictIgnoringBulkWriters of different models filled by the same pass, by name.
+    All of them are flushed on exit, and ``inserted``, ``skipped`` and ``counts`` report on the whole group.
+    """
+
+    def __init__(self, writers: dict[str, ConflictIgnoringBulkWriter]):
+        self.writers = writers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            for writer in self.writers.values():
+                writer.flush()
+
+    def add_all(self, name: str, instances: Iterable[models.Model]):
+        self.writers[name].add_all(instances)
+
+    @property
+    def inserted(self) -> int:
+        return sum(writer.inserted for writer in self.writers.values())
+
+    @property
+    def skipped(self) -> int:
+        return sum(writer.skipped for writer in self.writers.values())
+
+    @property
+    def counts(self) -> dict[str, tuple[int, int]]:
+        return {name: (writer.inserted, writer.skipped) for name, writer in self.writers.items()}
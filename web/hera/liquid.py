@@ -0,0 +1,53 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.db import models
+from liquid import Template
+
+
+class CompiledTemplateCache:
+    """
+    Per-process LRU of parsed Liquid templates, keyed by (model, pk, field, content hash), so that rendering many
+    rows parses each template once. An edited template gets a new key, and invalidate() drops the stale entries.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, instance: models.Model, field_name: str) -> Template:
+        source = getattr(instance, field_name)
+        key = (instance._meta.label, instance.pk, field_name, hashlib.sha1(source.encode()).hexdigest(),)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                return template
+        template = Template(source)
+        with self._lock:
+            self._templates[key] = template
+            if len(self._templates) > self.maxsize:
+                self._templates.popitem(last=False)
+        return template
+
+    def invalidate(self, instance: models.Model):
+        with self._lock:
+            stale_keys = [key for key in self._templates if key[:2] == (instance._meta.label, instance.pk,)]
+            for key in stale_keys:
+                del self._templates[key]
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+    def __len__(self):
+        return len(self._templates)
+
+
+compiled_templates = CompiledTemplateCache()
+
+
+def get_compiled_template(instance: models.Model, field_name: str) -> Template:
+    return compiled_templates.get(instance, field_name)
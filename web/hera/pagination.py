@@ -3,3 +3,21 @@ from rest_framework.pagination import CursorPagination
 
 class StandardPagination(CursorPagination):
 	ordering = '-pk'
+
+
+class UserKeysetPagination(CursorPagination):
+	"""
+	Cursor pagination over one user's rows, newest first, served by a (user, -id) index.
+	Pagination is opt-in through `page_size` (or a `cursor` from a previous page): requests without either
+	still get the whole list, as app versions released before pagination expect.
+	"""
+	ordering = '-id'
+	page_size = 20
+	page_size_query_param = 'page_size'
+	max_page_size = 100
+
+	def paginate_queryset(self, queryset, request, view=None):
+		if self.page_size_query_param not in request.query_params \
+				and self.cursor_query_param not in request.query_params:
+			return None
+		return super().paginate_queryset(queryset, request, view)
@@ -0,0 +1,206 @@
+import gzip
+import re
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+import pytz
+from django.db.backends.base.base import BaseDatabaseWrapper
+
+# Tables partitioned by month of the given column, see partition_table_by_month()
+PARTITIONED_TABLES = {
+    'events_notificationevent': 'created_at',
+    'surveys_survey': 'created_at',
+}
+
+
+class Partition(NamedTuple):
+    name: str
+    # Both None for the default partition
+    start: Optional[datetime]
+    end: Optional[datetime]
+
+    @property
+    def is_default(self) -> bool:
+        return self.start is None
+
+
+def get_month_start(value: datetime) -> datetime:
+    value = value.astimezone(pytz.UTC)
+    return datetime(value.year, value.month, 1, tzinfo=pytz.UTC)
+
+
+def add_months(month_start: datetime, months: int) -> datetime:
+    month_index = month_start.year * 12 + month_start.month - 1 + months
+    return datetime(month_index // 12, month_index % 12 + 1, 1, tzinfo=pytz.UTC)
+
+
+def get_partition_name(table: str, month_start: datetime) -> str:
+    return f"{table}_p{month_start:%Y%m}"
+
+
+def get_default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+
+def get_partitions(connection: BaseDatabaseWrapper, table: str) -> list[Partition]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+            ORDER BY child.relname
+            """,
+            [table],
+        )
+        rows = cursor.fetchall()
+    partitions = []
+    for name, bound in rows:
+        if bound == 'DEFAULT':
+            partitions.append(Partition(name, None, None))
+            continue
+        start, end = re.findall(r"'([^']+)'", bound)
+        partitions.append(Partition(name, datetime.fromisoformat(start), datetime.fromisoformat(end)))
+    return partitions
+
+
+def create_monthly_partitions(connection: BaseDatabaseWrapper, table: str, column: str, start: datetime,
+                              end: datetime) -> list[str]:
+    """
+    Creates the missing partitions of `table` for every month from the one containing `start` to the one containing
+    `end`, and returns their names. Rows of those months that landed in the default partition are moved over.
+    """
+    existing = {partition.name for partition in get_partitions(connection, table)}
+    default_name = get_default_partition_name(table)
+    created = []
+    month_start = get_month_start(start)
+    while month_start <= end:
+        month_end = add_months(month_start, 1)
+        name = get_partition_name(table, month_start)
+        if name not in existing:
+            with connection.cursor() as cursor:
+                has_default_rows = False
+                if default_name in existing:
+                    cursor.execute(
+                        f"SELECT EXISTS (SELECT 1 FROM {default_name} WHERE {column} >= %s AND {column} < %s)",
+                        [month_start, month_end],
+                    )
+                    has_default_rows = cursor.fetchone()[0]
+                if has_default_rows:
+                    # Postgres refuses to create a partition for rows that sit in the default partition
+                    cursor.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+                    cursor.execute(
+                        f"WITH moved AS (DELETE FROM {default_name} WHERE {column} >= %s AND {column} < %s "
+                        f"RETURNING *) INSERT INTO {name} SELECT * FROM moved",
+                        [month_start, month_end],
+                    )
+                    cursor.execute(
+                        f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+                        [month_start, month_end],
+                    )
+                else:
+                    cursor.execute(
+                        f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+                        [month_start, month_end],
+                    )
+            created.append(name)
+        month_start = month_end
+    return created
+
+
+def partition_table_by_month(schema_editor, table: str, column: str, unique_fields: list[tuple[str, ...]],
+                             months_ahead: int = 3):
+    """
+    Rebuilds `table` as a table partitioned by month of `column`, with monthly partitions from its oldest row to
+    `months_ahead` months from now and a default partition for anything outside them.
+
+    Postgres only enforces unique indexes that include the partition key, so every unique constraint on
+    `unique_fields` becomes a plain index plus a trigger which raises unique_violation like the constraint did.
+    Indexes, check and foreign key constraints keep their names, so later migrations can still alter them.
+    Requires PostgreSQL 13 or later.
+    """
+    connection = schema_editor.connection
+    old_table = f"{table}_unpartitioned"
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {old_table}")
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s",
+            [old_table],
+        )
+        index_definitions = cursor.fetchall()
+        cursor.execute(
+            """
+            SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype IN ('p', 'f', 'c')
+            """,
+            [old_table],
+        )
+        constraint_definitions = cursor.fetchall()
+        cursor.execute(f"SELECT pg_get_serial_sequence(%s, 'id'), min({column}) FROM {old_table}", [old_table])
+        sequence, oldest = cursor.fetchone()
+
+        cursor.execute(f"CREATE TABLE {table} (LIKE {old_table} INCLUDING DEFAULTS) PARTITION BY RANGE ({column})")
+        primary_key_name = next(name for name, kind, _ in constraint_definitions if kind == 'p')
+        cursor.execute(f"ALTER TABLE {old_table} DROP CONSTRAINT {primary_key_name}")
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {primary_key_name} PRIMARY KEY (id, {column})")
+        cursor.execute(f"CREATE TABLE {get_default_partition_name(table)} PARTITION OF {table} DEFAULT")
+    now = datetime.now(tz=pytz.UTC)
+    create_monthly_partitions(connection, table, column, oldest or now, add_months(get_month_start(now), months_ahead))
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM {old_table}")
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+        cursor.execute(f"DROP TABLE {old_table}")
+        for name, definition in index_definitions:
+            if name == primary_key_name:
+                continue
+            definition = re.sub(rf" ON (\S+\.)?{old_table} ", f" ON {table} ", definition)
+            cursor.execute(definition.replace('CREATE UNIQUE INDEX', 'CREATE INDEX', 1))
+        for name, kind, definition in constraint_definitions:
+            if kind != 'p':
+                cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+    for fields in unique_fields:
+        create_unique_trigger(schema_editor, table, fields)
+
+
+def create_unique_trigger(schema_editor, table: str, fields: tuple[str, ...]):
+    """
+    Enforces uniqueness of `fields` across all partitions of `table`. Rows with a NULL in `fields` never conflict,
+    as with a unique constraint. Concurrent inserts of the same values are serialized with an advisory lock.
+    """
+    name = f"{table}_{'_'.join(fields)}_unique"
+    not_null = ' AND '.join(f"NEW.{field} IS NOT NULL" for field in fields)
+    matches = ' AND '.join(f"{field} = NEW.{field}" for field in fields)
+    lock_key = " || ':' || ".join(f"NEW.{field}::text" for field in fields)
+    schema_editor.execute(f"""
+        CREATE FUNCTION {name}() RETURNS trigger AS $$
+        BEGIN
+            IF {not_null} THEN
+                PERFORM pg_advisory_xact_lock(hashtextextended('{table}:' || {lock_key}, 0));
+                IF EXISTS (SELECT 1 FROM {table} WHERE {matches}) THEN
+                    RAISE unique_violation USING
+                        MESSAGE = 'duplicate key value violates unique constraint "{name}"',
+                        CONSTRAINT = '{name}';
+                END IF;
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    schema_editor.execute(f"CREATE TRIGGER {name} BEFORE INSERT ON {table} FOR EACH ROW EXECUTE FUNCTION {name}()")
+
+
+def detach_partition(connection: BaseDatabaseWrapper, table: str, partition: str):
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {partition}")
+
+
+def archive_partition(connection: BaseDatabaseWrapper, partition: str, path: str) -> str:
+    """
+    Writes the rows of a (detached) partition as gzipped CSV with a header line to `path` and drops the partition.
+    """
+    with connection.cursor() as cursor, gzip.open(path, 'wb') as archive:
+        cursor.copy_expert(f"COPY {partition} TO STDOUT WITH (FORMAT csv, HEADER)", archive)
+        cursor.execute(f"DROP TABLE {partition}")
+    return path
@@ -181,6 +181,11 @@ SPECTACULAR_SETTINGS = {
 
 
 HERA_OTP_LENGTH: int = 6
+# Where OTP challenges are kept until solved, see otp_auth.stores: 'database' keeps SmsOtpChallenge rows, which
+# purge_otp_challenges deletes once expired, and 'cache' keeps them in HERA_OTP_CHALLENGE_CACHE until they expire.
+# The cache must be shared by every web process, which the default local memory cache is not.
+HERA_OTP_CHALLENGE_STORE: str = os.getenv('HERA_OTP_CHALLENGE_STORE', 'database')
+HERA_OTP_CHALLENGE_CACHE: str = 'default'
 
 LANGUAGE_COOKIE_NAME = 'hera_user_language'
 LOCALE_PATHS = [
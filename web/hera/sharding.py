@@ -0,0 +1,118 @@
+import argparse
+import multiprocessing
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional, Union
+
+from django.db import connections
+from django.db.models import QuerySet
+from django.db.models.functions import Mod
+
+from hera.bulk import BulkWriterGroup, ConflictIgnoringBulkWriter
+
+
+class Shard(NamedTuple):
+    """
+    One of `count` disjoint partitions of the user base; users belong to shard `user_id % count`.
+    """
+    index: int
+    count: int
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+
+class ShardResult(NamedTuple):
+    shard: Optional[Shard]
+    inserted: int
+    skipped: int
+    seconds: float
+    # (inserted, skipped) by writer name when the shard filled a BulkWriterGroup
+    counts: Optional[dict[str, tuple[int, int]]] = None
+
+
+def parse_shard(value: str) -> Shard:
+    """
+    argparse type for `--shard i/N`.
+    """
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Shard must look like i/N, got {value}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Shard index must be between 0 and {count - 1}, got {value}")
+    return Shard(index, count)
+
+
+def filter_shard(queryset: QuerySet, user_id_field: str, shard: Optional[Shard]) -> QuerySet:
+    if shard is None or shard.count == 1:
+        return queryset
+    return queryset.annotate(user_shard=Mod(user_id_field, shard.count)).filter(user_shard=shard.index)
+
+
+def run_shard(function: Callable[..., Union[ConflictIgnoringBulkWriter, BulkWriterGroup]], shard: Optional[Shard],
+              *args) -> ShardResult:
+    """
+    Calls `function(shard, *args)`, which returns the writer or writer group it used, and times it.
+    """
+    started_at = time.monotonic()
+    writer = function(shard, *args)
+    return ShardResult(shard, writer.inserted, writer.skipped, time.monotonic() - started_at,
+                       getattr(writer, 'counts', None))
+
+
+def _run_shard_in_worker(function, shard, *args) -> ShardResult:
+    try:
+        return run_shard(function, shard, *args)
+    finally:
+        connections.close_all()
+
+
+def run_shards_in_processes(function: Callable[..., Union[ConflictIgnoringBulkWriter, BulkWriterGroup]], workers: int,
+                            *args) -> list[ShardResult]:
+    """
+    Runs `function(shard, *args)` for every shard of `workers` shards, one forked process per shard.
+    Each process opens its own database connection, so shards write independently.
+    """
+    # Forked processes must not share the parent's database connections
+    connections.close_all()
+    shards = [Shard(index, workers) for index in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+        futures = [executor.submit(_run_shard_in_worker, function, shard, *args) for shard in shards]
+        return [future.result() for future in futures]
+
+
+def run_shards(function: Callable[..., Union[ConflictIgnoringBulkWriter, BulkWriterGroup]], workers: int,
+               shard: Optional[Shard], *args) -> list[ShardResult]:
+    """
+    Runs `function` for each of `workers` shards in its own process, or for `shard` in this process.
+    """
+    if workers > 1:
+        return run_shards_in_processes(function, workers, *args)
+    return [run_shard(function, shard, *args)]
+
+
+def add_generation_arguments(parser: argparse.ArgumentParser):
+    """
+    Adds the batching, resumption and sharding arguments shared by the generation commands.
+    """
+    parser.add_argument('--batch-size', dest='batch_size', type=int, default=500)
+    parser.add_argument('--full', dest='incremental', action='store_false',
+                        help='Evaluate every open schedule window instead of resuming from the last run')
+    sharding = parser.add_mutually_exclusive_group()
+    sharding.add_argument('--workers', dest='workers', type=int, default=1,
+                          help='Split users into this many shards, each generated by its own process')
+    sharding.add_argument('--shard', dest='shard', type=parse_shard, default=None,
+                          help='Only generate for users in shard i/N, e.g. when running N job containers')
+
+
+def format_shard_result(result: ShardResult, name: Optional[str] = None, counts: Optional[str] = None) -> str:
+    """
+    Summary line of a generation command for one shard; `counts` defaults to its created and existing rows.
+    """
+    generated = 'generating' if name is None else f"generating {name}"
+    users = 'all users' if result.shard is None else f"shard {result.shard}"
+    if counts is None:
+        counts = f"{result.inserted} created, {result.skipped} already existed"
+    return f"Finished {generated} for {users} in {result.seconds:.2f}s: {counts}"
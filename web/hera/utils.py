@@ -1,3 +1,4 @@
+from datetime import date
 
 
 def get_sanitized_hstore_dict(context: dict) -> dict:
@@ -9,4 +10,17 @@ def get_sanitized_hstore_dict(context: dict) -> dict:
             result[key] = ', '.join(value)
         else:
             result[key] = value
-    return result
\ No newline at end of file
+    return result
+
+
+def merge_date_ranges(date_ranges) -> list[tuple[date, date]]:
+    """
+    Merges overlapping or adjacent inclusive (start, end) date ranges, sorted by start date.
+    """
+    result = []
+    for start_date, end_date in sorted(date_ranges):
+        if len(result) > 0 and (start_date - result[-1][1]).days <= 1:
+            result[-1] = (result[-1][0], max(result[-1][1], end_date))
+        else:
+            result.append((start_date, end_date))
+    return result
@@ -0,0 +1,142 @@
+from collections.abc import Iterable, Iterator
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pytz
+from django.contrib.auth.models import User
+
+from events.constants import CalendarEventType
+from events.protocols import CalendarEventProtocol
+
+SECONDS_PER_DAY = 24 * 60 * 60
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+EVENT_TYPE_CODES = {event_type: code for code, event_type in enumerate(CalendarEventType.values)}
+# The vectorized check uses the UTC offset of each user's timezone at the time of evaluation, while a window is
+# localized with the offset at its own date. Widening the check by this much covers any daylight saving change
+# in between; the pairs it finds are then confirmed with the exact window.
+UTC_OFFSET_SLACK = timedelta(hours=3)
+
+
+class ScheduleArrays(NamedTuple):
+    event_type_codes: np.ndarray
+    offset_days: np.ndarray
+    seconds_of_day: np.ndarray
+    time_to_live_seconds: np.ndarray
+
+
+def get_schedule_arrays(schedules: list, time_to_live_attname: str) -> ScheduleArrays:
+    return ScheduleArrays(
+        np.array([EVENT_TYPE_CODES[s.calendar_event_type] for s in schedules], dtype=np.int64),
+        np.array([s.offset_days for s in schedules], dtype=np.int64),
+        np.array([s.time_of_day.hour * 3600 + s.time_of_day.minute * 60 + s.time_of_day.second for s in schedules],
+                 dtype=np.int64),
+        np.array([getattr(s, time_to_live_attname).total_seconds() for s in schedules], dtype=np.int64),
+    )
+
+
+def to_epoch_seconds(value: datetime) -> int:
+    return int(value.timestamp())
+
+
+def find_open_windows(event_days: np.ndarray, event_type_codes: np.ndarray, utc_offset_seconds: np.ndarray,
+                      schedules: ScheduleArrays, now: int, available_after: Optional[int] = None,
+                      slack: int = 0, available_until: Optional[int] = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Evaluates every (event, schedule) pair at once. Events are given as days since the epoch, event type codes and
+    the UTC offset of their user, all in seconds; `now`, `available_after` and `available_until` are seconds since
+    the epoch. Returns the event and schedule indexes of the pairs whose window contains `now`, or with
+    `available_until` has not expired at `now` and becomes available by then, and with `available_after`, became
+    available after it. Every bound is widened by `slack` seconds.
+    """
+    if available_until is None:
+        available_until = now
+    local_days = event_days[:, np.newaxis] + schedules.offset_days[np.newaxis, :]
+    available_at = local_days * SECONDS_PER_DAY + schedules.seconds_of_day[np.newaxis, :] \
+        - utc_offset_seconds[:, np.newaxis]
+    mask = event_type_codes[:, np.newaxis] == schedules.event_type_codes[np.newaxis, :]
+    mask &= available_at - slack <= available_until
+    mask &= now <= available_at + schedules.time_to_live_seconds[np.newaxis, :] + slack
+    if available_after is not None:
+        mask &= available_at + slack > available_after
+    return np.nonzero(mask)
+
+
+def get_user_timezone(user: User):
+    try:
+        return pytz.timezone(user.userprofile.timezone)
+    except User.userprofile.RelatedObjectDoesNotExist:
+        return pytz.UTC
+
+
+def generate_open_windows(evaluations: Iterable[tuple[User, Iterable[CalendarEventProtocol], list, Optional[datetime]]],
+                          time_to_live_attname: str, now: datetime, batch_size: int = 10000,
+                          available_until: datetime = None) -> \
+        Iterator[tuple[User, list[tuple[CalendarEventProtocol, list]], Optional[datetime]]]:
+    """
+    Takes (user, calendar events, schedules, available_after) tuples, see events.utils.run_generation, and yields
+    (user, [(calendar event, schedules), ...], available_after) for the events with a schedule whose window may
+    contain `now`, or with `available_until`, may be open at some point from `now` to `available_until`. Consecutive
+    users sharing their schedules and available_after are evaluated together, up to `batch_size` events per
+    find_open_windows().
+
+    The schedules are candidates within UTC_OFFSET_SLACK of their window: callers compute the exact window of each
+    and check it again, which is cheap as only a handful of the pairs get that far.
+    """
+    slack = int(UTC_OFFSET_SLACK.total_seconds())
+    now_seconds = to_epoch_seconds(now)
+    available_until_seconds = to_epoch_seconds(available_until) if available_until is not None else None
+    utc_offsets_by_timezone = {}
+
+    def get_utc_offset(user: User) -> int:
+        timezone = get_user_timezone(user)
+        if timezone.zone not in utc_offsets_by_timezone:
+            utc_offsets_by_timezone[timezone.zone] = int(now.astimezone(timezone).utcoffset().total_seconds())
+        return utc_offsets_by_timezone[timezone.zone]
+
+    def evaluate(batch: list[tuple[User, list]], schedules: list, schedule_arrays: ScheduleArrays,
+                 available_after: Optional[datetime]):
+        events = [(user_index, event) for user_index, (_, user_events) in enumerate(batch) for event in user_events]
+        if len(events) == 0:
+            return
+        utc_offsets = [get_utc_offset(user) for user, _ in batch]
+        event_indexes, schedule_indexes = find_open_windows(
+            np.fromiter((event.date.toordinal() - EPOCH_ORDINAL for _, event in events), np.int64, len(events)),
+            np.fromiter((EVENT_TYPE_CODES[event.event_type] for _, event in events), np.int64, len(events)),
+            np.fromiter((utc_offsets[user_index] for user_index, _ in events), np.int64, len(events)),
+            schedule_arrays,
+            now_seconds,
+            to_epoch_seconds(available_after) if available_after is not None else None,
+            slack,
+            available_until_seconds,
+        )
+        # np.nonzero() returns the pairs ordered by event, then by schedule
+        schedules_by_event_by_user = {}
+        for event_index, schedule_index in zip(event_indexes.tolist(), schedule_indexes.tolist()):
+            user_index, event = events[event_index]
+            schedules_by_event = schedules_by_event_by_user.setdefault(user_index, {})
+            schedules_by_event.setdefault(event_index, (event, []))[1].append(schedules[schedule_index])
+        for user_index, schedules_by_event in schedules_by_event_by_user.items():
+            yield batch[user_index][0], list(schedules_by_event.values()), available_after
+
+    def get_group_key(evaluation):
+        _, _, schedules, available_after = evaluation
+        return id(schedules), available_after
+
+    for _, group in groupby(evaluations, key=get_group_key):
+        batch = []
+        batch_size_so_far = 0
+        schedules = schedule_arrays = available_after = None
+        for user, calendar_events, schedules, available_after in group:
+            if schedule_arrays is None:
+                schedule_arrays = get_schedule_arrays(schedules, time_to_live_attname)
+            calendar_events = list(calendar_events)
+            batch.append((user, calendar_events))
+            batch_size_so_far += len(calendar_events)
+            if batch_size_so_far >= batch_size:
+                yield from evaluate(batch, schedules, schedule_arrays, available_after)
+                batch = []
+                batch_size_so_far = 0
+        if len(batch) > 0:
+            yield from evaluate(batch, schedules, schedule_arrays, available_after)
@@ -1 +1,9 @@
-# Register your models here.
+from django.contrib import admin
+
+from infra.models import JobWatermark
+
+
+@admin.register(JobWatermark)
+class JobWatermarkAdmin(admin.ModelAdmin):
+    list_display = ('job_name', 'evaluated_until', 'updated_at')
+    ordering = ('job_name',)
@@ -0,0 +1,37 @@
+import os
+
+import django.utils.timezone
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from hera.partitioning import PARTITIONED_TABLES, add_months, archive_partition, detach_partition, \
+    get_month_start, get_partitions
+
+
+class Command(BaseCommand):
+    help = 'Detach the monthly partitions older than the retention period and archive them to gzipped CSV files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-months', dest='retention_months', type=int, default=12,
+                            help='Keep the partitions of this many months before the current one')
+        parser.add_argument('--archive-dir', dest='archive_dir', default='.',
+                            help='Directory the <partition>.csv.gz files are written to')
+        parser.add_argument('--detach-only', dest='detach_only', action='store_true',
+                            help='Leave detached partitions in the database instead of archiving and dropping them')
+
+    def handle(self, *args, **options):
+        cutoff = add_months(get_month_start(django.utils.timezone.now()), -options['retention_months'])
+        for table in PARTITIONED_TABLES:
+            expired_partitions = [
+                partition for partition in get_partitions(connection, table)
+                if not partition.is_default and partition.end <= cutoff
+            ]
+            for partition in expired_partitions:
+                with transaction.atomic():
+                    detach_partition(connection, table, partition.name)
+                    if options['detach_only']:
+                        self.stdout.write(self.style.SUCCESS(f"Detached {partition.name}"))
+                        continue
+                    path = os.path.join(options['archive_dir'], f"{partition.name}.csv.gz")
+                    archive_partition(connection, partition.name, path)
+                self.stdout.write(self.style.SUCCESS(f"Archived {partition.name} to {path}"))
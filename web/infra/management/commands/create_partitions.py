@@ -0,0 +1,21 @@
+import django.utils.timezone
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from hera.partitioning import PARTITIONED_TABLES, add_months, create_monthly_partitions, get_month_start
+
+
+class Command(BaseCommand):
+    help = 'Create the monthly partitions of partitioned tables ahead of time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', dest='months_ahead', type=int, default=3,
+                            help='Create partitions up to this many months after the current one')
+
+    def handle(self, *args, **options):
+        now = django.utils.timezone.now()
+        until = add_months(get_month_start(now), options['months_ahead'])
+        for table, column in PARTITIONED_TABLES.items():
+            with transaction.atomic():
+                created = create_monthly_partitions(connection, table, column, now, until)
+            self.stdout.write(self.style.SUCCESS(f"Created {len(created)} partitions of {table}"))
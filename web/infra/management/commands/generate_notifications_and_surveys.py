@@ -0,0 +1,64 @@
+from datetime import timedelta
+from functools import partial
+
+from django.core.management.base import BaseCommand
+
+from events.utils import NOTIFICATION_GENERATION_JOB_NAME, make_notification_artifact, \
+    rebuild_stale_vaccination_calendar_events, run_generation
+from hera.sharding import ShardResult, add_generation_arguments, format_shard_result, run_shards
+from surveys.utils import SURVEY_GENERATION_JOB_NAME, make_survey_artifact
+
+ARTIFACT_NAMES = {
+    NOTIFICATION_GENERATION_JOB_NAME: 'notifications',
+    SURVEY_GENERATION_JOB_NAME: 'surveys',
+}
+
+
+def generate_notifications_and_surveys(shard, batch_size, incremental, notification_cadence, notification_lookahead,
+                                       survey_cadence, survey_lookahead):
+    artifacts = [
+        make_notification_artifact(notification_cadence, notification_lookahead),
+        make_survey_artifact(survey_cadence, survey_lookahead),
+    ]
+    return run_generation(artifacts, shard=shard, batch_size=batch_size, incremental=incremental)
+
+
+class Command(BaseCommand):
+    help = 'Generate notifications and surveys for all users in one pass over their calendars'
+
+    def add_arguments(self, parser):
+        add_generation_arguments(parser)
+        parser.add_argument('--notification-cadence', dest='notification_cadence', type=int, default=0,
+                            help='Minutes to wait after the previous run before generating notifications again')
+        parser.add_argument('--notification-lookahead', dest='notification_lookahead', type=int, default=0,
+                            help='Hours ahead to create notification events, which stay hidden from users and '
+                                 'are pushed once they become available')
+        parser.add_argument('--survey-cadence', dest='survey_cadence', type=int, default=3,
+                            help='Minutes to wait after the previous run before generating surveys again')
+        parser.add_argument('--survey-lookahead', dest='survey_lookahead', type=int, default=0,
+                            help='Hours ahead to create surveys, which stay hidden from users until they become '
+                                 'available')
+
+    def handle(self, *args, **options):
+        # Once before the shards start, as it rewrites the vaccination calendar of every user at once
+        rebuilt = rebuild_stale_vaccination_calendar_events()
+        if rebuilt > 0:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} calendars for the changed vaccine catalog"))
+        function = partial(
+            generate_notifications_and_surveys,
+            batch_size=options['batch_size'],
+            incremental=options['incremental'],
+            notification_cadence=timedelta(minutes=options['notification_cadence']),
+            notification_lookahead=timedelta(hours=options['notification_lookahead']),
+            survey_cadence=timedelta(minutes=options['survey_cadence']),
+            survey_lookahead=timedelta(hours=options['survey_lookahead']),
+        )
+        for result in run_shards(function, options['workers'], options['shard']):
+            self.write_result(result)
+
+    def write_result(self, result: ShardResult):
+        counts = ', '.join(
+            f"{ARTIFACT_NAMES[job_name]} {inserted} created, {skipped} already existed"
+            for job_name, (inserted, skipped) in result.counts.items()
+        )
+        self.stdout.write(self.style.SUCCESS(format_shard_result(result, counts=counts or 'nothing was due')))
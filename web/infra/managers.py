@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Optional
+
+from django.db import models
+
+
+class JobWatermarkManager(models.Manager):
+    def get_evaluated_until(self, job_name: str) -> Optional[datetime]:
+        return self.filter(job_name=job_name).values_list('evaluated_until', flat=True).first()
+
+    def get_generated_until(self, job_name: str) -> Optional[datetime]:
+        """
+        generated_until, or evaluated_until for jobs that do not look ahead.
+        """
+        row = self.filter(job_name=job_name).values_list('evaluated_until', 'generated_until').first()
+        if row is None:
+            return None
+        evaluated_until, generated_until = row
+        return generated_until or evaluated_until
+
+    def set_evaluated_until(self, job_name: str, evaluated_until: datetime, generated_until: datetime = None):
+        self.update_or_create(job_name=job_name, defaults={
+            'evaluated_until': evaluated_until,
+            'generated_until': generated_until,
+        })
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-17 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('infra', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobwatermark',
+            name='generated_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import models
+
+from infra.managers import JobWatermarkManager
+
+
+class JobWatermark(models.Model):
+    """
+    Ledger of the last instant each periodic job has successfully evaluated up to.
+    The next run of the job only has to look at what happened after it.
+    Jobs that create rows ahead of time also record generated_until, the instant up to which the rows becoming
+    available have been created, which is later than evaluated_until.
+    """
+    objects = JobWatermarkManager()
+
+    job_name = models.CharField(max_length=100, unique=True)
+    evaluated_until = models.DateTimeField()
+    generated_until = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.job_name} evaluated until {self.evaluated_until}"
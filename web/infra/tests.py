@@ -1 +1,218 @@
-# Create your tests here.
+import gzip
+import os
+import tempfile
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+from unittest.mock import patch
+
+import django.utils.timezone
+import pytz
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+
+import child_health.events
+from child_health.models import Child, Vaccine
+from events.constants import CalendarEventType
+from events.models import LanguageCode, NotificationEvent, NotificationSchedule, NotificationTemplate, NotificationType
+from hera.bulk import ConflictIgnoringBulkWriter
+from hera.partitioning import create_monthly_partitions, get_partitions
+from infra.models import JobWatermark
+from surveys.models import Survey, SurveySchedule, SurveyTemplate, SurveyType
+
+
+class PartitioningTests(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='username')
+        self.notification_type = NotificationType.objects.create(code='type', description='description')
+        self.schedule = NotificationSchedule.objects.create(
+            notification_type=self.notification_type,
+            calendar_event_type=CalendarEventType.PRENATAL_CHECKUP,
+            offset_days=0,
+            time_of_day=time(10, 0),
+        )
+        self.now = datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC)
+        timezone_now_patcher = patch.object(django.utils.timezone, 'now', return_value=self.now)
+        timezone_now_patcher.start()
+        self.addCleanup(timezone_now_patcher.stop)
+
+    def create_notification_event(self, event_key: str) -> NotificationEvent:
+        return NotificationEvent.objects.create(
+            user=self.user,
+            event_key=event_key,
+            schedule=self.schedule,
+            notification_type=self.notification_type,
+            notification_available_at=self.now,
+            notification_expires_at=self.now + timedelta(days=1),
+        )
+
+    def get_partition_of(self, notification_event: NotificationEvent) -> str:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text FROM events_notificationevent WHERE id = %s',
+                           [notification_event.id])
+            return cursor.fetchone()[0]
+
+    def test_event_key_and_schedule_stay_unique_across_partitions(self):
+        self.create_notification_event('event_key')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.create_notification_event('event_key')
+        self.create_notification_event('other_event_key')
+        self.assertEqual(2, NotificationEvent.objects.count())
+
+    def test_bulk_writer_skips_row_inserted_by_concurrent_run(self):
+        self.create_notification_event('event_key')
+        writer = ConflictIgnoringBulkWriter(NotificationEvent, unique_fields=('event_key', 'schedule_id'))
+        # As if the row had been inserted by another run after the writer looked the keys up
+        with patch.object(writer, '_get_existing_keys', return_value=set()), writer:
+            for event_key in ['event_key', 'other_event_key']:
+                writer.add(NotificationEvent(
+                    user=self.user,
+                    event_key=event_key,
+                    schedule=self.schedule,
+                    notification_type=self.notification_type,
+                    notification_available_at=self.now,
+                    notification_expires_at=self.now + timedelta(days=1),
+                ))
+        self.assertEqual((1, 1), (writer.inserted, writer.skipped))
+        self.assertEqual(['event_key', 'other_event_key'],
+                         list(NotificationEvent.objects.order_by('id').values_list('event_key', flat=True)))
+
+    def test_create_partitions_moves_rows_out_of_default_partition(self):
+        notification_event = self.create_notification_event('event_key')
+        self.assertEqual('events_notificationevent_default', self.get_partition_of(notification_event))
+        output = StringIO()
+        call_command('create_partitions', months_ahead=1, stdout=output)
+        self.assertIn('Created 2 partitions of events_notificationevent', output.getvalue())
+        self.assertEqual('events_notificationevent_p202106', self.get_partition_of(notification_event))
+
+    def test_archive_partitions_writes_rows_and_drops_partition(self):
+        create_monthly_partitions(connection, 'events_notificationevent', 'created_at', self.now, self.now)
+        notification_event = self.create_notification_event('event_key')
+        # Postgres cannot drop a table whose rows still have deferred foreign key checks pending
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        output = StringIO()
+        with tempfile.TemporaryDirectory() as archive_dir, \
+                patch.object(django.utils.timezone, 'now', return_value=self.now + timedelta(days=365)):
+            call_command('archive_partitions', retention_months=6, archive_dir=archive_dir, stdout=output)
+            with gzip.open(os.path.join(archive_dir, 'events_notificationevent_p202106.csv.gz'), 'rt') as archive:
+                lines = archive.read().splitlines()
+        self.assertIn('Archived events_notificationevent_p202106', output.getvalue())
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[1].startswith(f"{notification_event.id},"))
+        self.assertNotIn('events_notificationevent_p202106',
+                         [p.name for p in get_partitions(connection, 'events_notificationevent')])
+        self.assertFalse(NotificationEvent.objects.exists())
+
+
+class GenerateNotificationsAndSurveysTests(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='username')
+        self.set_mock_time(datetime(2021, 6, 1, 0, 0, 0, tzinfo=pytz.UTC))
+        vaccine = Vaccine.objects.create(name='vaccine', is_active=True)
+        vaccine.vaccinedose_set.create(name='first dose', week_age=0)
+        Child.objects.create(
+            user=self.user,
+            name='child',
+            date_of_birth='2021-06-06',
+            gender=Child.ChildGender.FEMALE,
+        )
+        notification_type = NotificationType.objects.create(code='vaccination.on_the_day', description='description')
+        NotificationTemplate.objects.create(
+            notification_type=notification_type,
+            language_code=LanguageCode.ENGLISH,
+            push_title='title',
+            push_body='body',
+            in_app_content='content',
+        )
+        NotificationSchedule.objects.create(
+            notification_type=notification_type,
+            calendar_event_type=CalendarEventType.VACCINATION,
+            offset_days=0,
+            time_of_day=time(10, 0),
+            push_time_to_live=timedelta(days=2),
+        )
+        survey_template = SurveyTemplate.objects.create(
+            code='vaccination.have_you_visited',
+            description='description',
+            survey_type=SurveyType.MULTIPLE_CHOICE,
+        )
+        SurveySchedule.objects.create(
+            survey_template=survey_template,
+            calendar_event_type=CalendarEventType.VACCINATION,
+            offset_days=0,
+            time_of_day=time(10, 0),
+            time_to_live=timedelta(days=2),
+        )
+
+    def set_mock_time(self, mock_time: datetime) -> None:
+        timezone_now_patcher = patch.object(django.utils.timezone, 'now', return_value=mock_time)
+        timezone_now_patcher.start()
+        self.addCleanup(timezone_now_patcher.stop)
+
+    def generate(self) -> str:
+        output = StringIO()
+        call_command('generate_notifications_and_surveys', stdout=output)
+        return output.getvalue()
+
+    def test_calendar_is_generated_once_for_both(self):
+        generate_vaccination_events_for_child = child_health.events.generate_vaccination_events_for_child
+        with patch.object(child_health.events, 'generate_vaccination_events_for_child',
+                          side_effect=generate_vaccination_events_for_child) as generator:
+            self.set_mock_time(datetime(2021, 6, 6, 10, 0, 0, tzinfo=pytz.UTC))
+            output = self.generate()
+        self.assertEqual(1, generator.call_count)
+        self.assertIn('notifications 1 created, 0 already existed, surveys 1 created', output)
+        self.assertEqual(1, NotificationEvent.objects.count())
+        self.assertEqual(1, Survey.objects.count())
+
+    def test_surveys_wait_for_their_cadence(self):
+        first_run = datetime(2021, 6, 6, 10, 0, 0, tzinfo=pytz.UTC)
+        self.set_mock_time(first_run)
+        self.generate()
+        self.set_mock_time(first_run + timedelta(minutes=1))
+        output = self.generate()
+        self.assertIn('notifications 0 created', output)
+        self.assertNotIn('surveys', output)
+        self.assertEqual(first_run, JobWatermark.objects.get_evaluated_until('generate_surveys'))
+        self.set_mock_time(first_run + timedelta(minutes=3))
+        self.assertIn('surveys 0 created', self.generate())
+        self.assertEqual(first_run + timedelta(minutes=3),
+                         JobWatermark.objects.get_evaluated_until('generate_surveys'))
+
+    def generate_ahead(self) -> str:
+        output = StringIO()
+        call_command('generate_notifications_and_surveys', survey_cadence=0, survey_lookahead=48, stdout=output)
+        return output.getvalue()
+
+    def test_deleted_child_gets_no_survey_generated_ahead(self):
+        self.set_mock_time(datetime(2021, 6, 5, 10, 0, 0, tzinfo=pytz.UTC))
+        self.generate_ahead()
+        self.assertEqual(1, Survey.objects.count())
+        Child.objects.get().delete()
+        self.set_mock_time(datetime(2021, 6, 6, 11, 0, 0, tzinfo=pytz.UTC))
+        self.generate_ahead()
+        self.assertFalse(Survey.objects.exists())
+
+    def test_edited_child_and_schedule_replace_surveys_generated_ahead(self):
+        self.set_mock_time(datetime(2021, 6, 5, 10, 0, 0, tzinfo=pytz.UTC))
+        self.generate_ahead()
+        self.set_mock_time(datetime(2021, 6, 5, 10, 30, 0, tzinfo=pytz.UTC))
+        child = Child.objects.get()
+        child.date_of_birth = date(2021, 6, 7)
+        child.save()
+        schedule = SurveySchedule.objects.get()
+        schedule.time_of_day = time(12, 0)
+        schedule.save()
+        self.assertFalse(Survey.objects.exists())
+        self.set_mock_time(datetime(2021, 6, 5, 12, 0, 0, tzinfo=pytz.UTC))
+        self.generate_ahead()
+        self.assertEqual(datetime(2021, 6, 7, 12, 0, 0, tzinfo=pytz.UTC), Survey.objects.get().available_at)
+
+    def test_surveys_are_generated_ahead_with_lookahead(self):
+        self.set_mock_time(datetime(2021, 6, 5, 10, 0, 0, tzinfo=pytz.UTC))
+        output = StringIO()
+        call_command('generate_notifications_and_surveys', survey_lookahead=24, stdout=output)
+        self.assertIn('notifications 0 created, 0 already existed, surveys 1 created', output.getvalue())
+        self.assertEqual(datetime(2021, 6, 6, 10, 0, 0, tzinfo=pytz.UTC), Survey.objects.get().available_at)
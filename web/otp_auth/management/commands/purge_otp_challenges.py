@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+import django.utils.timezone
+from django.core.management.base import BaseCommand
+
+from otp_auth.models import SmsOtpChallenge
+
+
+class Command(BaseCommand):
+    help = 'Delete the OTP challenges stored in the database that have expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-hours', dest='retention_hours', type=int, default=24,
+                            help='Keep challenges this many hours after they expired, e.g. for support requests')
+        parser.add_argument('--batch-size', dest='batch_size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        before = django.utils.timezone.now() - timedelta(hours=options['retention_hours'])
+        deleted = SmsOtpChallenge.objects.purge_expired(before, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} OTP challenges that expired before {before}"))
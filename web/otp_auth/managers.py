@@ -1,12 +1,13 @@
 from __future__ import annotations
 
-from datetime import timedelta
+from datetime import datetime, timedelta
 from typing import TYPE_CHECKING
 
 from django.db import models
 from django.utils import timezone
 
 from hera.settings import HERA_OTP_LENGTH
+from otp_auth.stores import OtpChallengeStore, get_otp_challenge_store
 from otp_auth.utils import generate_secret, sanitize_phone_number
 
 
@@ -22,8 +23,29 @@ class SmsOtpChallengeManager(models.Manager):
         else:
             secret = generate_secret(HERA_OTP_LENGTH)
         expires_at = timezone.now() + timedelta(minutes=10)
-        return self.create(
+        return self.get_store().save(self.model(
             phone_number=clean_phone_number,
             secret=secret,
             expires_at=expires_at,
-        )
+        ))
+
+    def solve_challenge(self, phone_number: str, secret: str) -> bool:
+        """
+        Marks the unexpired challenge as solved, returning whether there was one.
+        """
+        return self.get_store().solve(phone_number, secret, timezone.now())
+
+    def purge_expired(self, before: datetime, batch_size: int = 10000) -> int:
+        """
+        Deletes the challenges that expired before `before`, in batches so that no delete holds locks for long.
+        Returns the number of challenges deleted.
+        """
+        deleted = 0
+        while True:
+            ids = list(self.filter(expires_at__lt=before).values_list('id', flat=True)[:batch_size])
+            if len(ids) == 0:
+                return deleted
+            deleted += self.filter(pk__in=ids).delete()[0]
+
+    def get_store(self) -> OtpChallengeStore:
+        return get_otp_challenge_store(self)
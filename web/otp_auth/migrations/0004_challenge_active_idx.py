@@ -0,0 +1,25 @@
+# Generated by Django 4.0.4 on 2026-10-17 02:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otp_auth', '0003_alter_smsotpchallenge_options'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='smsotpchallenge',
+            name='otp_auth_sm_phone_n_572794_idx',
+        ),
+        migrations.AddIndex(
+            model_name='smsotpchallenge',
+            index=models.Index(condition=models.Q(('solved_at__isnull', True)), fields=['phone_number', 'secret'], name='otp_auth_challenge_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='smsotpchallenge',
+            index=models.Index(fields=['expires_at'], name='otp_auth_sm_expires_47146d_idx'),
+        ),
+    ]
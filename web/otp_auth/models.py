@@ -14,7 +14,14 @@ class SmsOtpChallenge(models.Model):
 
     class Meta:
         indexes = [
-            models.Index(fields=['phone_number', 'secret'])
+            # Attempts only look for unsolved challenges
+            models.Index(
+                fields=['phone_number', 'secret'],
+                name='otp_auth_challenge_active_idx',
+                condition=models.Q(solved_at__isnull=True),
+            ),
+            # See purge_otp_challenges
+            models.Index(fields=['expires_at']),
         ]
         verbose_name = 'SMS OTP Challenge'
         verbose_name_plural = 'SMS OTP Challenges'
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+from django.core.cache import BaseCache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from django.utils import timezone
+
+if TYPE_CHECKING:
+    from otp_auth.models import SmsOtpChallenge
+
+
+class OtpChallengeStore(ABC):
+    """
+    Keeps OTP challenges until they are solved or expire. A challenge is solved at most once.
+    """
+
+    @abstractmethod
+    def save(self, challenge: SmsOtpChallenge) -> SmsOtpChallenge:
+        ...
+
+    @abstractmethod
+    def solve(self, phone_number: str, secret: str, now: datetime) -> bool:
+        """
+        Marks the unexpired challenge of `phone_number` with `secret` as solved, returning whether there was one.
+        """
+
+
+class DatabaseOtpChallengeStore(OtpChallengeStore):
+    """
+    Keeps challenges as SmsOtpChallenge rows. Unsolved rows are found through a partial index, which only stays
+    small while purge_otp_challenges deletes the expired ones.
+    """
+
+    def __init__(self, challenges: models.Manager):
+        self.challenges = challenges
+
+    def save(self, challenge: SmsOtpChallenge) -> SmsOtpChallenge:
+        challenge.save()
+        return challenge
+
+    def solve(self, phone_number: str, secret: str, now: datetime) -> bool:
+        # One UPDATE, so concurrent attempts cannot both solve the same challenge
+        return self.challenges.filter(
+            phone_number=phone_number,
+            secret=secret,
+            expires_at__gt=now,
+            solved_at__isnull=True,
+        ).update(solved_at=now) > 0
+
+
+class CacheOtpChallengeStore(OtpChallengeStore):
+    """
+    Keeps challenges in a cache shared by the web processes, whose entries expire together with the challenge and
+    are deleted when solved, so no table grows with the number of logins.
+    """
+    key_prefix = 'otp_challenge'
+
+    def __init__(self, cache: BaseCache):
+        self.cache = cache
+
+    def get_key(self, phone_number: str, secret: str) -> str:
+        return f"{self.key_prefix}:{phone_number}:{secret}"
+
+    def save(self, challenge: SmsOtpChallenge) -> SmsOtpChallenge:
+        timeout = (challenge.expires_at - timezone.now()).total_seconds()
+        self.cache.set(self.get_key(challenge.phone_number, challenge.secret), challenge.expires_at, timeout)
+        return challenge
+
+    def solve(self, phone_number: str, secret: str, now: datetime) -> bool:
+        key = self.get_key(phone_number, secret)
+        expires_at = self.cache.get(key)
+        # Only one of concurrent attempts deletes the entry
+        if expires_at is None or not self.cache.delete(key):
+            return False
+        return expires_at > now
+
+
+def get_otp_challenge_store(challenges: models.Manager) -> OtpChallengeStore:
+    """
+    The store selected by settings.HERA_OTP_CHALLENGE_STORE. `challenges` is the SmsOtpChallenge manager.
+    """
+    match settings.HERA_OTP_CHALLENGE_STORE:
+        case 'database':
+            return DatabaseOtpChallengeStore(challenges)
+        case 'cache':
+            return CacheOtpChallengeStore(caches[settings.HERA_OTP_CHALLENGE_CACHE])
+    raise ImproperlyConfigured(f"Unknown HERA_OTP_CHALLENGE_STORE {settings.HERA_OTP_CHALLENGE_STORE!r}")
@@ -1,9 +1,12 @@
 import random
 from datetime import timedelta
+from io import StringIO
 from unittest.mock import patch
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIRequestFactory
@@ -54,6 +57,45 @@ class SmsOtpChallengeTestCase(TestCase):
         self.assertLessEqual(delta_to_expiry, timedelta(minutes=11))
 
 
+class OtpChallengeStoreTestCase(TestCase):
+    def test_database_store_solves_challenge_once(self):
+        challenge = SmsOtpChallenge.objects.make_challenge("+6591234567")
+        self.assertFalse(SmsOtpChallenge.objects.solve_challenge("+6591234567", "wrong"))
+        self.assertTrue(SmsOtpChallenge.objects.solve_challenge("+6591234567", challenge.secret))
+        self.assertFalse(SmsOtpChallenge.objects.solve_challenge("+6591234567", challenge.secret))
+        self.assertIsNotNone(SmsOtpChallenge.objects.get().solved_at)
+
+    @override_settings(HERA_OTP_CHALLENGE_STORE='cache')
+    def test_cache_store_solves_challenge_once_without_rows(self):
+        cache.clear()
+        challenge = SmsOtpChallenge.objects.make_challenge("+6591234567")
+        self.assertFalse(SmsOtpChallenge.objects.exists())
+        self.assertFalse(SmsOtpChallenge.objects.solve_challenge("+6598765432", challenge.secret))
+        self.assertTrue(SmsOtpChallenge.objects.solve_challenge("+6591234567", challenge.secret))
+        self.assertFalse(SmsOtpChallenge.objects.solve_challenge("+6591234567", challenge.secret))
+
+    @override_settings(HERA_OTP_CHALLENGE_STORE='cache')
+    def test_cache_store_rejects_expired_challenge(self):
+        cache.clear()
+        challenge = SmsOtpChallenge.objects.make_challenge("+6591234567")
+        with patch.object(timezone, 'now', return_value=challenge.expires_at):
+            self.assertFalse(SmsOtpChallenge.objects.solve_challenge("+6591234567", challenge.secret))
+
+    def test_purge_command_deletes_expired_challenges(self):
+        now = timezone.now()
+        active_challenge = SmsOtpChallenge.objects.create(
+            phone_number="+6591234567", secret="11111111", expires_at=now + timedelta(minutes=1))
+        recently_expired_challenge = SmsOtpChallenge.objects.create(
+            phone_number="+6591234567", secret="22222222", expires_at=now - timedelta(hours=1))
+        SmsOtpChallenge.objects.create(
+            phone_number="+6591234567", secret="33333333", expires_at=now - timedelta(days=2))
+        output = StringIO()
+        call_command('purge_otp_challenges', stdout=output)
+        self.assertIn('Deleted 1 OTP challenges', output.getvalue())
+        self.assertEqual({active_challenge.id, recently_expired_challenge.id},
+                         set(SmsOtpChallenge.objects.values_list('id', flat=True)))
+
+
 class RequestChallengeViewTestCase(TestCase):
     def setUp(self) -> None:
         message_create_patcher = patch.object(hera.thirdparties.messagebird_client, 'message_create', return_value=None)
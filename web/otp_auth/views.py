@@ -2,7 +2,6 @@ import phonenumbers
 from django.contrib.auth.models import User
 from django.db import transaction
 from django.db.models import ObjectDoesNotExist
-from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import OpenApiParameter, extend_schema
@@ -172,21 +171,9 @@ class AttemptChallengeView(APIView):
             pass
         else:
             clean_secret = secret.strip()
-            challenge_query = SmsOtpChallenge.objects.filter(
-                phone_number__exact=clean_phone_number,
-                secret__exact=clean_secret,
-                expires_at__gt=timezone.now(),
-                solved_at__isnull=True,
-            )
-            try:
-                challenge: SmsOtpChallenge = challenge_query[0]
-                print(challenge)
-            except IndexError:
-                raise AuthenticationFailed()
-
             with transaction.atomic():
-                challenge.mark_as_solved()
-                challenge.save()
+                if not SmsOtpChallenge.objects.solve_challenge(clean_phone_number, clean_secret):
+                    raise AuthenticationFailed()
                 user, is_new_user = User.objects.get_or_create(
                     username=clean_phone_number,
                     is_active=True,
@@ -0,0 +1,135 @@
+import hashlib
+import threading
+from collections.abc import Iterable
+from typing import Optional
+
+from django.db.models import Count, Max, Prefetch
+
+from surveys.models import Survey, SurveyTemplate, SurveyTemplateOption, SurveyTemplateTranslation
+from surveys.serializers import SurveyOptionSerializer
+
+
+def get_survey_catalog_version() -> str:
+    """
+    Token that changes whenever a SurveyTemplate, SurveyTemplateOption or SurveyTemplateTranslation is created,
+    edited or deleted, computed with one aggregate query.
+    """
+    fingerprint = SurveyTemplate.objects.aggregate(
+        template_count=Count('id', distinct=True),
+        max_template_id=Max('id'),
+        max_template_updated_at=Max('updated_at'),
+        option_count=Count('surveytemplateoption', distinct=True),
+        max_option_id=Max('surveytemplateoption__id'),
+        max_option_updated_at=Max('surveytemplateoption__updated_at'),
+        translation_count=Count('surveytemplatetranslation', distinct=True),
+        max_translation_id=Max('surveytemplatetranslation__id'),
+        max_translation_updated_at=Max('surveytemplatetranslation__updated_at'),
+    )
+    return hashlib.sha1(repr(sorted(fingerprint.items())).encode()).hexdigest()[:16]
+
+
+class SurveyCatalog:
+    """
+    The survey templates with their options and translations as of one catalog version, loaded with one query each,
+    and the serialized options of every (template, language) computed once. Lets a page of surveys serialize
+    without querying its templates, options, translations or the user's profile survey by survey.
+    """
+
+    def __init__(self, templates: Iterable[SurveyTemplate], version: str):
+        self.version = version
+        self._templates = {template.pk: template for template in templates}
+        self._translations = {}
+        self._options = {}
+        self._option_codes = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, version: str) -> 'SurveyCatalog':
+        return cls(SurveyTemplate.objects.prefetch_related(
+            Prefetch('surveytemplateoption_set', queryset=SurveyTemplateOption.objects.order_by('id')),
+            Prefetch('surveytemplatetranslation_set', queryset=SurveyTemplateTranslation.objects.order_by('id')),
+        ), version)
+
+    def get_translation(self, survey_template_id: int, language_code: str) -> Optional[SurveyTemplateTranslation]:
+        key = (survey_template_id, language_code,)
+        if key not in self._translations:
+            template = self._templates.get(survey_template_id)
+            translations = template.surveytemplatetranslation_set.all() if template is not None else []
+            with self._lock:
+                self._translations[key] = next(
+                    (t for t in translations if t.language_code.startswith(language_code)), None)
+        return self._translations[key]
+
+    def get_options(self, survey_template_id: int, language_code: str) -> list:
+        """
+        The serialized options of a template, see SurveyOptionSerializer. Callers must not modify them.
+        """
+        key = (survey_template_id, language_code,)
+        if key not in self._options:
+            template = self._templates.get(survey_template_id)
+            options = template.surveytemplateoption_set.all() if template is not None else []
+            data = SurveyOptionSerializer(options, many=True, context={'language_code': language_code}).data
+            with self._lock:
+                self._options[key] = data
+        return self._options[key]
+
+    def get_option_codes(self, survey_template_id: int) -> frozenset:
+        if survey_template_id not in self._option_codes:
+            template = self._templates.get(survey_template_id)
+            options = template.surveytemplateoption_set.all() if template is not None else []
+            with self._lock:
+                self._option_codes[survey_template_id] = frozenset(option.code for option in options)
+        return self._option_codes[survey_template_id]
+
+    def attach(self, surveys: Iterable[Survey], language_code: str):
+        """
+        Sets the template, language and translation of surveys that all belong to one user, so serializing them
+        does not query these one by one.
+        """
+        for survey in surveys:
+            template = self._templates.get(survey.survey_template_id)
+            if template is None:
+                continue
+            survey.survey_template = template
+            survey.language_code = language_code
+            survey.survey_template_translation = self.get_translation(survey.survey_template_id, language_code)
+
+
+_catalog: Optional[SurveyCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_survey_catalog(version: str = None) -> SurveyCatalog:
+    """
+    The per-process SurveyCatalog, loaded again when the catalog version has changed since, e.g. by an admin edit
+    in another process. Pass the version when the caller has computed it already.
+    """
+    global _catalog
+    if version is None:
+        version = get_survey_catalog_version()
+    catalog = _catalog
+    if catalog is None or catalog.version != version:
+        catalog = SurveyCatalog.load(version)
+        with _catalog_lock:
+            _catalog = catalog
+    return catalog
+
+
+def invalidate_survey_catalog():
+    global _catalog
+    with _catalog_lock:
+        _catalog = None
+
+
+def get_valid_option_codes(survey_template_id: int, response_code: str) -> frozenset:
+    """
+    The option codes of a template. A code the per-process SurveyCatalog knows is accepted without a query; any
+    other code may belong to an option added in another process since, so it is checked against a catalog of the
+    current version.
+    """
+    catalog = _catalog
+    if catalog is not None:
+        option_codes = catalog.get_option_codes(survey_template_id)
+        if response_code in option_codes:
+            return option_codes
+    return get_survey_catalog().get_option_codes(survey_template_id)
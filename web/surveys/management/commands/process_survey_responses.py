@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from surveys.responses import process_survey_responses
+
+
+class Command(BaseCommand):
+    help = 'Run the side effects of survey responses, such as ticking the vaccinations users say they had'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', dest='batch_size', type=int, default=500,
+                            help='Number of survey responses claimed and processed in one transaction')
+        parser.add_argument('--forever', dest='forever', action='store_true',
+                            help='Keep polling for survey responses instead of exiting once none are left')
+        parser.add_argument('--poll-interval', dest='poll_interval', type=float, default=5.0,
+                            help='Seconds to wait between polls with --forever')
+        parser.set_defaults(forever=False)
+
+    def handle(self, *args, **options):
+        while True:
+            started_at = time.monotonic()
+            processed = process_survey_responses(batch_size=options['batch_size'])
+            if processed > 0 or not options['forever']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Processed {processed} survey responses in {time.monotonic() - started_at:.2f}s"
+                ))
+            if not options['forever']:
+                return
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-17 02:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0009_alter_surveytemplate_code_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='survey',
+            index=models.Index(fields=['user', '-id'], name='surveys_sur_user_id_2816b3_idx'),
+        ),
+    ]
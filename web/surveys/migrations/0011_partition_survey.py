@@ -0,0 +1,19 @@
+from django.db import migrations
+
+from hera.partitioning import partition_table_by_month
+
+
+def partition_surveys(apps, schema_editor):
+    partition_table_by_month(schema_editor, 'surveys_survey', 'created_at', [('event_key', 'schedule_id')])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0010_survey_surveys_sur_user_id_2816b3_idx'),
+    ]
+
+    operations = [
+        # The partitioned table serves the previous schema as well, so there is nothing to undo
+        migrations.RunPython(partition_surveys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-17 02:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0012_surveytemplate_updated_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='survey',
+            index=models.Index(condition=models.Q(('response__isnull', True)), fields=['user', 'available_at'], name='surveys_survey_pending_idx'),
+        ),
+    ]
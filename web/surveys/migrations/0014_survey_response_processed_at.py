@@ -0,0 +1,33 @@
+# Generated by Django 4.0.4 on 2026-10-17 02:42
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Coalesce
+
+
+def mark_existing_responses_processed(apps, schema_editor):
+    # Their side effects ran inline when they were answered
+    Survey = apps.get_model('surveys', 'Survey')
+    Survey.objects.filter(response__isnull=False).update(
+        response_processed_at=Coalesce(F('responded_at'), F('updated_at')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0013_survey_pending_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='survey',
+            name='response_processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_existing_responses_processed, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='survey',
+            index=models.Index(condition=models.Q(('response__isnull', False), ('response_processed_at__isnull', True)), fields=['id'], name='surveys_survey_unprocessed_idx'),
+        ),
+    ]
@@ -1,5 +1,5 @@
 from datetime import date, datetime, timedelta
-from functools import lru_cache
+from functools import cached_property
 
 from django.conf import settings
 from django.contrib.auth.models import User
@@ -8,9 +8,9 @@ from django.core.validators import MinLengthValidator, MinValueValidator, RegexV
 from django.db import models
 from django.db.models.deletion import CASCADE
 from django.utils.translation import gettext_lazy as _
-from liquid import Template
 
 from events.constants import CalendarEventType
+from hera.liquid import get_compiled_template
 
 
 class LanguageCode(models.TextChoices):
@@ -54,6 +54,7 @@ class SurveyTemplate(models.Model):
         help_text="When is this survey sent? What is the purpose of this survey? Note for translators & devs?",
     )
     survey_type = models.CharField(choices=SurveyType.choices, max_length=255)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.code}"
@@ -109,6 +110,7 @@ class SurveyTemplateOption(models.Model):
         blank=True,
         null=True,
     )
+    updated_at = models.DateTimeField(auto_now=True)
 
 
 class SurveyTemplateTranslation(models.Model):
@@ -121,6 +123,7 @@ class SurveyTemplateTranslation(models.Model):
         max_length=255,
         help_text="Question to be shown in the survey pop-up in app",
     )
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = [
@@ -132,7 +135,7 @@ class SurveyTemplateTranslation(models.Model):
 
     @property
     def question_template(self):
-        return Template(self.question)
+        return get_compiled_template(self, 'question')
 
     def rendered_question(self, context: dict):
         return self.question_template.render(context)
@@ -194,35 +197,49 @@ class Survey(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     responded_at = models.DateTimeField(blank=True, null=True)
+    # Responses without response_processed_at have side effects pending, see surveys.responses
+    response_processed_at = models.DateTimeField(blank=True, null=True)
 
     class Meta:
+        # The table is partitioned by month of created_at (see hera.partitioning), so this is enforced by a trigger
         unique_together = [
             ['event_key', 'schedule'],
         ]
         index_together = [
             ['user', 'response'],
         ]
+        indexes = [
+            models.Index(fields=['user', '-id']),
+            models.Index(
+                fields=['user', 'available_at'],
+                name='surveys_survey_pending_idx',
+                condition=models.Q(response__isnull=True),
+            ),
+            models.Index(
+                fields=['id'],
+                name='surveys_survey_unprocessed_idx',
+                condition=models.Q(response__isnull=False, response_processed_at__isnull=True),
+            ),
+        ]
 
     @property
     def survey_type(self):
         return self.survey_template.survey_type
 
-    @property
-    @lru_cache(maxsize=1)
+    @cached_property
     def language_code(self):
         try:
             return self.user.userprofile.language_code
         except User.userprofile.RelatedObjectDoesNotExist:
             return settings.LANGUAGE_CODE
 
-    @property
-    @lru_cache(maxsize=1)
+    @cached_property
     def survey_template_translation(self) -> SurveyTemplateTranslation:
+        # SurveyCatalog.attach() sets this for many surveys at once
         return self.survey_template.surveytemplatetranslation_set.filter(
             language_code__startswith=self.language_code).first()
 
-    @property
-    @lru_cache(maxsize=1)
+    @cached_property
     def question(self):
         if self.survey_template_translation is not None:
             return self.survey_template_translation.rendered_question(self.context)
@@ -0,0 +1,100 @@
+from collections import defaultdict
+from collections.abc import Callable
+from itertools import groupby
+
+import django.utils.timezone
+from django.db import transaction
+from django.db.models import QuerySet
+
+from child_health.models import Child, PastVaccination, VaccineDose
+from events.utils import rebuild_calendar_events_for_user_id
+from surveys.models import Survey
+
+# Handlers by SurveyTemplate code. A handler is called with a batch of responded surveys of its template, inside
+# the transaction that marks them processed, and must be idempotent: a survey answered again is processed again.
+survey_response_handlers: dict[str, Callable[[list[Survey]], None]] = {}
+
+
+def survey_response_handler(survey_template_code: str):
+    def register(handler: Callable[[list[Survey]], None]):
+        survey_response_handlers[survey_template_code] = handler
+        return handler
+    return register
+
+
+def get_unprocessed_survey_responses() -> QuerySet:
+    """
+    Responded surveys whose side effects have not run yet, served by the partial index surveys_survey_unprocessed_idx.
+    """
+    return Survey.objects.filter(response__isnull=False, response_processed_at__isnull=True)
+
+
+def process_survey_responses(batch_size: int = 500) -> int:
+    """
+    Runs the handlers of unprocessed survey responses, off the request path that recorded them. Each batch is
+    claimed, handled and marked processed in one transaction, so concurrent runs skip each other's batches and a
+    failing batch is retried by the next run. Returns the number of responses processed.
+    """
+    processed = 0
+    while True:
+        with transaction.atomic():
+            surveys = list(
+                get_unprocessed_survey_responses()
+                .select_for_update(skip_locked=True, of=('self',))
+                .select_related('survey_template')
+                .order_by('id')[:batch_size]
+            )
+            if len(surveys) == 0:
+                return processed
+            surveys.sort(key=lambda s: s.survey_template.code)
+            for survey_template_code, template_surveys in groupby(surveys, key=lambda s: s.survey_template.code):
+                handler = survey_response_handlers.get(survey_template_code)
+                if handler is not None:
+                    handler(list(template_surveys))
+            # update() rather than save(), so neither signals nor auto_now fields fire for the bookkeeping
+            Survey.objects.filter(pk__in=[s.pk for s in surveys]) \
+                .update(response_processed_at=django.utils.timezone.now())
+        processed += len(surveys)
+        if len(surveys) < batch_size:
+            return processed
+
+
+def parse_id_list(value: str) -> list[int]:
+    return [int(id_string) for id_string in value.split(', ')] if len(value) > 0 else []
+
+
+@survey_response_handler('vaccination.have_you_visited')
+def process_vaccination_have_you_visited_survey_responses(surveys: list[Survey]):
+    """
+    Create a PastVaccination object when user says yes to vaccination survey.
+    Effectively, this "ticks the vaccination checkbox" on behalf of the user on survey response.
+    Note that if user says "no", we will do no action (neither tick nor untick).
+    The doses and children of the whole batch are looked up with one query each.
+    """
+    dose_ids_by_child_id = defaultdict(set)
+    for survey in surveys:
+        if survey.response != 'yes':
+            continue
+        child_id_string = survey.context.get('child_id', '')
+        if len(child_id_string) == 0:
+            continue
+        dose_ids_by_child_id[int(child_id_string)].update(parse_id_list(survey.context.get('dose_ids', '')))
+    if len(dose_ids_by_child_id) == 0:
+        return
+    vaccine_ids_by_dose_id = dict(VaccineDose.objects.filter(
+        pk__in={dose_id for dose_ids in dose_ids_by_child_id.values() for dose_id in dose_ids},
+    ).values_list('id', 'vaccine_id'))
+    # Children deleted since the survey was answered have nothing left to tick
+    user_ids_by_child_id = dict(Child.objects.filter(pk__in=dose_ids_by_child_id).values_list('id', 'user_id'))
+    past_vaccinations = {
+        (child_id, vaccine_ids_by_dose_id[dose_id])
+        for child_id, dose_ids in dose_ids_by_child_id.items() if child_id in user_ids_by_child_id
+        for dose_id in dose_ids if dose_id in vaccine_ids_by_dose_id
+    }
+    PastVaccination.objects.bulk_create(
+        [PastVaccination(child_id=child_id, vaccine_id=vaccine_id) for child_id, vaccine_id in past_vaccinations],
+        ignore_conflicts=True,
+    )
+    # bulk_create() sends no post_save, which is what rebuilds calendars when a PastVaccination is saved
+    for user_id in {user_ids_by_child_id[child_id] for child_id, _ in past_vaccinations}:
+        transaction.on_commit(lambda user_id=user_id: rebuild_calendar_events_for_user_id(user_id))
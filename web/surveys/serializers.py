@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.http import request
-from rest_framework.fields import CharField, ListField, SerializerMethodField
+from drf_spectacular.utils import extend_schema_field
+from rest_framework.fields import CharField, SerializerMethodField
 from rest_framework.serializers import ModelSerializer, Serializer
 
 from surveys.models import Survey, SurveyTemplateOption
@@ -25,10 +26,7 @@ class SurveyOptionSerializer(ModelSerializer):
 
 
 class SurveySerializer(ModelSerializer):
-    options = ListField(
-        child=SurveyOptionSerializer(),
-        source='survey_template.surveytemplateoption_set.all',
-    )
+    options = SerializerMethodField()
 
     class Meta:
         model = Survey
@@ -41,6 +39,16 @@ class SurveySerializer(ModelSerializer):
             'options',
         ]
 
+    @extend_schema_field(SurveyOptionSerializer(many=True))
+    def get_options(self, obj):
+        # Views serializing many surveys pass a surveys.catalog.SurveyCatalog, which serializes each template's
+        # options once per language
+        catalog = self.context.get('survey_catalog')
+        if catalog is not None:
+            return catalog.get_options(obj.survey_template_id, self.context['language_code'])
+        options = obj.survey_template.surveytemplateoption_set.all()
+        return SurveyOptionSerializer(options, many=True, context=self.context).data
+
 
 class SurveyResponseSerializer(Serializer):
     response = CharField(max_length=20)
@@ -0,0 +1,59 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from child_health.events import get_subject_event_key_prefix
+from child_health.models import Child, Pregnancy
+from events.utils import get_pending_notification_events, mark_calendar_subjects_changed
+from hera.liquid import compiled_templates
+from surveys.catalog import invalidate_survey_catalog
+from surveys.models import SurveySchedule, SurveyTemplate, SurveyTemplateOption, SurveyTemplateTranslation
+from surveys.utils import get_pending_surveys
+from user_profile.models import UserProfile
+
+
+@receiver(post_save, sender=SurveyTemplateTranslation)
+@receiver(post_delete, sender=SurveyTemplateTranslation)
+def invalidate_compiled_survey_template(sender, instance: SurveyTemplateTranslation, **kwargs):
+    compiled_templates.invalidate(instance)
+
+
+@receiver(post_save, sender=SurveyTemplate)
+@receiver(post_delete, sender=SurveyTemplate)
+@receiver(post_save, sender=SurveyTemplateOption)
+@receiver(post_delete, sender=SurveyTemplateOption)
+@receiver(post_save, sender=SurveyTemplateTranslation)
+@receiver(post_delete, sender=SurveyTemplateTranslation)
+def invalidate_survey_catalog_on_change(sender, **kwargs):
+    # Other processes notice the change through get_survey_catalog_version()
+    invalidate_survey_catalog()
+
+
+# Surveys created ahead of time from the former data are withdrawn along with the change, like notification events,
+# see events.signals.
+@receiver(post_save, sender=Pregnancy)
+@receiver(post_delete, sender=Pregnancy)
+@receiver(post_save, sender=Child)
+@receiver(post_delete, sender=Child)
+def withdraw_pending_surveys_on_subject_change(sender, instance, created=False, **kwargs):
+    if not created:
+        get_pending_surveys().filter(
+            user_id=instance.user_id,
+            event_key__startswith=get_subject_event_key_prefix(instance),
+        ).delete()
+
+
+@receiver(post_save, sender=SurveySchedule)
+@receiver(pre_delete, sender=SurveySchedule)
+def withdraw_pending_surveys_on_schedule_change(sender, instance: SurveySchedule, created=False, **kwargs):
+    if not created:
+        get_pending_surveys().filter(schedule=instance).delete()
+
+
+# Notification events too, so that the former timezone is looked up once per profile save
+@receiver(pre_save, sender=UserProfile)
+def withdraw_pending_surveys_and_notification_events_on_timezone_change(sender, instance: UserProfile, **kwargs):
+    previous_timezone = UserProfile.objects.filter(pk=instance.pk).values_list('timezone', flat=True).first()
+    if previous_timezone is not None and previous_timezone != instance.timezone:
+        get_pending_surveys().filter(user_id=instance.user_id).delete()
+        get_pending_notification_events().filter(user_id=instance.user_id).delete()
+        mark_calendar_subjects_changed(instance.user_id)
@@ -1,3 +1,129 @@
+from datetime import date, datetime, timedelta
+from io import StringIO
+from unittest.mock import patch
+
+import django.utils.timezone
+import pytz
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from child_health.models import Child, PastVaccination, Vaccine
+from surveys.catalog import invalidate_survey_catalog
+from surveys.models import LanguageCode, Survey, SurveyTemplate, SurveyType
+from user_profile.models import UserProfile
+
+
+class SurveyViewTests(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='username')
+        UserProfile.objects.create(
+            user=self.user,
+            name='name',
+            gender=UserProfile.Gender.MALE,
+            date_of_birth=date(1990, 1, 1),
+            agree_to_terms_at=datetime(2020, 1, 1, tzinfo=pytz.UTC),
+            language_code=UserProfile.LanguageCode.EN,
+            timezone='UTC',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.survey_template = SurveyTemplate.objects.create(
+            code='vaccination.have_you_visited',
+            description='description',
+            survey_type=SurveyType.MULTIPLE_CHOICE,
+        )
+        self.survey_template.surveytemplateoption_set.create(code='yes', option_en='Yes')
+        self.survey_template.surveytemplatetranslation_set.create(
+            language_code=LanguageCode.ENGLISH,
+            question='Did you visit {{ person_name }}?',
+        )
+        self.now = datetime(2021, 6, 7, 10, 0, 0, tzinfo=pytz.UTC)
+        invalidate_survey_catalog()
+
+    def set_mock_time(self, mock_time: datetime) -> None:
+        timezone_now_patcher = patch.object(django.utils.timezone, 'now', return_value=mock_time)
+        timezone_now_patcher.start()
+        self.addCleanup(timezone_now_patcher.stop)
+
+    def create_survey(self, available_at: datetime, **kwargs) -> Survey:
+        return Survey.objects.create(
+            user=self.user,
+            survey_template=self.survey_template,
+            available_at=available_at,
+            expires_at=available_at + timedelta(days=1),
+            **kwargs,
+        )
+
+    def get_pending_ids(self, **kwargs) -> list:
+        return [s['id'] for s in self.client.get('/surveys/pending/', **kwargs).data]
+
+    def test_pending_only_returns_open_unanswered_surveys(self):
+        open_survey = self.create_survey(self.now - timedelta(hours=1))
+        self.create_survey(self.now - timedelta(hours=1), response='yes')
+        self.create_survey(self.now - timedelta(days=2))
+        self.create_survey(self.now + timedelta(hours=1))
+        self.set_mock_time(self.now)
+        self.assertEqual([open_survey.id], self.get_pending_ids())
+
+    def test_surveys_generated_ahead_are_hidden_until_available(self):
+        later_survey = self.create_survey(self.now + timedelta(hours=1))
+        self.set_mock_time(self.now)
+        response = self.client.get('/surveys/pending/')
+        self.assertEqual([], response.data)
+        self.assertEqual([], self.client.get('/surveys/').data)
+        self.assertEqual(404, self.client.post(f"/surveys/{later_survey.id}/response/", {'response': 'yes'}).status_code)
+        self.set_mock_time(self.now + timedelta(hours=1))
+        self.assertEqual([later_survey.id], self.get_pending_ids(HTTP_IF_NONE_MATCH=response['ETag']))
+
+    def test_pending_serializes_many_surveys_with_constant_queries(self):
+        for i in range(50):
+            self.create_survey(self.now - timedelta(hours=1), context={'person_name': f"child {i}"})
+        self.set_mock_time(self.now)
+        self.client.get('/surveys/pending/')
+        # catalog version, version, surveys
+        with self.assertNumQueries(3):
+            response = self.client.get('/surveys/pending/')
+        self.assertEqual(50, len(response.data))
+        self.assertEqual('Did you visit child 1?', response.data[1]['question'])
+        self.assertEqual([{'code': 'yes', 'translated_text': 'Yes'}], response.data[1]['options'])
+
+    def test_edited_option_is_served_after_save(self):
+        self.create_survey(self.now - timedelta(hours=1))
+        self.set_mock_time(self.now)
+        self.client.get('/surveys/pending/')
+        option = self.survey_template.surveytemplateoption_set.get()
+        option.option_en = 'Yes, I did'
+        option.save()
+        response = self.client.get('/surveys/pending/')
+        self.assertEqual('Yes, I did', response.data[0]['options'][0]['translated_text'])
 
-# Create your tests here.
+    def test_response_side_effects_run_in_a_batch_after_the_request(self):
+        vaccines = [Vaccine.objects.create(name=f"vaccine {i}", is_active=True) for i in range(2)]
+        dose_ids = ', '.join(str(vaccine.vaccinedose_set.create(name='dose', week_age=0).id) for vaccine in vaccines)
+        children = [
+            Child.objects.create(user=self.user, name=f"child {i}", date_of_birth='2021-06-06',
+                                 gender=Child.ChildGender.FEMALE)
+            for i in range(3)
+        ]
+        surveys = [
+            self.create_survey(self.now - timedelta(hours=1), context={'child_id': str(child.id), 'dose_ids': dose_ids})
+            for child in children
+        ]
+        PastVaccination.objects.create(child=children[0], vaccine=vaccines[0])
+        self.set_mock_time(self.now)
+        self.assertEqual(400, self.client.post(f"/surveys/{surveys[0].id}/response/", {'response': 'maybe'}).status_code)
+        for survey in surveys[:2]:
+            self.assertEqual(200, self.client.post(f"/surveys/{survey.id}/response/", {'response': 'yes'}).status_code)
+        self.assertEqual(1, PastVaccination.objects.count())
+        output = StringIO()
+        # savepoint, claim, doses, children, insert, mark processed, release
+        with self.assertNumQueries(7):
+            call_command('process_survey_responses', stdout=output)
+        self.assertIn('Processed 2 survey responses', output.getvalue())
+        self.assertEqual(
+            {(child.id, vaccine.id) for child in children[:2] for vaccine in vaccines},
+            set(PastVaccination.objects.values_list('child_id', 'vaccine_id')),
+        )
+        self.assertFalse(Survey.objects.filter(response__isnull=False, response_processed_at__isnull=True).exists())
@@ -1,34 +1,46 @@
 import heapq
-from collections.abc import Iterator
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timedelta
 
 import django.utils.timezone
 import pytz
 from django.contrib.auth.models import User
-from django.db import IntegrityError
+from django.db.models import QuerySet
 
-from child_health.models import PastVaccination, VaccineDose
 from events.protocols import CalendarEventProtocol
-from events.utils import generate_all_calendar_events_for_user
+from events.utils import GenerationArtifact, generate_all_calendar_events_for_user, run_generation
+from hera.bulk import ConflictIgnoringBulkWriter
+from hera.sharding import Shard, filter_shard
 from hera.utils import get_sanitized_hstore_dict
 from surveys.models import Survey, SurveySchedule
 
+SURVEY_GENERATION_JOB_NAME = 'generate_surveys'
+
 
 def generate_surveys_for_calendar_event(user: User, schedules: [SurveySchedule],
-                                        event: CalendarEventProtocol, force_create_surveys=False) -> \
+                                        event: CalendarEventProtocol, force_create_surveys=False,
+                                        now: datetime = None, available_after: datetime = None,
+                                        available_until: datetime = None) -> \
         Iterator[Survey]:
     try:
         timezone_name = user.userprofile.timezone
         timezone = pytz.timezone(timezone_name)
     except User.userprofile.RelatedObjectDoesNotExist:
         timezone = pytz.UTC
-    now = django.utils.timezone.now()
+    if now is None:
+        now = django.utils.timezone.now()
+    if available_until is None:
+        available_until = now
+    event_dict = None
     for schedule in schedules:
-        event_dict = event.to_dictionary()
-        if schedule.calendar_event_type != event_dict['event_type']:
+        if schedule.calendar_event_type != event.event_type:
+            continue
+        survey_available_at, survey_expires_at = schedule.get_survey_window(event.date, timezone)
+        if available_after is not None and survey_available_at <= available_after:
             continue
-        calendar_event_date = event_dict['date']
-        survey_available_at, survey_expires_at = schedule.get_survey_window(calendar_event_date, timezone)
-        if force_create_surveys or survey_available_at <= now <= survey_expires_at:
+        if force_create_surveys or survey_available_at <= available_until and now <= survey_expires_at:
+            if event_dict is None:
+                event_dict = event.to_dictionary()
             yield Survey(
                 user=user,
                 event_key=event.get_event_key(),
@@ -42,45 +54,80 @@ def generate_surveys_for_calendar_event(user: User, schedules: [SurveySchedule],
             )
 
 
-def generate_surveys_for_user(user: User, schedules: [SurveySchedule], force_create_surveys=False) -> Iterator[Survey]:
+def generate_surveys_for_calendar_events(user: User, schedules: [SurveySchedule],
+                                         calendar_events: Iterable[CalendarEventProtocol],
+                                         force_create_surveys=False, now: datetime = None,
+                                         available_after: datetime = None) -> Iterator[Survey]:
     def get_survey_sort_key(survey: Survey):
         return (survey.available_at, survey.expires_at,)
 
-    calendar_events = generate_all_calendar_events_for_user(user)
     survey_generators = \
-        [generate_surveys_for_calendar_event(user, schedules, e, force_create_surveys=force_create_surveys) for e in
-         calendar_events]
+        [generate_surveys_for_calendar_event(user, schedules, e, force_create_surveys=force_create_surveys, now=now,
+                                             available_after=available_after) for e in calendar_events]
     for survey in heapq.merge(*survey_generators, key=get_survey_sort_key):
         yield survey
 
 
-def process_survey_after_response_created(survey: Survey):
-    if survey.response is None:
-        return
-    if survey.survey_template.code == 'vaccination.have_you_visited':
-        process_vaccination_have_you_visited_survey_response(survey)
+def generate_surveys_for_user(user: User, schedules: [SurveySchedule], force_create_surveys=False) -> Iterator[Survey]:
+    calendar_events = generate_all_calendar_events_for_user(user)
+    return generate_surveys_for_calendar_events(user, schedules, calendar_events,
+                                                force_create_surveys=force_create_surveys)
+
+
+def get_pending_surveys() -> QuerySet:
+    """
+    Surveys generated ahead of time that are neither available nor answered yet. When their calendar event, schedule
+    or the user's timezone changes, they are withdrawn by surveys.signals and the next generation run creates them
+    again from the current data.
+    """
+    return Survey.objects.filter(
+        schedule__isnull=False,
+        response__isnull=True,
+        available_at__gt=django.utils.timezone.now(),
+    )
+
+
+def make_survey_artifact(cadence: timedelta = timedelta(0), lookahead: timedelta = timedelta(0)) -> GenerationArtifact:
+    """
+    Surveys created ahead of time stay hidden from the user until they become available.
+    """
+    return GenerationArtifact(
+        SURVEY_GENERATION_JOB_NAME,
+        list(SurveySchedule.objects.order_by('calendar_event_type', 'offset_days', 'time_of_day')),
+        'time_to_live',
+        generate_surveys_for_calendar_event,
+        make_survey_writer,
+        cadence,
+        lookahead,
+        get_pending_surveys,
+    )
+
+
+def generate_surveys_for_all_users(shard: Shard = None, force_create_surveys=False, batch_size=500,
+                                   incremental=True) -> ConflictIgnoringBulkWriter:
+    """
+    Creates the due surveys, starting from where the previous successful run of the same shard left off.
+    See events.utils.generate_notification_events_for_all_users.
+    """
+    if force_create_surveys:
+        schedules = SurveySchedule.objects.order_by('calendar_event_type', 'offset_days', 'time_of_day').all()
+        with make_survey_writer(batch_size=batch_size) as writer:
+            users = filter_shard(User.objects.filter(is_active=True), 'id', shard).order_by('id')
+            for user in users:
+                writer.add_all(generate_surveys_for_user(user, schedules, force_create_surveys=True))
+        return writer
+
+    writer_group = run_generation([make_survey_artifact()], shard=shard, batch_size=batch_size,
+                                  incremental=incremental)
+    return writer_group.writers[SURVEY_GENERATION_JOB_NAME]
 
 
-def process_vaccination_have_you_visited_survey_response(survey: Survey):
+def make_survey_writer(batch_size=500) -> ConflictIgnoringBulkWriter:
     """
-    Create a PastVaccination object when user says yes to vaccination survey.
-    Effectively, this "ticks the vaccination checkbox" on behalf of the user on survey response.
-    Note that if user says "no", we will do no action (neither tick nor untick).
+    Bulk writer for generated Surveys, deduplicated on (event_key, schedule).
     """
-    if survey.response != 'yes':
-        return
-    child_id_string = survey.context.get('child_id', '')
-    if len(child_id_string) == 0:
-        return
-    child_id = int(child_id_string)
-    dose_ids_string = survey.context.get('dose_ids', '')
-    if len(dose_ids_string) == 0:
-        return
-    dose_ids = [int(dose_id) for dose_id in survey.context['dose_ids'].split(', ')]
-    for dose_id in dose_ids:
-        dose = VaccineDose.objects.get(pk=dose_id)
-        vaccine_id = dose.vaccine_id
-        try:
-            PastVaccination.objects.create(child_id=child_id, vaccine_id=vaccine_id)
-        except IntegrityError:
-            pass
+    return ConflictIgnoringBulkWriter(
+        Survey,
+        unique_fields=('event_key', 'schedule_id'),
+        batch_size=batch_size,
+    )
@@ -1,3 +1,4 @@
+from django.db.models import Count, Max, Min, Q
 from django.utils import timezone
 from drf_spectacular.utils import extend_schema
 from rest_framework import response
@@ -8,12 +9,13 @@ from rest_framework.views import APIView
 from rest_framework import status
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
+from hera.conditional import ConditionalGetMixin
+from hera.pagination import UserKeysetPagination
+from surveys.catalog import get_survey_catalog, get_survey_catalog_version, get_valid_option_codes
 from surveys.models import Survey, SurveyTemplate
 from surveys.serializers import SurveyResponseSerializer, SurveySerializer
 from rest_framework.permissions import IsAuthenticated
 
-from surveys.utils import process_survey_after_response_created
-
 
 class SurveyResponseView(APIView):
     permission_classes = [IsAuthenticated]
@@ -29,51 +31,103 @@ class SurveyResponseView(APIView):
         return Response("Survey not found", status=status.HTTP_400_BAD_REQUEST)
 
 
-class SurveyViewSet(ReadOnlyModelViewSet):
+def get_available_surveys(user):
+    """
+    The user's surveys that have become available; surveys generated ahead of time stay hidden until then.
+    """
+    return Survey.objects.filter(user=user, available_at__lte=timezone.now())
+
+
+def get_survey_version_parts(user, catalog_version: str) -> list:
+    now = timezone.now()
+    version = Survey.objects.filter(user=user).aggregate(
+        count=Count('id'),
+        max_id=Max('id'),
+        max_updated_at=Max('updated_at'),
+        # Change when the next survey becomes available or expires
+        next_available_at=Min('available_at', filter=Q(available_at__gt=now)),
+        next_expires_at=Min('expires_at', filter=Q(expires_at__gt=now)),
+    )
+    return [*version.values(), catalog_version]
+
+
+def get_survey_list_serializer(request, surveys, catalog_version: str = None) -> SurveySerializer:
+    """
+    Serializes many of the user's surveys from the per-process SurveyCatalog, which costs no query per survey.
+    """
+    language_code = request.user.userprofile.language_code
+    catalog = get_survey_catalog(catalog_version)
+    surveys = list(surveys)
+    catalog.attach(surveys, language_code)
+    return SurveySerializer(surveys, many=True, context={'language_code': language_code, 'survey_catalog': catalog})
+
+
+class SurveyViewSet(ConditionalGetMixin, ReadOnlyModelViewSet):
     queryset = Survey.objects.all()
     serializer_class = SurveySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = UserKeysetPagination
 
     def get_queryset(self):
-        return self.queryset.filter(user=self.request.user)
+        return get_available_surveys(self.request.user)
 
     def get_serializer_context(self):
         return {'language_code': self.request.user.userprofile.language_code}
 
-    @extend_schema(responses=SurveySerializer(many=True))
-    @action(detail=False, methods=['get'])
-    def pending(self, request):
-        queryset = self.get_queryset().filter(response__isnull=True).order_by('id')
+    def get_version_parts(self, request):
+        self.survey_catalog_version = get_survey_catalog_version()
+        return get_survey_version_parts(request.user, self.survey_catalog_version)
+
+    def get_survey_list_response(self, queryset) -> Response:
         page = self.paginate_queryset(queryset)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
+            serializer = get_survey_list_serializer(self.request, page, self.survey_catalog_version)
             return self.get_paginated_response(serializer.data)
 
-        serializer = self.get_serializer(queryset, many=True)
+        serializer = get_survey_list_serializer(self.request, queryset, self.survey_catalog_version)
         return Response(serializer.data)
 
+    def list(self, request, *args, **kwargs):
+        return self.get_survey_list_response(self.filter_queryset(self.get_queryset()))
+
+    @extend_schema(responses=SurveySerializer(many=True))
+    @action(detail=False, methods=['get'])
+    def pending(self, request):
+        # Served by the partial index of unanswered surveys
+        queryset = self.get_queryset().filter(response__isnull=True, expires_at__gt=timezone.now()).order_by('id')
+        return self.get_survey_list_response(queryset)
+
     @action(detail=True, methods=['post'], serializer_class=SurveyResponseSerializer)
     def response(self, request, pk=None):
         survey: Survey = self.get_object()
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         response_code = serializer.validated_data["response"]
-        valid_options = survey.survey_template.surveytemplateoption_set.all()
-        valid_option_codes = [option.code for option in valid_options]
+        valid_option_codes = get_valid_option_codes(survey.survey_template_id, response_code)
         if response_code in valid_option_codes:
             survey.response = response_code
             survey.responded_at = timezone.now()
-            survey.save()
-            process_survey_after_response_created(survey)
+            # Its side effects run later, see surveys.responses
+            survey.response_processed_at = None
+            survey.save(update_fields=['response', 'responded_at', 'response_processed_at', 'updated_at'])
             return Response(status=200)
         else:
-            raise ValidationError(f"Invalid response. Must be one of the following: {valid_option_codes}")
+            raise ValidationError(f"Invalid response. Must be one of the following: {sorted(valid_option_codes)}")
 
 
-class SurveyView(APIView):
+class SurveyView(ConditionalGetMixin, APIView):
     permission_classes = [IsAuthenticated]
 
+    def get_version_parts(self, request):
+        self.survey_catalog_version = get_survey_catalog_version()
+        return get_survey_version_parts(request.user, self.survey_catalog_version)
+
     def get(self, request):
-        queryset = Survey.objects.filter(user=self.request.user)
-        serializer = SurveySerializer(queryset, many=True, context={'language_code': self.request.user.userprofile.language_code})
+        queryset = get_available_surveys(self.request.user)
+        paginator = UserKeysetPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        if page is not None:
+            serializer = get_survey_list_serializer(request, page, self.survey_catalog_version)
+            return paginator.get_paginated_response(serializer.data)
+        serializer = get_survey_list_serializer(request, queryset, self.survey_catalog_version)
         return Response(serializer.data, status=status.HTTP_200_OK)